@@ -3,6 +3,8 @@ from . import models
 from login_app.models import Hotel
 # Register your models here.
 admin.site.register(models.Hotel)
-admin.site.register(models.Room)
-admin.site.register(models.Favourite)
-admin.site.register(models.Review)
\ No newline at end of file
+# list_select_related: the change lists print __str__, which follows these relations
+admin.site.register(models.Room, list_select_related=('hotel',))
+admin.site.register(models.Favourite, list_select_related=('user', 'room'))
+admin.site.register(models.Review, list_select_related=('user', 'room'))
+admin.site.register(models.ScheduledRateChange, list_filter=('status',))
\ No newline at end of file
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class HoHoHotelAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ho_ho_hotel_app'
+
+    def ready(self):
+        # Registers the model signal handlers (search index etc.)
+        from . import signals  # noqa: F401
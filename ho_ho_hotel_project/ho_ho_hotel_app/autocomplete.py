@@ -0,0 +1,367 @@
+"""
+Typeahead suggestions for the search box: hotel names, places and room types.
+
+Every worker keeps the suggestions in memory as a sorted list of
+(key, kind, text) tuples and finds a prefix with bisect, so a lookup never
+touches the database. Keys are the normalized text and each of its word
+suffixes, so "vie" also finds "Sea View Resort".
+
+The workers share a snapshot file (JSON, AUTOCOMPLETE_SNAPSHOT_PATH) and
+an append-only change log next to it (<snapshot>.log, one JSON line per
+save). A Hotel or Room save updates the index of the worker that made it and
+appends its changes to the log; the other workers replay the lines they
+haven't seen within AUTOCOMPLETE_RELOAD_SECONDS. Once the log outgrows
+AUTOCOMPLETE_LOG_COMPACT_BYTES it is compacted: the index is written as a
+new snapshot with an empty log. Without a snapshot, the first lookup builds
+one from the database (also: the rebuild_autocomplete command).
+"""
+import bisect
+import heapq
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from login_app.models import Hotel
+
+from .models import Room
+from .search import tokenize
+
+try:
+    import fcntl
+except ImportError:  # Windows: single worker dev server, no locking needed
+    fcntl = None
+
+SNAPSHOT_FORMAT = 2
+
+# Ties on popularity are listed in this order
+KIND_ORDER = {'place': 0, 'hotel': 1, 'room_type': 2}
+
+# Shortest query answered, and most keys read for one (the rest are ignored)
+MIN_QUERY_LENGTH = 2
+MAX_SCAN = 1000
+
+
+def normalize(text):
+    return ' '.join(tokenize(text))
+
+
+def hotel_items(name, place):
+    return [('hotel', name), ('place', place)]
+
+
+def room_items(room_type):
+    return [('room_type', room_type)]
+
+
+def changes(old_items, new_items):
+    """[(kind, text, delta)] turning the suggestions of `old_items` into those of `new_items`."""
+    deltas = {}
+    for items, sign in ((old_items, -1), (new_items, 1)):
+        for kind, text in items:
+            normalized = normalize(text)
+            if normalized:
+                deltas.setdefault((kind, normalized), [text, 0])[1] += sign
+    return [(kind, text, delta) for (kind, _n), (text, delta) in deltas.items() if delta]
+
+
+def _suffixes(normalized):
+    """The text from each word on: "sea view resort", "view resort", "resort"."""
+    start = 0
+    while start != -1:
+        yield normalized[start:]
+        start = normalized.find(' ', start)
+        if start != -1:
+            start += 1
+
+
+class SuggestionIndex:
+    """
+    Suggestions with the number of hotels/rooms behind each, which is both
+    their rank and what keeps them alive: one disappears when its count
+    drops to zero.
+    """
+
+    def __init__(self, counts=()):
+        """`counts`: (kind, text, count) or, from a snapshot, (kind, text, count, normalized)."""
+        self.entries = {}   # (kind, normalized) -> [text, count]
+        self.keys = []      # sorted (key, kind, normalized)
+        for kind, text, count, *normalized in counts:
+            self._change(kind, text, count, normalized[0] if normalized else None, sort=False)
+        self.keys.sort()
+
+    def _change(self, kind, text, delta, normalized=None, sort=True):
+        normalized = normalized or normalize(text)
+        if not normalized or not delta:
+            return
+        entry = (kind, normalized)
+        if entry in self.entries:
+            self.entries[entry][1] += delta
+            if self.entries[entry][1] > 0:
+                return
+            del self.entries[entry]
+            for key in _suffixes(normalized):
+                index = bisect.bisect_left(self.keys, (key, kind, normalized))
+                if index < len(self.keys) and self.keys[index] == (key, kind, normalized):
+                    del self.keys[index]
+        elif delta > 0:
+            self.entries[entry] = [text, delta]
+            for key in _suffixes(normalized):
+                if sort:
+                    bisect.insort(self.keys, (key, kind, normalized))
+                else:
+                    self.keys.append((key, kind, normalized))
+
+    def apply(self, changes):
+        for kind, text, delta in changes:
+            self._change(kind, text, delta)
+
+    def suggest(self, query, limit):
+        prefix = normalize(query)
+        if len(prefix) < MIN_QUERY_LENGTH:
+            return []
+        index = bisect.bisect_left(self.keys, (prefix,))
+        found = set()
+        for key, kind, entry in self.keys[index:index + MAX_SCAN]:
+            if not key.startswith(prefix):
+                break
+            found.add((kind, entry))
+        # .get(): a save in another thread may have just dropped the entry
+        matches = [(entry, self.entries.get(entry)) for entry in found]
+        ranked = heapq.nsmallest(
+            limit,
+            [(entry, info) for entry, info in matches if info],
+            key=lambda match: (-match[1][1], KIND_ORDER[match[0][0]], match[0][1]),
+        )
+        return [(kind, info[0]) for (kind, _entry), info in ranked]
+
+    def to_json(self):
+        return {
+            'format': SNAPSHOT_FORMAT,
+            'entries': [[kind, text, count, normalized]
+                        for (kind, normalized), (text, count) in self.entries.items()],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError("Unknown autocomplete snapshot format")
+        return cls(data['entries'])
+
+
+def build_index():
+    """A fresh index from the Hotel and Room tables (three grouped queries)."""
+    counts = []
+    for kind, model, field in (('hotel', Hotel, 'hotel_name'), ('place', Hotel, 'place'),
+                               ('room_type', Room, 'room_type')):
+        rows = model.objects.values_list(field).annotate(count=Count('pk')).order_by()
+        counts.extend((kind, text, count) for text, count in rows)
+    return SuggestionIndex(counts)
+
+
+# --- Snapshot and change log shared by the workers ---
+
+_lock = threading.Lock()
+_index = None
+_loaded = None       # (path, version) of the snapshot _index came from
+_log = (None, 0)     # (id, bytes read) of the change log _index has replayed
+_checked_at = 0.0
+
+
+def snapshot_path():
+    return getattr(settings, 'AUTOCOMPLETE_SNAPSHOT_PATH',
+                   os.path.join(settings.BASE_DIR, 'autocomplete_snapshot.json'))
+
+
+def log_path(path):
+    return f'{path}.log'
+
+
+def compact_bytes():
+    return getattr(settings, 'AUTOCOMPLETE_LOG_COMPACT_BYTES', 256 * 1024)
+
+
+def _stat(path):
+    """Version of the snapshot file: every write replaces it with a new inode."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+@contextmanager
+def _file_lock(path):
+    """Serializes snapshot and log writers across processes (no-op without fcntl)."""
+    if fcntl is None:
+        yield
+        return
+    with open(f'{path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _replace(path, content):
+    """Replaces a file atomically, readers see the old or the new one."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False, encoding='utf-8') as f:
+        f.write(content)
+    os.replace(f.name, path)
+
+
+def _read(path):
+    """(index, id of the change log that continues it)"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return SuggestionIndex.from_json(data), data['log']
+
+
+def _log_header(log_id):
+    return json.dumps({'log': log_id}).encode() + b'\n'
+
+
+def _publish(path, index):
+    """
+    Writes `index` as the snapshot, continued by a new empty change log
+    (caller holds both locks). The snapshot goes first: a worker that reads
+    the new log with the old snapshot finds another log id and waits for the
+    new snapshot instead of replaying lines it doesn't apply to.
+    """
+    global _index, _loaded, _log
+    log_id = uuid.uuid4().hex
+    data = index.to_json()
+    data['log'] = log_id
+    _replace(path, json.dumps(data, separators=(',', ':')))
+    version = _stat(path)
+    _replace(log_path(path), _log_header(log_id).decode())
+    _index, _loaded, _log = index, (path, version), (log_id, len(_log_header(log_id)))
+
+
+def _replay(path):
+    """
+    Applies the log lines written since this worker last read it (caller holds
+    _lock). A log that doesn't continue the loaded snapshot is left alone.
+    """
+    global _log
+    log_id, offset = _log
+    header = _log_header(log_id)
+    try:
+        with open(log_path(path), 'rb') as f:
+            if f.readline() != header:
+                return
+            f.seek(max(offset, len(header)))
+            data = f.read()
+    except FileNotFoundError:
+        return
+    # A line still being written is left for the next check
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].splitlines():
+        _index.apply(json.loads(line))
+    _log = (log_id, max(offset, len(header)) + end)
+
+
+def _refresh(path, locked=False):
+    """
+    Loads the snapshot if another worker wrote a newer one, or builds it
+    when there is none, then replays the change log. Returns True when it
+    was built from the database. The caller holds _lock, and the file lock
+    when `locked`.
+    """
+    global _index, _loaded, _log
+    version = _stat(path)
+    if version is None or (path, version) != _loaded:
+        try:
+            index, log_id = _read(path)
+        except (OSError, ValueError, KeyError):
+            # Missing, corrupt or from another version: rebuilt from the database
+            if locked:
+                _publish(path, build_index())
+            else:
+                with _file_lock(path):
+                    _publish(path, build_index())
+            return True
+        _index, _loaded, _log = index, (path, version), (log_id, 0)
+    _replay(path)
+    return False
+
+
+def get_index():
+    """This worker's index; the snapshot and log are checked for changes every AUTOCOMPLETE_RELOAD_SECONDS."""
+    global _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < getattr(settings, 'AUTOCOMPLETE_RELOAD_SECONDS', 1):
+        return _index
+    # While one thread reloads, the others keep answering from the current index
+    if not _lock.acquire(blocking=_index is None):
+        return _index
+    try:
+        _refresh(snapshot_path())
+        _checked_at = now
+        return _index
+    finally:
+        _lock.release()
+
+
+def rebuild():
+    """Rebuilds the index from the database and publishes it. Returns the number of suggestions."""
+    path = snapshot_path()
+    with _lock, _file_lock(path):
+        _publish(path, build_index())
+    return len(_index.entries)
+
+
+def _append(path, changes):
+    """
+    Adds a line to the change log (caller holds both locks, and has replayed
+    the log). Returns False if the log isn't the one of the loaded snapshot.
+    """
+    global _log
+    log_id, _offset = _log
+    try:
+        with open(log_path(path), 'r+b') as f:
+            if f.readline() != _log_header(log_id):
+                return False
+            f.seek(0, os.SEEK_END)
+            f.write(json.dumps(changes, separators=(',', ':')).encode() + b'\n')
+            _log = (log_id, f.tell())
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def update(changes):
+    """Applies changes() from a hotel/room save to this worker's index and appends them to the log."""
+    if not changes:
+        # e.g. a price change: nothing shown in suggestions moved
+        return
+    path = snapshot_path()
+    with _lock, _file_lock(path):
+        # Replays the other workers' lines first, so ours is the next one
+        if _refresh(path, locked=True):
+            return  # Freshly built from the database, the change is already in
+        _index.apply(changes)
+        # Compact a log that grew too long; one that went missing is started again
+        if not _append(path, changes) or _log[1] > compact_bytes():
+            _publish(path, _index)
+
+
+def suggest(query, limit=8):
+    """[{'text', 'kind', 'url'}] for the search box, most popular first."""
+    results_url = reverse('room_results')
+    params = {'place': 'place', 'room_type': 'room_type', 'hotel': 'query'}
+    return [
+        {'text': text, 'kind': kind, 'url': f"{results_url}?{urlencode({params[kind]: text})}"}
+        for kind, text in get_index().suggest(query, limit)
+    ]
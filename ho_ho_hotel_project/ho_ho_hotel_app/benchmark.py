@@ -0,0 +1,496 @@
+"""
+Benchmark harness for the booking funnel: search -> room detail -> checkout -> verify.
+
+Used by the benchmark_funnel command. The funnel goes through the real
+URLconf and middleware with django.test.Client; only Razorpay is replaced
+(payment.gateway.FakeGateway) so no network calls are made.
+
+ConcurrencyRunner (the benchmark_concurrency command) measures throughput
+of the hot pages under WSGI and ASGI with many requests in flight.
+"""
+import asyncio
+import io
+import json
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.utils.http import urlencode
+
+from login_app.models import CustomUser, Hotel
+from payment.gateway import FakeGateway
+from payment.models import Booking, Payment, RoomNight
+
+from . import profiling, ratings, search
+from .models import Favourite, Review, Room
+
+PLACES = ['Goa', 'Munnar', 'Ooty', 'Jaipur', 'Shimla', 'Manali', 'Kochi', 'Udaipur', 'Mysore', 'Pondicherry']
+ROOM_TYPES = ['Deluxe Suite', 'Family Room', 'Studio', 'Penthouse Suite', 'Standard Room', 'Sea View Room']
+WORDS = ['cozy', 'balcony', 'garden', 'pool', 'breakfast', 'quiet', 'spacious', 'modern', 'heritage', 'view']
+
+STEPS = ('search', 'detail', 'checkout', 'verify')
+
+_room_link = re.compile(r'/room/([0-9a-f-]{36})/')
+_hidden_input = r'name="{}"[^>]*value="([^"]*)"'
+
+
+# --- Dataset ---
+
+def _unique_pairs(rng, guests, rooms, count):
+    count = min(count, len(guests) * len(rooms))
+    picked = set()
+    while len(picked) < count:
+        picked.add((rng.randrange(len(guests)), rng.randrange(len(rooms))))
+    return [(guests[g], rooms[r]) for g, r in sorted(picked)]
+
+
+def seed_dataset(hotels=20, rooms_per_hotel=20, users=200, reviews=1000, favourites=1000,
+                 payments=500, seed=0, batch_size=500):
+    """
+    Fills the (empty, benchmark-only) database with a synthetic dataset.
+    Uses bulk_create, then rebuilds the search index and review aggregates
+    since bulk_create skips the signals that normally maintain them.
+    Returns the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    # Hashing a password per user would dominate seeding time
+    password = make_password('benchmark')
+
+    owners = [
+        CustomUser(username=f"owner{i}", password=password, is_hotel_owner=True)
+        for i in range(hotels)
+    ]
+    guests = [
+        CustomUser(username=f"guest{i}", email=f"guest{i}@example.com", password=password)
+        for i in range(users)
+    ]
+    CustomUser.objects.bulk_create(owners + guests, batch_size=batch_size)
+
+    hotel_objs = [
+        Hotel(
+            owner=owner,
+            hotel_name=f"{rng.choice(WORDS).title()} {PLACES[i % len(PLACES)]} Resort {i}",
+            place=PLACES[i % len(PLACES)],
+            address=f"{i} Beach Road",
+            license_number=f"LIC{i:06d}",
+            ownership_proof='hotel_documents/proofs/benchmark.pdf',
+            owner_id_proof='hotel_documents/id_proofs/benchmark.pdf',
+        )
+        for i, owner in enumerate(owners)
+    ]
+    Hotel.objects.bulk_create(hotel_objs, batch_size=batch_size)
+
+    room_objs = [
+        Room(
+            hotel=hotel,
+            room_number=str(100 + n),
+            room_type=rng.choice(ROOM_TYPES),
+            price_per_night=Decimal(rng.randrange(1500, 25000, 250)),
+            max_occupancy=rng.randint(1, 6),
+            description=' '.join(rng.sample(WORDS, 4)),
+        )
+        for hotel in hotel_objs
+        for n in range(rooms_per_hotel)
+    ]
+    Room.objects.bulk_create(room_objs, batch_size=batch_size)
+
+    # Reviews and favourites are unique per (user, room)
+    pairs = _unique_pairs(rng, guests, room_objs, max(reviews, favourites))
+    Review.objects.bulk_create([
+        Review(user=guest, room=room, hotel=room.hotel, rating=rng.randint(1, 5), comment=rng.choice(WORDS))
+        for guest, room in pairs[:reviews]
+    ], batch_size=batch_size)
+    Favourite.objects.bulk_create([
+        Favourite(user=guest, room=room)
+        for guest, room in pairs[:favourites]
+    ], batch_size=batch_size)
+
+    # Past stays, so they weigh on the availability subquery without blocking the funnel
+    today = timezone.localdate()
+    payment_objs, booking_objs, night_objs = [], [], []
+    for i in range(payments):
+        room = rng.choice(room_objs)
+        check_in = today - timedelta(days=rng.randint(10, 365))
+        check_out = check_in + timedelta(days=rng.randint(1, 5))
+        payment = Payment(
+            user=rng.choice(guests),
+            room=room,
+            amount=room.price_per_night * (check_out - check_in).days,
+            check_in=check_in,
+            check_out=check_out,
+            razorpay_order_id=f"order_seed_{i}",
+            razorpay_payment_id=f"pay_seed_{i}",
+            status='PAID',
+        )
+        booking = Booking(user=payment.user, room=room, payment=payment, check_in=check_in, check_out=check_out)
+        payment_objs.append(payment)
+        booking_objs.append(booking)
+        night_objs.extend(
+            RoomNight(room=room, date=check_in + timedelta(days=d), booking=booking)
+            for d in range((check_out - check_in).days)
+        )
+    Payment.objects.bulk_create(payment_objs, batch_size=batch_size)
+    Booking.objects.bulk_create(booking_objs, batch_size=batch_size)
+    RoomNight.objects.bulk_create(night_objs, batch_size=batch_size, ignore_conflicts=True)
+
+    search.rebuild_index(batch_size=batch_size)
+    ratings.rebuild_all(batch_size=batch_size)
+    cache.clear()
+
+    return {
+        'hotels': len(hotel_objs),
+        'rooms': len(room_objs),
+        'users': len(guests),
+        'reviews': min(reviews, len(pairs)),
+        'favourites': min(favourites, len(pairs)),
+        'payments': len(payment_objs),
+    }
+
+
+# --- Funnel ---
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+        # fanout's threads report their queries too
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class FunnelRunner:
+    """Runs funnel iterations and keeps latency/query samples per step."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.client = Client()
+        self.users = list(CustomUser.objects.filter(is_hotel_owner=False))
+        self.terms = PLACES + ROOM_TYPES + WORDS
+        self.samples = {step: {'latency': [], 'queries': [], 'errors': 0} for step in STEPS}
+        self.completed = 0
+
+    def _request(self, step, method, path, data=None):
+        counter = _QueryCounter()
+        start = time.perf_counter()
+        with profiling.observe_queries(counter):
+            response = getattr(self.client, method)(path, data or {})
+        elapsed = time.perf_counter() - start
+        sample = self.samples[step]
+        sample['latency'].append(elapsed)
+        sample['queries'].append(counter.count)
+        if response.status_code >= 400:
+            sample['errors'] += 1
+        return response
+
+    def iteration(self):
+        """One user through the whole funnel. Returns False if it stopped early."""
+        self.client.force_login(self.rng.choice(self.users))
+
+        response = self._request('search', 'get', reverse('room_results'), {'query': self.rng.choice(self.terms)})
+        room_ids = _room_link.findall(response.content.decode())
+        if not room_ids:
+            return False
+        room_id = self.rng.choice(room_ids)
+
+        self._request('detail', 'get', reverse('room_detail', kwargs={'pk': room_id}))
+
+        # A random future stay keeps collisions between iterations rare
+        check_in = timezone.localdate() + timedelta(days=self.rng.randint(1, 300))
+        check_out = check_in + timedelta(days=self.rng.randint(1, 4))
+        response = self._request('checkout', 'get', reverse('checkout_room', kwargs={'room_id': room_id}), {
+            'check_in': check_in.isoformat(),
+            'check_out': check_out.isoformat(),
+        })
+        html = response.content.decode()
+        order_id = re.search(_hidden_input.format('razorpay_order_id'), html)
+        payment_id = re.search(_hidden_input.format('payment_object_id'), html)
+        if not order_id or not payment_id:
+            return False
+
+        # What the Razorpay modal posts back after a successful payment
+        gateway_payment_id = FakeGateway.add_payment(order_id.group(1))
+        self._request('verify', 'post', reverse('payment_verify'), {
+            'razorpay_order_id': order_id.group(1),
+            'payment_object_id': payment_id.group(1),
+            'razorpay_payment_id': gateway_payment_id,
+            'razorpay_signature': FakeGateway.sign_payment(order_id.group(1), gateway_payment_id),
+        })
+        self.completed += 1
+        return True
+
+    def run(self, iterations, warmup=0):
+        gateway = override_settings(PAYMENT_GATEWAY='payment.gateway.FakeGateway')
+        with gateway, redirect_stdout(io.StringIO()):
+            for _ in range(warmup):
+                self.iteration()
+            self.samples = {step: {'latency': [], 'queries': [], 'errors': 0} for step in STEPS}
+            self.completed = 0
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                self.iteration()
+            return time.perf_counter() - start
+
+
+def percentiles(values):
+    """p50/p95/p99 in milliseconds."""
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None}
+    if len(values) == 1:
+        cuts = [values[0]] * 99
+    else:
+        cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {
+        'p50': round(cuts[49] * 1000, 2),
+        'p95': round(cuts[94] * 1000, 2),
+        'p99': round(cuts[98] * 1000, 2),
+    }
+
+
+def summarize(runner, elapsed):
+    steps = {}
+    requests = 0
+    for step in STEPS:
+        sample = runner.samples[step]
+        requests += len(sample['latency'])
+        steps[step] = {
+            'requests': len(sample['latency']),
+            'errors': sample['errors'],
+            'latency_ms': percentiles(sample['latency']),
+            'queries_per_request': {
+                'mean': round(statistics.fmean(sample['queries']), 2) if sample['queries'] else None,
+                'max': max(sample['queries'], default=None),
+            },
+        }
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'funnels_completed': runner.completed,
+        'throughput': {
+            'funnels_per_s': round(runner.completed / elapsed, 2) if elapsed else None,
+            'requests_per_s': round(requests / elapsed, 2) if elapsed else None,
+        },
+        'steps': steps,
+    }
+
+
+# --- WSGI vs ASGI ---
+# The same mix of requests goes through Django's own WSGI or ASGI handler
+# with `concurrency` requests in flight: one thread per slot for WSGI (a
+# threaded server), one task per slot on a single event loop for ASGI (what
+# uvicorn does). In-process, so it measures the handlers and the views
+# behind them, not sockets or HTTP parsing.
+
+SERVERS = ('wsgi', 'asgi')
+# (step, weight): mostly browsing, some favourites
+CONCURRENCY_MIX = (('search', 4), ('detail', 4), ('favourites', 1), ('toggle', 1))
+
+
+class ConcurrencyRunner:
+    """Sends a weighted mix of the hot pages to the WSGI or ASGI handler, concurrently."""
+
+    def __init__(self, server, concurrency, seed=0, sessions=50):
+        self.server = server
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+        self.terms = PLACES + ROOM_TYPES + WORDS
+        self.room_ids = [str(pk) for pk in Room.objects.order_by('pk').values_list('pk', flat=True)]
+        # Sent as cookie and header, what the favourite button's fetch() does
+        self.csrf_token = get_random_string(32)
+        self.cookies = []
+        for user in CustomUser.objects.filter(is_hotel_owner=False).order_by('pk')[:sessions]:
+            client = Client()
+            client.force_login(user)
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+            self.cookies.append(
+                f"{settings.SESSION_COOKIE_NAME}={session}; {settings.CSRF_COOKIE_NAME}={self.csrf_token}"
+            )
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.samples = {step: {'latency': [], 'errors': 0} for step, _weight in CONCURRENCY_MIX}
+
+    def plan(self, count):
+        """`count` requests as (step, method, path, query string, body, cookie)."""
+        steps, weights = zip(*CONCURRENCY_MIX)
+        planned = []
+        for step in self.rng.choices(steps, weights, k=count):
+            cookie = self.rng.choice(self.cookies)
+            if step == 'search':
+                query = urlencode({'query': self.rng.choice(self.terms)})
+                planned.append((step, 'GET', reverse('room_results'), query, b'', cookie))
+            elif step == 'detail':
+                path = reverse('room_detail', kwargs={'pk': self.rng.choice(self.room_ids)})
+                planned.append((step, 'GET', path, '', b'', cookie))
+            elif step == 'favourites':
+                planned.append((step, 'GET', reverse('user_favourites'), '', b'', cookie))
+            else:
+                body = json.dumps({'room_id': self.rng.choice(self.room_ids)}).encode()
+                planned.append((step, 'POST', reverse('toggle_favourite'), '', body, cookie))
+        return planned
+
+    def _record(self, step, elapsed, status):
+        with self._lock:
+            sample = self.samples[step]
+            sample['latency'].append(elapsed)
+            if status >= 400:
+                sample['errors'] += 1
+
+    # WSGI: a thread per slot
+
+    def _wsgi_request(self, app, request):
+        step, method, path, query, body, cookie = request
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver',
+            'HTTP_COOKIE': cookie,
+            'HTTP_X_CSRFTOKEN': self.csrf_token,
+            'CONTENT_TYPE': 'application/json' if body else '',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+
+        def start_response(status_line, headers, exc_info=None):
+            status.append(int(status_line.split()[0]))
+
+        start = time.perf_counter()
+        result = app(environ, start_response)
+        try:
+            for _chunk in result:
+                pass
+        finally:
+            # Sends request_finished, like a server does
+            result.close()
+        self._record(step, time.perf_counter() - start, status[0])
+
+    def _wsgi_slot(self, app, requests):
+        try:
+            for request in requests:
+                self._wsgi_request(app, request)
+        finally:
+            connections.close_all()
+
+    # ASGI: a task per slot on one event loop
+
+    async def _asgi_request(self, app, request):
+        step, method, path, query, body, cookie = request
+        headers = [
+            (b'host', b'testserver'),
+            (b'cookie', cookie.encode()),
+            (b'x-csrftoken', self.csrf_token.encode()),
+            (b'content-length', str(len(body)).encode()),
+        ]
+        if body:
+            headers.append((b'content-type', b'application/json'))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # The client never disconnects; Django cancels this wait after responding
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        start = time.perf_counter()
+        await app(scope, receive, send)
+        self._record(step, time.perf_counter() - start, status[0])
+
+    async def _asgi_slots(self, app, slots):
+        async def slot(requests):
+            for request in requests:
+                await self._asgi_request(app, request)
+
+        await asyncio.gather(*(slot(requests) for requests in slots))
+
+    def send(self, requests):
+        """Sends `requests`, `concurrency` at a time. Returns the elapsed seconds."""
+        slots = [requests[i::self.concurrency] for i in range(self.concurrency)]
+        start = time.perf_counter()
+        if self.server == 'wsgi':
+            app = WSGIHandler()
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                list(pool.map(lambda requests: self._wsgi_slot(app, requests), slots))
+        else:
+            asyncio.run(self._asgi_slots(ASGIHandler(), slots))
+        return time.perf_counter() - start
+
+    def run(self, requests, warmup=0):
+        if warmup:
+            self.send(self.plan(warmup))
+            self.reset()
+        return self.send(self.plan(requests))
+
+
+def summarize_concurrency(runner, elapsed):
+    steps = {}
+    requests = errors = 0
+    for step, sample in runner.samples.items():
+        requests += len(sample['latency'])
+        errors += sample['errors']
+        steps[step] = {
+            'requests': len(sample['latency']),
+            'errors': sample['errors'],
+            'latency_ms': percentiles(sample['latency']),
+        }
+    return {
+        'server': runner.server,
+        'async_views': getattr(settings, 'ASYNC_VIEWS', False),
+        'concurrency': runner.concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'requests': requests,
+        'errors': errors,
+        'requests_per_s': round(requests / elapsed, 2) if elapsed else None,
+        'latency_ms': percentiles([value for sample in runner.samples.values() for value in sample['latency']]),
+        'steps': steps,
+    }
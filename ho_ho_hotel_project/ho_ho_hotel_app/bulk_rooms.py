@@ -0,0 +1,260 @@
+"""
+Bulk room import and export for hotel owners (CSV or JSON).
+
+Both ends stream. The import reads the file a row at a time, validates each
+row with RoomImportForm's fields and checks its room number against the hotel's
+numbers, fetched in one query for the whole file (plus the ones seen earlier
+in it). It then inserts the valid rows with bulk_create, BATCH_SIZE at a time.
+Invalid rows are skipped and reported by row number. The export writes the
+same columns, so an exported file can be edited and imported into another
+hotel.
+
+bulk_create() sends no post_save, so the search tokens, the suggestions and
+the catalog version that the signals keep up to date for a single room are
+updated here, once per batch or once per import.
+
+JSON files hold an array of objects, or one object per line (JSON Lines).
+"""
+import csv
+import io
+import json
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import autocomplete, caching, search
+from .forms import RoomImportForm
+from .models import Room
+
+FIELDS = ('room_number', 'room_type', 'price_per_night', 'max_occupancy', 'description', 'is_available')
+FORMATS = ('csv', 'json')
+
+BATCH_SIZE = 500
+# Rows with errors beyond this many are counted but not listed
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportFileError(ValueError):
+    """The file can't be read as CSV/JSON at all (as opposed to a bad row)."""
+
+
+def format_for(filename):
+    """'json' for .json/.jsonl/.ndjson files, 'csv' for anything else."""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return 'json' if extension in ('json', 'jsonl', 'ndjson') else 'csv'
+
+
+# --- Reading ---
+
+def read_rows(binary, fmt):
+    """The rows (dicts) of a file opened in binary mode, one at a time."""
+    return read_json(binary) if fmt == 'json' else read_csv(binary)
+
+
+def read_csv(binary):
+    # utf-8-sig: spreadsheet programs start their UTF-8 exports with a BOM
+    text = io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    try:
+        if reader.fieldnames:
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        yield from reader
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ImportFileError(f"Unreadable CSV after row {reader.line_num}: {e}")
+    finally:
+        text.detach()  # Leave the upload open for its owner to close
+
+
+def read_json(binary, chunk_size=64 * 1024):
+    """
+    The objects of a JSON array or of JSON Lines, decoded a chunk at a time
+    so the file is never in memory whole.
+    """
+    decoder = json.JSONDecoder()
+    text = io.TextIOWrapper(binary, encoding='utf-8-sig')
+    buffer = ''
+    try:
+        while True:
+            chunk = text.read(chunk_size)
+            buffer += chunk
+            position = 0
+            while True:
+                # Skip the array's brackets and commas, and the whitespace between objects
+                while position < len(buffer) and buffer[position] in '[], \t\r\n':
+                    position += 1
+                if position == len(buffer):
+                    break
+                try:
+                    row, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError as e:
+                    if not chunk:
+                        raise ImportFileError(f"Invalid JSON: {e}")
+                    break  # The object continues in the next chunk
+                yield row
+            buffer = buffer[position:]
+            if not chunk:
+                return
+    except UnicodeDecodeError as e:
+        raise ImportFileError(f"Invalid JSON: {e}")
+    finally:
+        text.detach()
+
+
+# --- Import ---
+
+class ImportResult:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.valid = 0
+        self.created = 0
+        self.error_count = 0
+        self.errors = []    # [(row number, {field: [messages]})], the first MAX_REPORTED_ERRORS
+
+    def add_error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, errors))
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'valid': self.valid,
+            'created': self.created,
+            'dry_run': self.dry_run,
+            'error_count': self.error_count,
+            'errors': [{'row': row, 'errors': errors} for row, errors in self.errors],
+        }
+
+
+class RowValidator:
+    """
+    RoomImportForm's checks, one row at a time. A form per row would copy
+    all its fields each time, which costs more than inserting the room, so
+    the fields of one form are reused. The model's own field checks
+    (max_length, decimal places, ranges) are on those fields already.
+    """
+
+    def __init__(self):
+        self.form = RoomImportForm()
+
+    def clean(self, row):
+        """(unsaved Room, None) for a valid row, (None, {field: [messages]}) otherwise."""
+        form = self.form
+        form.cleaned_data = {}
+        errors = {}
+        for name, field in form.fields.items():
+            try:
+                form.cleaned_data[name] = field.clean(field.widget.value_from_datadict(row, None, name))
+                if hasattr(form, f'clean_{name}'):
+                    form.cleaned_data[name] = getattr(form, f'clean_{name}')()
+            except ValidationError as e:
+                errors[name] = e.messages
+        if errors:
+            return None, errors
+        return Room(**form.cleaned_data), None
+
+
+def _number_key(room_number):
+    # MySQL's default collation compares room numbers case-insensitively
+    return room_number.casefold()
+
+
+def import_rooms(hotel, rows, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Validates `rows` (dicts of FIELDS, e.g. from read_rows()) and adds the
+    valid ones to the hotel, unless `dry_run`. Returns an ImportResult.
+    Raises ImportFileError, with nothing imported, for an unreadable file.
+    """
+    result = ImportResult(dry_run)
+    # One query for the numbers already taken, instead of one per row
+    numbers = Room.objects.filter(hotel=hotel).values_list('room_number', flat=True)
+    taken = {_number_key(number) for number in numbers}
+    validator = RowValidator()
+    room_types = Counter()
+    batch = []
+
+    def create_batch():
+        if not dry_run:
+            Room.objects.bulk_create(batch)
+            search.index_new_rooms(batch)
+            result.created += len(batch)
+        room_types.update(room.room_type for room in batch)
+        batch.clear()
+
+    with transaction.atomic():
+        for row_number, row in enumerate(rows, start=1):
+            result.rows += 1
+            if not isinstance(row, dict):
+                result.add_error(row_number, {'__all__': ["Expected an object with the room's fields."]})
+                continue
+            room, errors = validator.clean(row)
+            if errors:
+                result.add_error(row_number, errors)
+                continue
+            key = _number_key(room.room_number)
+            if key in taken:
+                result.add_error(row_number, {'room_number': [
+                    f"A room with number '{room.room_number}' already exists for this hotel."
+                ]})
+                continue
+            taken.add(key)
+            room.hotel = hotel
+            result.valid += 1
+            batch.append(room)
+            if len(batch) >= batch_size:
+                create_batch()
+        if batch:
+            create_batch()
+
+        if result.created:
+            changes = [('room_type', room_type, count) for room_type, count in room_types.items()]
+            transaction.on_commit(lambda: autocomplete.update(changes))
+            transaction.on_commit(lambda: caching.bump('catalog'))
+    return result
+
+
+# --- Export ---
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _export_rows(hotel, chunk_size):
+    queryset = Room.objects.filter(hotel=hotel).order_by('room_number').values_list(*FIELDS)
+    # Pin the database now: the rows are read after the view (and the routing
+    # middleware) has returned
+    return queryset.using(queryset.db).iterator(chunk_size=chunk_size)
+
+
+def export_csv(hotel, chunk_size=BATCH_SIZE):
+    """The hotel's rooms as CSV lines, read from the database chunk_size at a time."""
+    return _csv_lines(_export_rows(hotel, chunk_size))
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for values in rows:
+        yield writer.writerow(
+            ('true' if value else 'false') if isinstance(value, bool) else value for value in values
+        )
+
+
+def export_json(hotel, chunk_size=BATCH_SIZE):
+    """The hotel's rooms as a JSON array, one object per line."""
+    return _json_lines(_export_rows(hotel, chunk_size))
+
+
+def _json_lines(rows):
+    yield '['
+    for index, values in enumerate(rows):
+        room = dict(zip(FIELDS, values))
+        # A string keeps the exact decimal price
+        room['price_per_night'] = str(room['price_per_night'])
+        yield (',\n' if index else '\n') + json.dumps(room)
+    yield '\n]\n'
@@ -0,0 +1,228 @@
+import hashlib
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from .models import Room
+from .pagination import CursorPage
+
+# How long cached search result pages live (they are also invalidated on writes)
+SEARCH_TIMEOUT = 5 * 60
+
+# Namespaces reported by the stats endpoint
+NAMESPACES = ('search', 'fragment', 'favourites', 'facets')
+
+_MISSING = object()
+
+
+# --- Hit/miss counters ---
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # First hit/miss for this key (or it was evicted)
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def record(namespace, hit):
+    _incr(f"stats:{namespace}:{'hits' if hit else 'misses'}")
+
+
+async def _aincr(key):
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, timeout=None):
+            await cache.aincr(key)
+
+
+async def arecord(namespace, hit):
+    await _aincr(f"stats:{namespace}:{'hits' if hit else 'misses'}")
+
+
+def get_stats():
+    """Hit/miss counters per namespace, shared by every worker using the same backend."""
+    keys = [f"stats:{ns}:{kind}" for ns in NAMESPACES for kind in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    stats = {}
+    for ns in NAMESPACES:
+        hits = values.get(f"stats:{ns}:hits", 0)
+        misses = values.get(f"stats:{ns}:misses", 0)
+        total = hits + misses
+        stats[ns] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 3) if total else None,
+        }
+    return stats
+
+
+def reset_stats():
+    cache.delete_many([f"stats:{ns}:{kind}" for ns in NAMESPACES for kind in ('hits', 'misses')])
+
+
+def get_or_set(namespace, key, producer, timeout=DEFAULT_TIMEOUT):
+    """cache.get_or_set() that also counts hits and misses for `namespace`."""
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        record(namespace, hit=True)
+        return value
+    record(namespace, hit=False)
+    value = producer()
+    cache.set(key, value, timeout)
+    return value
+
+
+async def aget_or_set(namespace, key, producer, timeout=DEFAULT_TIMEOUT):
+    """get_or_set() for async views: `producer` is a coroutine function."""
+    value = await cache.aget(key, _MISSING)
+    if value is not _MISSING:
+        await arecord(namespace, hit=True)
+        return value
+    await arecord(namespace, hit=False)
+    value = await producer()
+    await cache.aset(key, value, timeout)
+    return value
+
+
+# --- Versions (invalidation) ---
+# Cached entries embed a version number in their key. Writes bump the version
+# and the old entries are simply never read again and expire on their own.
+
+def _version_key(scope, pk=None):
+    return f"ver:{scope}" if pk is None else f"ver:{scope}:{pk}"
+
+
+def bump(scope, pk=None):
+    _incr(_version_key(scope, pk))
+
+
+def catalog_version():
+    """Changes whenever anything that can alter search results is written."""
+    return cache.get(_version_key('catalog'), 0)
+
+
+async def acatalog_version():
+    return await cache.aget(_version_key('catalog'), 0)
+
+
+def _room_version(room, versions):
+    return f"{versions.get(_version_key('room', room.pk), 0)}.{versions.get(_version_key('hotel', room.hotel_id), 0)}"
+
+
+def room_version(room):
+    """Version of everything shown on a room's detail page (room, hotel and owner, reviews)."""
+    return _room_version(room, cache.get_many([_version_key('room', room.pk), _version_key('hotel', room.hotel_id)]))
+
+
+async def aroom_version(room):
+    return _room_version(room, await cache.aget_many([_version_key('room', room.pk), _version_key('hotel', room.hotel_id)]))
+
+
+def fragment_key(name, parts):
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f"frag:{name}:{digest}"
+
+
+# --- Search results ---
+
+class CachedRoomList:
+    """
+    Sequence of rooms backed by a cached list of ids.
+    Slicing only loads the rooms in the slice.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            page_ids = self.ids[index]
+            rooms = Room.objects.select_related('hotel').in_bulk(page_ids)
+            # Rooms deleted since the list was cached are skipped
+            return [rooms[pk] for pk in page_ids if pk in rooms]
+        return self[index:index + 1][0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+def search_key(params, version=None):
+    """
+    Cache key for one page of a search, from its GET parameters (cursor
+    included). `version` is the catalog version when the caller has it.
+    """
+    items = sorted((k, v) for k, values in params.lists() for v in values)
+    digest = hashlib.md5(repr(items).encode()).hexdigest()
+    return f"search:{catalog_version() if version is None else version}:{digest}"
+
+
+def search_etag(params):
+    """ETag for search responses: same inputs and catalog version as search_key()."""
+    return search_key(params).split(':', 1)[1]
+
+
+def facets_key(filters, version=None):
+    """Cache key for the facet counts of a search, from its cleaned filter values."""
+    digest = hashlib.md5(repr(sorted(filters.items())).encode()).hexdigest()
+    return f"facets:{catalog_version() if version is None else version}:{digest}"
+
+
+def nearby_key(latitude, longitude, radius_km, version=None):
+    """Cache key for the hotels found around a point (see geo.py)."""
+    version = catalog_version() if version is None else version
+    return f"nearby:{version}:{latitude:.5f}:{longitude:.5f}:{radius_km}"
+
+
+def cached_search_page(params, producer):
+    """
+    Returns one page of search results for `params` as a CursorPage.
+    Pages are cached as id lists plus their next/previous cursors; `producer`
+    computes the page on a miss.
+    """
+    key = search_key(params)
+    cached = cache.get(key)
+    if cached is not None:
+        record('search', hit=True)
+        ids, next_cursor, previous_cursor = cached
+        return CursorPage(CachedRoomList(ids)[:], next_cursor, previous_cursor)
+
+    record('search', hit=False)
+    page = producer()
+    cache.set(key, ([room.pk for room in page], page.next_cursor, page.previous_cursor), SEARCH_TIMEOUT)
+    return page
+
+
+async def acached_search_page(params, producer):
+    """cached_search_page() for async views: `producer` is a coroutine function."""
+    key = search_key(params, await acatalog_version())
+    cached = await cache.aget(key)
+    if cached is not None:
+        await arecord('search', hit=True)
+        ids, next_cursor, previous_cursor = cached
+        # Same as CachedRoomList: rooms deleted since are skipped
+        rooms = await Room.objects.select_related('hotel').ain_bulk(ids)
+        return CursorPage([rooms[pk] for pk in ids if pk in rooms], next_cursor, previous_cursor)
+
+    await arecord('search', hit=False)
+    page = await producer()
+    await cache.aset(key, ([room.pk for room in page], page.next_cursor, page.previous_cursor), SEARCH_TIMEOUT)
+    return page
+
+
+# --- Favourites ---
+
+def favourites_key(user_id):
+    return f"favourites:{user_id}"
+
+
+def invalidate_favourites(user_id):
+    cache.delete(favourites_key(user_id))
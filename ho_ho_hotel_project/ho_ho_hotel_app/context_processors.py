@@ -0,0 +1,26 @@
+from django.utils.functional import SimpleLazyObject
+
+from .favourites import favourite_room_ids
+
+
+def get_favourite_room_ids(request):
+    """
+    Returns the set of room UUIDs the current user has favourited.
+    Loaded with a single query and kept on the request, so every room card
+    on a page shares the same lookup.
+    """
+    if not hasattr(request, '_favourite_room_ids'):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            request._favourite_room_ids = frozenset()
+        else:
+            # Also cached across requests (see favourites.py)
+            request._favourite_room_ids = favourite_room_ids(user)
+    return request._favourite_room_ids
+
+
+def favourites(request):
+    # Lazy so pages that never look at favourites don't pay for the query
+    return {
+        'favourite_room_ids': SimpleLazyObject(lambda: get_favourite_room_ids(request)),
+    }
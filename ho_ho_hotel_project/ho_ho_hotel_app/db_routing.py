@@ -0,0 +1,131 @@
+"""
+Read-replica routing.
+
+Views that only read set `use_read_replica = True`. For GET/HEAD requests
+to them, ReplicaRoutingMiddleware picks one replica (any DATABASES alias
+starting with 'replica') and PrimaryReplicaRouter sends that request's
+reads there, template rendering included. Everything else, and every
+write, goes to 'default'.
+
+Replicas lag behind the primary, so a client that has just written is kept
+on the primary for REPLICA_STICKY_SECONDS (a cookie), so they always see
+their own favourite, review or booking straight away.
+
+The request state lives in a context variable, which the sync threads of an
+ASGI request (ORM calls, process_view) inherit, so routing works the same
+under WSGI and ASGI.
+
+Settings:
+    REPLICA_STICKY_SECONDS   how long a client reads from the primary after a write
+"""
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+STICKY_COOKIE = 'primary_until'
+
+_state = contextvars.ContextVar('db_routing', default=None)
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+
+def replica_aliases():
+    return [alias for alias in connections.databases if alias.startswith('replica')]
+
+
+class _RequestState:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+class PrimaryReplicaRouter:
+    """Reads go to the replica chosen for the current request (if any), writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.replica and not state.wrote:
+            return state.replica
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Later reads in this request, and the client's next requests, see the write
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        databases = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def pinned_to_primary(request):
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Sends the reads of safe requests to `use_read_replica` views to a replica,
+    and pins clients that wrote something to the primary for a while.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = _RequestState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin_writers(request, response, state)
+
+    async def __acall__(self, request):
+        state = _RequestState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin_writers(request, response, state)
+
+    def pin_writers(self, request, response, state):
+        if state.wrote or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time() + sticky_seconds())),
+                max_age=sticky_seconds(), httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        if not getattr(view, 'use_read_replica', False) or request.method not in ('GET', 'HEAD'):
+            return None
+        replicas = replica_aliases()
+        state = _state.get()
+        if replicas and state is not None and not pinned_to_primary(request):
+            state.replica = random.choice(replicas)
+        return None
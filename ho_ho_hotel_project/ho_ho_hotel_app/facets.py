@@ -0,0 +1,201 @@
+"""
+Structured room filters and facet counts for the search results page.
+
+filter_rooms() applies the RoomSearchForm filters (price range, guests,
+place, room type, minimum rating, stay dates, distance from a point).
+Facets count the matching rooms per place, room type and price bucket, one
+grouped query per facet.
+Each facet ignores its own filter, so picking "Goa" still shows how many
+rooms the other places have. Counts are cached per search until the
+catalog changes.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Case, CharField, Count, Q, Value, When
+
+from payment.booking import filter_available
+
+from . import caching, geo
+from .models import Room
+from .search import search_rooms
+
+# (value, label, min, max): min inclusive, max exclusive
+PRICE_BUCKETS = [
+    ('0-2000', 'Under ₹2,000', None, 2000),
+    ('2000-5000', '₹2,000 – ₹5,000', 2000, 5000),
+    ('5000-10000', '₹5,000 – ₹10,000', 5000, 10000),
+    ('10000-', '₹10,000 and up', 10000, None),
+]
+
+# Places/room types listed per facet, most rooms first
+MAX_FACET_VALUES = 10
+
+# Form fields that narrow results (the rest are paging and sorting)
+FILTER_FIELDS = ('query', 'check_in', 'check_out', 'min_price', 'max_price', 'guests',
+                 'place', 'room_type', 'min_rating', 'lat', 'lng', 'radius_km')
+
+# Without a radius, a location search shows the rooms of this many nearest
+# hotels, as long as they are within GEO_NEAREST_MAX_KM
+NEAREST_HOTELS = getattr(settings, 'GEO_NEAREST_HOTELS', 50)
+NEAREST_MAX_KM = getattr(settings, 'GEO_NEAREST_MAX_KM', 300)
+
+
+def has_filters(data):
+    return any(data.get(field) not in (None, '') for field in FILTER_FIELDS)
+
+
+def has_location(data):
+    return data.get('lat') is not None and data.get('lng') is not None
+
+
+def nearby_hotels(data):
+    """
+    {hotel_id: distance_km} around the searched point: the hotels within
+    radius_km, or the nearest ones when no radius was picked. Cached until
+    the catalog changes.
+    """
+    lat, lng, radius = data['lat'], data['lng'], data.get('radius_km')
+
+    def find():
+        if radius:
+            return _rounded(geo.hotels_within(lat, lng, radius))
+        return _rounded(geo.nearest_hotels(lat, lng, NEAREST_HOTELS, NEAREST_MAX_KM))
+
+    return caching.get_or_set('search', caching.nearby_key(lat, lng, radius), find, caching.SEARCH_TIMEOUT)
+
+
+async def anearby_hotels(data):
+    """nearby_hotels() for async views."""
+    lat, lng, radius = data['lat'], data['lng'], data.get('radius_km')
+
+    async def find():
+        if radius:
+            return _rounded(await geo.ahotels_within(lat, lng, radius))
+        return _rounded(await geo.anearest_hotels(lat, lng, NEAREST_HOTELS, NEAREST_MAX_KM))
+
+    key = caching.nearby_key(lat, lng, radius, await caching.acatalog_version())
+    return await caching.aget_or_set('search', key, find, caching.SEARCH_TIMEOUT)
+
+
+def _rounded(found):
+    # Metres are plenty for the cards and the API
+    return {hotel_id: round(distance, 3) for hotel_id, distance in found.items()}
+
+
+def annotate_distance(queryset, data):
+    """Adds distance_km from the searched point to each room, for sorting by distance."""
+    return queryset.annotate(distance_km=geo.distance_expression(data['lat'], data['lng'], prefix='hotel__'))
+
+
+def filter_rooms(queryset, data, skip=(), nearby=None):
+    """
+    Narrows a Room queryset by the cleaned RoomSearchForm `data`.
+    Filters named in `skip` ('price', 'place', 'room_type') are left out.
+    The free-text query is not applied here, see search_rooms().
+    `nearby` is nearby_hotels(data), when the caller has already looked it up.
+    """
+    if data.get('check_in') and data.get('check_out'):
+        # Drops rooms with any booked night in the stay (one indexed subquery)
+        queryset = filter_available(queryset, data['check_in'], data['check_out'])
+    if 'price' not in skip:
+        if data.get('min_price') is not None:
+            queryset = queryset.filter(price_per_night__gte=data['min_price'])
+        if data.get('max_price') is not None:
+            queryset = queryset.filter(price_per_night__lte=data['max_price'])
+    if data.get('guests'):
+        queryset = queryset.filter(max_occupancy__gte=data['guests'])
+    if data.get('place') and 'place' not in skip:
+        queryset = queryset.filter(hotel__place__iexact=data['place'])
+    if data.get('room_type') and 'room_type' not in skip:
+        queryset = queryset.filter(room_type__iexact=data['room_type'])
+    if data.get('min_rating'):
+        queryset = queryset.filter(rating_avg__gte=data['min_rating'])
+    if has_location(data):
+        # Hotel ids from the geohash index, at most geo.MAX_NEARBY_HOTELS of them
+        queryset = queryset.filter(hotel_id__in=list(nearby_hotels(data) if nearby is None else nearby))
+    return queryset
+
+
+def price_bucket():
+    """CASE expression putting each room in its PRICE_BUCKETS value."""
+    whens = []
+    for value, _label, low, high in PRICE_BUCKETS:
+        condition = Q()
+        if low is not None:
+            condition &= Q(price_per_night__gte=low)
+        if high is not None:
+            condition &= Q(price_per_night__lt=high)
+        whens.append(When(condition, then=Value(value)))
+    return Case(*whens, output_field=CharField())
+
+
+def _grouped(queryset, field):
+    """(field, count) rows of one facet query, most rooms first."""
+    return queryset.values_list(field).annotate(count=Count('id')).order_by('-count', field)[:MAX_FACET_VALUES]
+
+
+def _facet_queries(data, nearby=None):
+    """{facet: grouped queryset}, each facet filtered by everything but itself."""
+    base = Room.objects.filter(is_available=True)
+    if data.get('query'):
+        # Matching rooms only; the ranking is irrelevant for counting
+        base = base.filter(id__in=search_rooms(data['query']).values('id'))
+
+    return {
+        'place': _grouped(filter_rooms(base, data, skip=('place',), nearby=nearby), 'hotel__place'),
+        'room_type': _grouped(filter_rooms(base, data, skip=('room_type',), nearby=nearby), 'room_type'),
+        'price': _grouped(
+            filter_rooms(base, data, skip=('price',), nearby=nearby).annotate(price_bucket=price_bucket()),
+            'price_bucket',
+        ),
+    }
+
+
+def _facets(counts):
+    price_counts = dict(counts['price'])
+    return {
+        'place': counts['place'],
+        'room_type': counts['room_type'],
+        'price': [
+            (label, price_counts[value], *bucket_range(low, high))
+            for value, label, low, high in PRICE_BUCKETS
+            if price_counts.get(value)
+        ],
+    }
+
+
+def compute_facets(data, nearby=None):
+    """
+    {'place': [(value, count)], 'room_type': [(value, count)],
+     'price': [(label, count, min_price, max_price)]}
+    """
+    return _facets({facet: list(rows) for facet, rows in _facet_queries(data, nearby).items()})
+
+
+async def acompute_facets(data, nearby=None):
+    """compute_facets() read with the async ORM. Location searches must pass `nearby`."""
+    counts = {}
+    for facet, rows in _facet_queries(data, nearby).items():
+        counts[facet] = [row async for row in rows]
+    return _facets(counts)
+
+
+def facet_counts(data, nearby=None):
+    """Cached compute_facets(), keyed on the filters of the search."""
+    key = caching.facets_key({field: data.get(field) for field in FILTER_FIELDS})
+    return caching.get_or_set('facets', key, lambda: compute_facets(data, nearby), caching.SEARCH_TIMEOUT)
+
+
+async def afacet_counts(data, nearby=None):
+    """facet_counts() for async views."""
+    key = caching.facets_key({field: data.get(field) for field in FILTER_FIELDS}, await caching.acatalog_version())
+    return await caching.aget_or_set('facets', key, lambda: acompute_facets(data, nearby), caching.SEARCH_TIMEOUT)
+
+
+def bucket_range(low, high):
+    """min_price/max_price form values selecting one bucket (max_price is inclusive)."""
+    return (
+        '' if low is None else str(low),
+        '' if high is None else str(Decimal(high) - Decimal('0.01')),
+    )
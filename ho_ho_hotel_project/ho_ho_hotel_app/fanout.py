@@ -0,0 +1,78 @@
+"""
+Runs the independent lookups of a page at the same time.
+
+    results = fanout.run({'room': load_room, 'review_status': load_status})
+
+Each callable runs in a small shared thread pool, so the page waits for the
+slowest lookup instead of the sum of them. Database connections belong to a
+thread: every pool thread keeps its own (closed when too old or broken, like
+at the end of a request). The request's context goes along, so the replica
+routing (db_routing.py), the query profiler and profiling.observe_queries()
+see the pool's queries too.
+
+Inside a transaction (including tests) the lookups run one after another in
+the calling thread, since other connections can't see its uncommitted rows.
+Async views call run() through sync_to_async(): the async ORM runs every
+query on the one thread-sensitive sync thread, so awaiting lookups together
+wouldn't overlap them.
+
+Settings:
+    FANOUT_MAX_WORKERS   pool threads per process (each may hold a connection)
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from . import profiling
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'FANOUT_MAX_WORKERS', 8),
+                thread_name_prefix='fanout',
+            )
+        return _executor
+
+
+def in_transaction():
+    return any(connection.in_atomic_block for connection in connections.all(initialized_only=True))
+
+
+def _call(function):
+    # What the request cycle does around a view: drop stale connections before and after
+    close_old_connections()
+    try:
+        with ExitStack() as stack:
+            for hook in profiling.context_hooks():
+                profiling.hook_connections(stack, hook)
+            return function()
+    finally:
+        close_old_connections()
+
+
+def run(lookups):
+    """
+    {name: result} for {name: callable}. The first exception raised by a
+    lookup is raised here, after all of them have finished.
+    """
+    if len(lookups) < 2 or in_transaction():
+        return {name: function() for name, function in lookups.items()}
+    futures = {
+        name: executor().submit(contextvars.copy_context().run, _call, function)
+        for name, function in lookups.items()
+    }
+    # Wait for every lookup before raising, none is left running behind the response
+    for future in futures.values():
+        future.exception()
+    return {name: future.result() for name, future in futures.items()}
+
@@ -0,0 +1,236 @@
+"""
+Favourite toggles.
+
+toggle() flips a favourite with one conditional write: delete the user's
+row for the room, and insert one only when there was nothing to delete. No
+row is read or locked first; when two toggles race to insert, the unique
+(user, room) constraint keeps one row and both report it. The state
+returned is the one the database ended up with.
+
+Write-behind (FAVOURITES_WRITE_BEHIND_SECONDS > 0): a toggle only records
+the state wanted for the room in the user's pending entry in the cache, and
+the worker writes a user's burst of toggles in bulk (one INSERT, one DELETE)
+that many seconds later. Heart/unheart/heart ends up as one insert, or none.
+Until the flush, favourite_room_ids() (the hearts on the room cards)
+includes the pending changes; the favourites page reads the table and
+catches up after it. This needs a cache shared by all workers. Toggles still
+pending when a worker is killed are lost; a normal exit flushes them.
+"""
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connections, router, transaction
+
+from . import caching
+from .models import Favourite, Room
+
+logger = logging.getLogger(__name__)
+
+# Pending toggles are dropped after this long if their worker never flushed them
+PENDING_TIMEOUT = 10 * 60
+# A lock left behind by a dead worker expires after this many seconds
+LOCK_TIMEOUT = 5
+
+
+def write_behind_seconds():
+    return getattr(settings, 'FAVOURITES_WRITE_BEHIND_SECONDS', 0)
+
+
+def favourite_room_ids(user):
+    """The room ids `user` has favourited, toggles waiting to be written included."""
+    # Cached across requests, dropped whenever the user's favourites change (signals.py)
+    room_ids = caching.get_or_set(
+        'favourites',
+        caching.favourites_key(user.pk),
+        lambda: frozenset(Favourite.objects.filter(user=user).values_list('room_id', flat=True)),
+    )
+    if write_behind_seconds():
+        pending = cache.get(pending_key(user.pk))
+        if pending:
+            loved = {room_id for room_id, state in pending.items() if state}
+            room_ids = frozenset((room_ids | loved) - (pending.keys() - loved))
+    return room_ids
+
+
+def toggle(user, room_id):
+    """
+    Flips the user's favourite for the room and returns the new state
+    (True: favourited). Raises Room.DoesNotExist for an unknown room.
+    """
+    if write_behind_seconds():
+        return buffer_toggle(user, room_id)
+
+    if _delete(user.pk, [room_id]):
+        return False
+    try:
+        _insert(user, room_id)
+    except IntegrityError:
+        # A toggle racing this one inserted the row first, or there is no such room
+        if not Room.objects.filter(pk=room_id).exists():
+            raise Room.DoesNotExist
+    return True
+
+
+async def atoggle(user, room_id):
+    """
+    toggle() for async views, through the async ORM. With write-behind on,
+    the buffered toggle still runs in a thread: its lock and flush timer are
+    thread-based.
+    """
+    if write_behind_seconds():
+        return await sync_to_async(buffer_toggle)(user, room_id)
+
+    # Async views run in autocommit (ATOMIC_REQUESTS doesn't apply to them), so
+    # a missing room fails the INSERT itself. post_delete/post_save drop the
+    # cached favourites.
+    deleted, _ = await Favourite.objects.filter(user_id=user.pk, room_id=room_id).adelete()
+    if deleted:
+        return False
+    try:
+        await Favourite.objects.acreate(user=user, room_id=room_id)
+    except IntegrityError:
+        if not await Room.objects.filter(pk=room_id).aexists():
+            raise Room.DoesNotExist
+    return True
+
+
+def _delete(user_id, room_ids):
+    """
+    One DELETE ... WHERE user_id AND room_id, returns the number of rows
+    deleted. QuerySet.delete() would SELECT the rows first (for the collector
+    and post_delete), so the cache is invalidated here instead.
+    """
+    alias = router.db_for_write(Favourite)
+    connection = connections[alias]
+    meta = Favourite._meta
+    user_field, room_field = meta.get_field('user'), meta.get_field('room')
+    quote = connection.ops.quote_name
+    sql = 'DELETE FROM {} WHERE {} = %s AND {} IN ({})'.format(
+        quote(meta.db_table),
+        quote(user_field.column),
+        quote(room_field.column),
+        ', '.join(['%s'] * len(room_ids)),
+    )
+    params = [user_field.get_db_prep_value(user_id, connection)]
+    params += [room_field.get_db_prep_value(room_id, connection) for room_id in room_ids]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        deleted = cursor.rowcount
+    if deleted:
+        transaction.on_commit(lambda: caching.invalidate_favourites(user_id), using=alias)
+    return deleted
+
+
+def _insert(user, room_id):
+    if not transaction.get_connection().in_atomic_block:
+        Favourite.objects.create(user=user, room_id=room_id)
+        return
+    # Inside a transaction a failed INSERT mustn't break it, and the room is checked
+    # here: some databases only check (deferred) foreign keys at commit
+    if not Room.objects.filter(pk=room_id).exists():
+        raise Room.DoesNotExist
+    with transaction.atomic():
+        Favourite.objects.create(user=user, room_id=room_id)
+
+
+# --- Write-behind ---
+
+def pending_key(user_id):
+    return f"favourites:pending:{user_id}"
+
+
+@contextmanager
+def _user_lock(user_id):
+    """Serializes one user's toggles and flushes across workers (cache.add() as the lock)."""
+    key = f"favourites:lock:{user_id}"
+    while not cache.add(key, 1, timeout=LOCK_TIMEOUT):
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+def buffer_toggle(user, room_id):
+    """toggle() that records the new state in the cache and leaves the write to flush()."""
+    if not Room.objects.filter(pk=room_id).exists():
+        raise Room.DoesNotExist
+    with _user_lock(user.pk):
+        loved = room_id not in favourite_room_ids(user)
+        pending = cache.get(pending_key(user.pk)) or {}
+        pending[room_id] = loved
+        cache.set(pending_key(user.pk), pending, PENDING_TIMEOUT)
+    _schedule_flush(user.pk)
+    return loved
+
+
+def flush(user_ids):
+    """Writes the pending toggles of `user_ids`. Returns the number of users that had any."""
+    flushed = 0
+    for user_id in user_ids:
+        with _user_lock(user_id):
+            pending = cache.get(pending_key(user_id))
+            if not pending:
+                continue
+            added = [room_id for room_id, state in pending.items() if state]
+            removed = [room_id for room_id, state in pending.items() if not state]
+            if added:
+                # Rooms deleted in the meantime are skipped
+                rooms = set(Room.objects.filter(pk__in=added).values_list('pk', flat=True))
+                Favourite.objects.bulk_create(
+                    [Favourite(user_id=user_id, room_id=room_id) for room_id in added if room_id in rooms],
+                    ignore_conflicts=True,
+                )
+            if removed:
+                _delete(user_id, removed)
+            # bulk_create() sends no signals
+            caching.invalidate_favourites(user_id)
+            cache.delete(pending_key(user_id))
+            flushed += 1
+    return flushed
+
+
+_pending_users = set()
+_pending_lock = threading.Lock()
+_timer = None
+
+
+def _schedule_flush(user_id):
+    global _timer
+    with _pending_lock:
+        _pending_users.add(user_id)
+        if _timer is None:
+            _timer = threading.Timer(write_behind_seconds(), _flush_pending)
+            _timer.daemon = True
+            _timer.start()
+
+
+def _flush_pending():
+    global _timer
+    with _pending_lock:
+        user_ids = set(_pending_users)
+        _pending_users.clear()
+        _timer = None
+    try:
+        flush(user_ids)
+    except Exception:
+        logger.exception("Writing buffered favourite toggles failed, retrying")
+        for user_id in user_ids:
+            _schedule_flush(user_id)
+    finally:
+        connections.close_all()
+
+
+@atexit.register
+def _flush_at_exit():
+    with _pending_lock:
+        if _timer is not None:
+            _timer.cancel()
+    if _pending_users:
+        _flush_pending()
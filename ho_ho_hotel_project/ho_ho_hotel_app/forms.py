@@ -1,6 +1,8 @@
 from django import forms
-from .models import Room
+from .models import Room, ScheduledRateChange
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from payment.booking import validate_stay
 
 class RoomForm(forms.ModelForm):
     # Add an initializer to accept the 'hotel' instance
@@ -41,8 +43,148 @@ class RoomForm(forms.ModelForm):
             'is_available': 'Ready for Booking',
         }
 
+class RoomImportForm(forms.ModelForm):
+    """
+    One row of a bulk room import (bulk_rooms.py). Room numbers are checked
+    there, against the hotel's existing rooms fetched once for the whole file.
+    """
+    TRUE_VALUES = {'true', '1', 'yes', 'y'}
+    FALSE_VALUES = {'false', '0', 'no', 'n'}
+
+    # Text, not a checkbox: files say true/false, 1/0 or yes/no
+    is_available = forms.CharField(required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Left out of the file: the model default
+        self.fields['max_occupancy'].required = False
+
+    def clean_max_occupancy(self):
+        value = self.cleaned_data.get('max_occupancy')
+        return Room._meta.get_field('max_occupancy').get_default() if value is None else value
+
+    def clean_is_available(self):
+        value = self.cleaned_data.get('is_available', '').strip().lower()
+        if not value or value in self.TRUE_VALUES:
+            return True
+        if value in self.FALSE_VALUES:
+            return False
+        raise ValidationError("Enter true or false.")
+
+    class Meta:
+        model = Room
+        fields = [
+            'room_number',
+            'room_type',
+            'price_per_night',
+            'max_occupancy',
+            'description',
+            'is_available',
+        ]
+
+class RoomImportUploadForm(forms.Form):
+    FORMAT_CHOICES = [
+        ('', 'From the file name'),
+        ('csv', 'CSV'),
+        ('json', 'JSON / JSON Lines'),
+    ]
+
+    rooms_file = forms.FileField(
+        label='Rooms file',
+        help_text='One room per row: room_number, room_type, price_per_night, max_occupancy, description, is_available.',
+    )
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False, label='Format')
+    dry_run = forms.BooleanField(required=False, label='Only check the file, add nothing')
+
+class RoomBulkEditForm(forms.Form):
+    """
+    One price and/or availability change for many of the owner's rooms
+    (rates.py): picked rooms, one room type, or all of them. A later
+    effective date schedules the price change instead.
+    """
+    PRICE_MODE_CHOICES = [('', 'No price change')] + ScheduledRateChange.MODE_CHOICES
+    AVAILABILITY_CHOICES = [
+        ('', 'No availability change'),
+        ('available', 'Ready for booking'),
+        ('unavailable', 'Not available'),
+    ]
+
+    # Ticked in the room table
+    rooms = forms.ModelMultipleChoiceField(queryset=Room.objects.none(), required=False)
+    room_type = forms.ChoiceField(
+        required=False,
+        label='Rooms',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    price_mode = forms.ChoiceField(
+        choices=PRICE_MODE_CHOICES,
+        required=False,
+        label='Price',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    amount = forms.DecimalField(
+        required=False,
+        max_digits=8,
+        decimal_places=2,
+        label='Amount',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'e.g. 1500, -200 or 10 (%)'})
+    )
+    availability = forms.ChoiceField(
+        choices=AVAILABILITY_CHOICES,
+        required=False,
+        label='Availability',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    effective_on = forms.DateField(
+        required=False,
+        label='From',
+        help_text='Leave empty to apply now. A later date schedules the price change.',
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.hotel = kwargs.pop('hotel', None)
+        super().__init__(*args, **kwargs)
+        rooms = Room.objects.filter(hotel=self.hotel)
+        self.fields['rooms'].queryset = rooms
+        room_types = rooms.order_by('room_type').values_list('room_type', flat=True).distinct()
+        self.fields['room_type'].choices = [('', 'All rooms')] + [(room_type, room_type) for room_type in room_types]
+
+    def is_scheduled(self):
+        effective_on = self.cleaned_data.get('effective_on')
+        return effective_on is not None and effective_on > timezone.localdate()
+
+    def available(self):
+        """True/False for an availability change, None for none."""
+        return {'available': True, 'unavailable': False}.get(self.cleaned_data.get('availability'))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        price_mode = cleaned_data.get('price_mode')
+        amount = cleaned_data.get('amount')
+        effective_on = cleaned_data.get('effective_on')
+
+        if not price_mode and not cleaned_data.get('availability'):
+            raise ValidationError("Choose a price or an availability change.")
+        if price_mode:
+            if amount is None:
+                self.add_error('amount', "Enter the amount of the price change.")
+            elif price_mode == 'set' and amount <= 0:
+                self.add_error('amount', "The new price must be above zero.")
+            elif price_mode == 'percent' and amount <= -100:
+                self.add_error('amount', "A price can't drop by 100% or more.")
+
+        if effective_on is not None and effective_on < timezone.localdate():
+            self.add_error('effective_on', "Pick today or a later date.")
+        elif self.is_scheduled():
+            if cleaned_data.get('availability'):
+                raise ValidationError("Only price changes can be scheduled, change the availability separately.")
+            if cleaned_data.get('rooms'):
+                raise ValidationError("A scheduled change applies to all rooms or to one room type, not to picked rooms.")
+        return cleaned_data
+
 class RoomSearchForm(forms.Form):
-    """Form with a single field for searching across multiple room attributes."""
+    """Free-text search plus structured filters (see facets.py)."""
     
     query = forms.CharField(
         max_length=100,
@@ -50,7 +192,123 @@ class RoomSearchForm(forms.Form):
         label='Search Rooms',
         # 🌟 ADD THIS: Set the Bootstrap class for proper rendering 🌟
         widget=forms.TextInput(attrs={
-            'placeholder': 'Enter place, room number, type, or max price...',
+            'placeholder': 'Enter place, hotel, room number or type...',
             'class': 'form-control' # <--- CRITICAL ADDITION
         })
-    )
\ No newline at end of file
+    )
+
+    SORT_CHOICES = [
+        ('', 'Best match'),
+        ('rating', 'Top rated'),
+        ('distance', 'Nearest'),
+    ]
+
+    sort = forms.ChoiceField(
+        choices=SORT_CHOICES,
+        required=False,
+        label='Sort by',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
+    # Optional stay: only rooms free for every night in between are shown
+    check_in = forms.DateField(
+        required=False,
+        label='Check-in',
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    check_out = forms.DateField(
+        required=False,
+        label='Check-out',
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+
+    # Structured filters, also set by the facet links on the results page
+    min_price = forms.DecimalField(
+        required=False,
+        min_value=0,
+        max_digits=8,
+        decimal_places=2,
+        label='Min price',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Min ₹'})
+    )
+    max_price = forms.DecimalField(
+        required=False,
+        min_value=0,
+        max_digits=8,
+        decimal_places=2,
+        label='Max price',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Max ₹'})
+    )
+    guests = forms.IntegerField(
+        required=False,
+        min_value=1,
+        label='Guests',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Guests'})
+    )
+    place = forms.CharField(max_length=100, required=False, widget=forms.HiddenInput)
+    room_type = forms.CharField(max_length=50, required=False, widget=forms.HiddenInput)
+
+    RATING_CHOICES = [
+        ('', 'Any rating'),
+        (4, '4+ stars'),
+        (3, '3+ stars'),
+        (2, '2+ stars'),
+    ]
+
+    min_rating = forms.TypedChoiceField(
+        choices=RATING_CHOICES,
+        coerce=int,
+        empty_value=None,
+        required=False,
+        label='Rating',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
+    # "Near me": set by the location button on the results page (see geo.py)
+    lat = forms.FloatField(required=False, min_value=-90, max_value=90, widget=forms.HiddenInput)
+    lng = forms.FloatField(required=False, min_value=-180, max_value=180, widget=forms.HiddenInput)
+
+    RADIUS_CHOICES = [
+        ('', 'Nearest hotels'),
+        (5, 'Within 5 km'),
+        (10, 'Within 10 km'),
+        (25, 'Within 25 km'),
+        (50, 'Within 50 km'),
+        (100, 'Within 100 km'),
+    ]
+
+    radius_km = forms.TypedChoiceField(
+        choices=RADIUS_CHOICES,
+        coerce=int,
+        empty_value=None,
+        required=False,
+        label='Distance',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        check_in = cleaned_data.get('check_in')
+        check_out = cleaned_data.get('check_out')
+        min_price = cleaned_data.get('min_price')
+        max_price = cleaned_data.get('max_price')
+
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise ValidationError("The minimum price can't be above the maximum price.")
+
+        lat = cleaned_data.get('lat')
+        lng = cleaned_data.get('lng')
+        if (lat is None) != (lng is None):
+            raise ValidationError("Please give both a latitude and a longitude.")
+        if lat is None and cleaned_data.get('sort') == 'distance':
+            # Without a location there is nothing to sort by, fall back to the default
+            cleaned_data['sort'] = ''
+
+        if bool(check_in) != bool(check_out):
+            raise ValidationError("Please enter both a check-in and a check-out date.")
+        if check_in and check_out:
+            try:
+                validate_stay(check_in, check_out)
+            except ValueError as e:
+                raise ValidationError(str(e))
+        return cleaned_data
\ No newline at end of file
@@ -0,0 +1,300 @@
+"""
+"Near me" search without GIS extensions.
+
+Every hotel with coordinates stores the geohash of its location
+(Hotel.geohash, indexed). A geohash prefix is a grid cell, and all hotels
+in a cell are one range scan on that index:  prefix <= geohash <= prefix+'zzz'.
+A radius search reads the few cells covering the box around the circle, at
+the finest precision that keeps them under MAX_COVER_CELLS, and then keeps
+the hotels whose exact (haversine) distance is within the radius. Searches
+start with a small circle and double it until enough hotels are found, so
+nearest-N is a radius search too.
+
+Coordinates come from an offline gazetteer (CSV: name, latitude, longitude),
+see load_gazetteer() and the geocode_hotels command.
+"""
+import csv
+import heapq
+import math
+import os
+import re
+
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+from login_app.models import Hotel
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Precision stored on Hotel.geohash (about 5m)
+STORE_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+# Most hotels a location search returns (nearest first)
+MAX_NEARBY_HOTELS = getattr(settings, 'GEO_MAX_NEARBY_HOTELS', 500)
+# Most geohash ranges one query reads
+MAX_COVER_CELLS = 36
+# First radius tried before widening the search
+NEAREST_START_KM = 2
+
+DEFAULT_GAZETTEER = os.path.join(os.path.dirname(__file__), 'data', 'gazetteer.csv')
+
+
+# --- Geohash ---
+
+def encode(latitude, longitude, precision=STORE_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = (value << 1) | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a cell in degrees."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def _box_size(latitude, radius_km):
+    """Half height and half width, in degrees, of the box around a circle."""
+    dlat = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(min(abs(latitude) + dlat, 90.0)))
+    dlng = 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (KM_PER_DEGREE * cos_lat))
+    return dlat, dlng
+
+
+def cover(latitude, longitude, radius_km):
+    """
+    Cells covering the box around the circle: the finest precision that needs
+    at most MAX_COVER_CELLS of them. Empty when only the whole map will do.
+    """
+    dlat, dlng = _box_size(latitude, radius_km)
+    if dlng >= 180.0:
+        return []
+    south, north = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+    for precision in range(STORE_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(north / height) - math.floor(south / height) + 1
+        columns = math.floor((longitude + dlng) / width) - math.floor((longitude - dlng) / width) + 1
+        if rows * columns > MAX_COVER_CELLS:
+            continue
+        # A point in every row and column of cells, edges included
+        lats = [south + row * height for row in range(rows)] + [north]
+        lngs = [longitude - dlng + column * width for column in range(columns)] + [longitude + dlng]
+        cells = {encode(lat, (lng + 180.0) % 360.0 - 180.0, precision) for lat in lats for lng in lngs}
+        return sorted(cells)
+    return []
+
+
+def _next_cell(cell):
+    """The cell right after `cell` in geohash order (same precision), or None at the end."""
+    index = BASE32.index(cell[-1])
+    if index + 1 < len(BASE32):
+        return cell[:-1] + BASE32[index + 1]
+    following = _next_cell(cell[:-1]) if len(cell) > 1 else None
+    return following and following + BASE32[0]
+
+
+def cell_ranges(cells):
+    """(first, last) geohash bounds of the runs of consecutive cells in `cells`."""
+    ranges = []
+    for cell in sorted(cells):
+        if ranges and _next_cell(ranges[-1][1]) == cell:
+            ranges[-1][1] = cell
+        else:
+            ranges.append([cell, cell])
+    return [(first, last + 'z' * (STORE_PRECISION - len(last))) for first, last in ranges]
+
+
+def cells_filter(cells):
+    """Q matching hotels inside any of `cells` (a range scan per run of cells on the geohash index)."""
+    condition = Q()
+    for first, last in cell_ranges(cells):
+        condition |= Q(geohash__gte=first, geohash__lte=last)
+    return condition
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def distance_expression(latitude, longitude, prefix=''):
+    """
+    distance_km() as an ORM expression on the `prefix`latitude/longitude
+    columns (e.g. prefix='hotel__'), for annotating and ordering querysets.
+    """
+    lat = Radians(F(f'{prefix}latitude'))
+    lng = Radians(F(f'{prefix}longitude'))
+    phi = math.radians(latitude)
+    a = (
+        Power(Sin((lat - Value(phi)) / 2), 2)
+        + Value(math.cos(phi)) * Cos(lat) * Power(Sin((lng - Value(math.radians(longitude))) / 2), 2)
+    )
+    return ExpressionWrapper(Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(a)), output_field=FloatField())
+
+
+# --- Searches ---
+
+def _bounding_box(latitude, longitude, radius_km):
+    """Q for the lat/lng box around the circle, so far corners of the cells stay in the database."""
+    dlat, dlng = _box_size(latitude, radius_km)
+    condition = Q(latitude__range=(latitude - dlat, latitude + dlat))
+    if dlng < 180.0 and -180.0 <= longitude - dlng and longitude + dlng <= 180.0:
+        condition &= Q(longitude__range=(longitude - dlng, longitude + dlng))
+    return condition
+
+
+def _candidates(latitude, longitude, radius_km):
+    """(id, latitude, longitude) of the hotels in the cells and box around the circle."""
+    hotels = Hotel.objects.exclude(geohash='').filter(_bounding_box(latitude, longitude, radius_km))
+    cells = cover(latitude, longitude, radius_km)
+    if cells:
+        hotels = hotels.filter(cells_filter(cells))
+    return hotels.values_list('id', 'latitude', 'longitude')
+
+
+def _in_radius(rows, latitude, longitude, radius_km):
+    found = []
+    for hotel_id, lat, lng in rows:
+        distance = distance_km(latitude, longitude, lat, lng)
+        if distance <= radius_km:
+            found.append((distance, hotel_id))
+    return found
+
+
+def _within(latitude, longitude, radius_km):
+    """(distance, hotel_id) of every hotel within the radius."""
+    return _in_radius(_candidates(latitude, longitude, radius_km), latitude, longitude, radius_km)
+
+
+async def _awithin(latitude, longitude, radius_km):
+    rows = [row async for row in _candidates(latitude, longitude, radius_km)]
+    return _in_radius(rows, latitude, longitude, radius_km)
+
+
+def hotels_within(latitude, longitude, radius_km, limit=MAX_NEARBY_HOTELS):
+    """
+    {hotel_id: distance_km} for the (at most `limit`) nearest hotels within
+    the radius. Searches a small circle first and doubles it until `limit`
+    hotels are found, so a dense city doesn't read every hotel in the radius.
+    """
+    radius = min(NEAREST_START_KM, radius_km)
+    while True:
+        found = _within(latitude, longitude, radius)
+        # Fewer than `limit` inside: nearer ones can't be outside, but more can
+        if len(found) >= limit or radius >= radius_km:
+            return {hotel_id: distance for distance, hotel_id in heapq.nsmallest(limit, found)}
+        radius = min(radius * 2, radius_km)
+
+
+async def ahotels_within(latitude, longitude, radius_km, limit=MAX_NEARBY_HOTELS):
+    """hotels_within() for async views, read with the async ORM."""
+    radius = min(NEAREST_START_KM, radius_km)
+    while True:
+        found = await _awithin(latitude, longitude, radius)
+        if len(found) >= limit or radius >= radius_km:
+            return {hotel_id: distance for distance, hotel_id in heapq.nsmallest(limit, found)}
+        radius = min(radius * 2, radius_km)
+
+
+def nearest_hotels(latitude, longitude, count=MAX_NEARBY_HOTELS, max_km=None):
+    """{hotel_id: distance_km} for the `count` hotels nearest to the point (within `max_km`)."""
+    return hotels_within(latitude, longitude, max_km or math.pi * EARTH_RADIUS_KM, count)
+
+
+async def anearest_hotels(latitude, longitude, count=MAX_NEARBY_HOTELS, max_km=None):
+    return await ahotels_within(latitude, longitude, max_km or math.pi * EARTH_RADIUS_KM, count)
+
+
+# --- Gazetteer ---
+
+def normalize_place(name):
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', name or '')).strip().lower()
+
+
+def load_gazetteer(path=None):
+    """
+    {normalized place name: (latitude, longitude)} from a CSV/TSV file with
+    name, latitude and longitude columns (lat/lng or lon also accepted).
+    """
+    path = path or getattr(settings, 'GEO_GAZETTEER_PATH', DEFAULT_GAZETTEER)
+    with open(path, newline='', encoding='utf-8') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        reader = csv.DictReader(f, dialect=csv.Sniffer().sniff(sample, delimiters=',\t;'))
+        columns = {name.strip().lower(): name for name in reader.fieldnames or ()}
+        try:
+            name_col = columns['name']
+            lat_col = columns.get('latitude') or columns['lat']
+            lng_col = columns.get('longitude') or columns.get('lng') or columns['lon']
+        except KeyError:
+            raise ValueError(f"{path} needs name, latitude and longitude columns")
+        places = {}
+        for row in reader:
+            try:
+                coords = float(row[lat_col]), float(row[lng_col])
+            except (TypeError, ValueError):
+                continue
+            # The first entry wins, list the best known place of a name first
+            places.setdefault(normalize_place(row[name_col]), coords)
+    return places
+
+
+def locate(hotel, gazetteer):
+    """(latitude, longitude) for a hotel from its place, else from parts of its address."""
+    candidates = [hotel.place] + [part for part in reversed((hotel.address or '').split(','))]
+    for candidate in candidates:
+        coords = gazetteer.get(normalize_place(candidate))
+        if coords:
+            return coords
+    return None
+
+
+def geocode_hotels(gazetteer, overwrite=False, batch_size=500):
+    """
+    Fills in hotel coordinates from the gazetteer, batch_size hotels per
+    bulk_update. Returns (located, not_found).
+    """
+    hotels = Hotel.objects.only('id', 'place', 'address', 'latitude', 'longitude', 'geohash').order_by('pk')
+    if not overwrite:
+        hotels = hotels.filter(Q(latitude__isnull=True) | Q(longitude__isnull=True))
+
+    located = not_found = 0
+    batch = []
+    for hotel in hotels.iterator(chunk_size=batch_size):
+        coords = locate(hotel, gazetteer)
+        if coords is None:
+            not_found += 1
+            continue
+        hotel.latitude, hotel.longitude = coords
+        hotel.geohash = encode(*coords)
+        batch.append(hotel)
+        if len(batch) >= batch_size:
+            Hotel.objects.bulk_update(batch, ['latitude', 'longitude', 'geohash'])
+            located += len(batch)
+            batch = []
+    if batch:
+        Hotel.objects.bulk_update(batch, ['latitude', 'longitude', 'geohash'])
+        located += len(batch)
+    return located, not_found
@@ -0,0 +1,93 @@
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+from .models import Room
+
+# Widths generated for every photo (never upscaled past the original)
+VARIANT_WIDTHS = (320, 640, 1024)
+
+# Output formats in order of preference; the browser picks the first it supports.
+# AVIF/WebP are skipped when Pillow was built without them.
+VARIANT_FORMATS = (
+    ('avif', 'AVIF', {'quality': 50}),
+    ('webp', 'WEBP', {'quality': 75, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+)
+
+VARIANT_DIR = 'room_photos/variants'
+
+# Uploads are processed here, off the request thread
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='room-photos')
+
+
+def supported_formats():
+    return [
+        (ext, pil_format, options)
+        for ext, pil_format, options in VARIANT_FORMATS
+        if ext == 'jpeg' or features.check(ext)
+    ]
+
+
+def generate_variants(photo_name):
+    """
+    Builds every size/format of a stored photo and returns the variants dict
+    saved on Room.photo_variants. File names carry a hash of the original's
+    content, so re-processing the same photo (or the same photo uploaded
+    twice) reuses the files already in storage.
+    Touches only the storage, never the database (safe in a process pool).
+    """
+    with default_storage.open(photo_name, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+
+    image = Image.open(io.BytesIO(data))
+    # Respect camera rotation before it gets stripped from the copies
+    image = ImageOps.exif_transpose(image)
+    original_width = image.width
+
+    widths = [width for width in VARIANT_WIDTHS if width < original_width] or [original_width]
+
+    variants = {}
+    for ext, pil_format, options in supported_formats():
+        variants[ext] = []
+        for width in widths:
+            name = f"{VARIANT_DIR}/{digest}-{width}w.{ext}"
+            if not default_storage.exists(name):
+                resized = image.copy()
+                resized.thumbnail((width, width * 10), Image.LANCZOS)
+                if pil_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+                    resized = resized.convert('RGB')
+                buffer = io.BytesIO()
+                resized.save(buffer, format=pil_format, **options)
+                name = default_storage.save(name, ContentFile(buffer.getvalue()))
+            variants[ext].append([width, name])
+    return variants
+
+
+def save_variants(room_id, photo_name, variants):
+    # Only if the photo wasn't replaced while we were working on it
+    return Room.objects.filter(pk=room_id, photo=photo_name).update(photo_variants=variants)
+
+
+def process_room_photo(room_id, photo_name):
+    try:
+        save_variants(room_id, photo_name, generate_variants(photo_name))
+    except Exception as e:
+        # The room keeps serving its original photo; the backfill command retries
+        print(f"ROOM PHOTO PROCESSING ERROR ({room_id}): {e}")
+    finally:
+        close_old_connections()
+
+
+def schedule_room_photo(room):
+    """Queues variant generation for a room's newly uploaded photo, after commit."""
+    if not room.photo:
+        return
+    room_id, photo_name = room.pk, room.photo.name
+    transaction.on_commit(lambda: _executor.submit(process_room_photo, room_id, photo_name))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ho_ho_hotel_app import rates
+
+
+class Command(BaseCommand):
+    help = "Applies the scheduled room price changes that are due (run from cron, at least daily)."
+
+    def handle(self, *args, **options):
+        count = rates.apply_due_changes()
+        self.stdout.write(self.style.SUCCESS(f"Processed {count} scheduled rate changes."))
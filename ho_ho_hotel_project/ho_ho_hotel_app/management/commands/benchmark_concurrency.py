@@ -0,0 +1,120 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.utils import timezone
+
+from ho_ho_hotel_app import benchmark
+
+from .benchmark_funnel import git_commit
+
+DATASET_OPTIONS = ('hotels', 'rooms_per_hotel', 'users', 'reviews', 'favourites', 'payments')
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database and measures the throughput of the search, room "
+        "detail and favourite pages under the WSGI and the ASGI handler, with many requests "
+        "in flight. Prints JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=benchmark.SERVERS + ('both',), default='both',
+                            help="'both' runs each server in its own process (ASGI with ASYNC_VIEWS on).")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[64],
+                            help="Requests in flight; one run per value.")
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per run.")
+        parser.add_argument('--warmup', type=int, default=100, help="Untimed requests sent first.")
+        parser.add_argument('--hotels', type=int, default=20)
+        parser.add_argument('--rooms-per-hotel', type=int, default=20)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--reviews', type=int, default=1000)
+        parser.add_argument('--favourites', type=int, default=1000)
+        parser.add_argument('--payments', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the dataset and the requests.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options['server'] == 'both':
+            runs = []
+            for server in benchmark.SERVERS:
+                self.stderr.write(f"Benchmarking {server.upper()}...")
+                report = self.run_in_process(server, options)
+                dataset = report['dataset']
+                runs.extend(report['runs'])
+        else:
+            dataset, runs = self.run_here(options)
+
+        report = {
+            'commit': git_commit(),
+            'run_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'cache': settings.CACHES['default']['BACKEND'],
+            },
+            'options': {key: options[key] for key in ('server', 'concurrency', 'requests', 'warmup', 'seed')},
+            'dataset': dataset,
+            'runs': runs,
+            'asgi_vs_wsgi': self.compare(runs),
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def run_here(self, options):
+        # Same isolation as the test runner: a separate test database, DEBUG off
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            self.stderr.write("Seeding dataset...")
+            dataset = benchmark.seed_dataset(**{key: options[key] for key in DATASET_OPTIONS}, seed=options['seed'])
+            runs = []
+            for concurrency in options['concurrency']:
+                self.stderr.write(f"{options['requests']} requests, {concurrency} in flight...")
+                runner = benchmark.ConcurrencyRunner(options['server'], concurrency, seed=options['seed'])
+                elapsed = runner.run(options['requests'], warmup=options['warmup'])
+                runs.append(benchmark.summarize_concurrency(runner, elapsed))
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        return dataset, runs
+
+    def run_in_process(self, server, options):
+        """
+        Runs this command for one server in a new process: the URLconf picks
+        the sync or async views when it's loaded (ASYNC_VIEWS), once per process.
+        """
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_concurrency',
+            '--server', server, '--concurrency', *map(str, options['concurrency']),
+        ]
+        for key in DATASET_OPTIONS + ('requests', 'warmup', 'seed'):
+            command += [f"--{key.replace('_', '-')}", str(options[key])]
+        env = {**os.environ, 'ASYNC_VIEWS': str(server == 'asgi')}
+        result = subprocess.run(command, env=env, capture_output=True, text=True)
+        self.stderr.write(result.stderr, ending='')
+        if result.returncode:
+            raise CommandError(f"The {server} benchmark failed.")
+        return json.loads(result.stdout)
+
+    def compare(self, runs):
+        """ASGI requests/s divided by WSGI requests/s, per concurrency."""
+        throughput = {(run['server'], run['concurrency']): run['requests_per_s'] for run in runs}
+        return {
+            str(concurrency): round(throughput[('asgi', concurrency)] / throughput[('wsgi', concurrency)], 2)
+            for server, concurrency in throughput
+            if server == 'wsgi' and throughput.get(('asgi', concurrency)) and throughput[('wsgi', concurrency)]
+        }
@@ -0,0 +1,85 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.utils import timezone
+
+from ho_ho_hotel_app import benchmark
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database with a synthetic dataset and benchmarks the "
+        "search -> detail -> checkout -> verify funnel (Razorpay stubbed). Prints JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotels', type=int, default=20)
+        parser.add_argument('--rooms-per-hotel', type=int, default=20)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--reviews', type=int, default=1000)
+        parser.add_argument('--favourites', type=int, default=1000)
+        parser.add_argument('--payments', type=int, default=500)
+        parser.add_argument('--iterations', type=int, default=200, help="Funnels to run.")
+        parser.add_argument('--warmup', type=int, default=20, help="Untimed funnels run first.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the dataset and the funnel.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        # Same isolation as the test runner: a separate test database, DEBUG off
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            self.stderr.write("Seeding dataset...")
+            dataset = benchmark.seed_dataset(
+                hotels=options['hotels'],
+                rooms_per_hotel=options['rooms_per_hotel'],
+                users=options['users'],
+                reviews=options['reviews'],
+                favourites=options['favourites'],
+                payments=options['payments'],
+                seed=options['seed'],
+            )
+            self.stderr.write(f"Running {options['iterations']} funnels...")
+            runner = benchmark.FunnelRunner(seed=options['seed'])
+            elapsed = runner.run(options['iterations'], warmup=options['warmup'])
+            results = benchmark.summarize(runner, elapsed)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'commit': git_commit(),
+            'run_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'cache': settings.CACHES['default']['BACKEND'],
+            },
+            'options': {key: options[key] for key in ('iterations', 'warmup', 'seed')},
+            'dataset': dataset,
+            **results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from ho_ho_hotel_app import benchmark, query_plans
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN on every hot queryset and fails if any of them reads a whole "
+        "table instead of using an index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', action='store_true',
+                            help="Explain against a throwaway test database seeded with the "
+                                 "benchmark dataset, so the planner sees realistic table sizes.")
+        parser.add_argument('--min-rows', type=int, default=0,
+                            help="Ignore full scans of tables with fewer rows than this.")
+        parser.add_argument('--show-plans', action='store_true', help="Print every plan.")
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            setup_test_environment(debug=False)
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+            try:
+                benchmark.seed_dataset()
+                results = query_plans.check_all(options['min_rows'])
+            finally:
+                teardown_databases(old_config, verbosity=0)
+                teardown_test_environment()
+        else:
+            results = query_plans.check_all(options['min_rows'])
+
+        failures = 0
+        for name, scans, plan in results:
+            if scans:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {name}: {', '.join(scans)}"))
+            else:
+                self.stdout.write(f"ok         {name}")
+            if options['show_plans'] or scans:
+                self.stdout.write(f"{plan}\n")
+
+        if failures:
+            raise CommandError(f"{failures} of {len(results)} hot queries do a full table scan.")
+        self.stdout.write(self.style.SUCCESS(f"All {len(results)} hot queries use an index."))
@@ -0,0 +1,54 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ho_ho_hotel_app import images
+from ho_ho_hotel_app.models import Room
+
+
+def _init_worker():
+    # Needed when the pool spawns fresh interpreters instead of forking
+    django.setup()
+
+
+def _generate(room_id, photo_name):
+    return room_id, photo_name, images.generate_variants(photo_name)
+
+
+class Command(BaseCommand):
+    help = "Generates resized WebP/AVIF/JPEG variants for room photos, using a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Regenerate variants for every photo, not only the missing ones.")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Worker processes (defaults to the number of CPUs).")
+
+    def handle(self, *args, **options):
+        rooms = Room.objects.exclude(photo='').exclude(photo__isnull=True)
+        if not options['all']:
+            rooms = rooms.filter(photo_variants={})
+        todo = list(rooms.values_list('id', 'photo'))
+        if not todo:
+            self.stdout.write("No room photos to process.")
+            return
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = [pool.submit(_generate, room_id, photo_name) for room_id, photo_name in todo]
+            for future in as_completed(futures):
+                try:
+                    room_id, photo_name, variants = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"Failed: {e}")
+                    continue
+                images.save_variants(room_id, photo_name, variants)
+                done += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} photos ({failed} failed)."))
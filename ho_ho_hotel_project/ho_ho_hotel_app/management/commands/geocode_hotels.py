@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ho_ho_hotel_app import caching, geo
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills in hotel latitude/longitude (and geohash) by looking up each hotel's "
+        "place, then the parts of its address, in an offline gazetteer file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gazetteer',
+                            help="CSV/TSV file with name, latitude and longitude columns "
+                                 "(default: settings.GEO_GAZETTEER_PATH or the bundled list).")
+        parser.add_argument('--all', action='store_true',
+                            help="Also re-geocode hotels that already have coordinates.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            gazetteer = geo.load_gazetteer(options['gazetteer'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        located, not_found = geo.geocode_hotels(
+            gazetteer, overwrite=options['all'], batch_size=options['batch_size']
+        )
+        if located:
+            # bulk_update sends no signals: drop cached searches by hand
+            caching.bump('catalog')
+        self.stdout.write(self.style.SUCCESS(
+            f"{located} hotels geocoded from {len(gazetteer)} gazetteer places."
+        ))
+        if not_found:
+            self.stdout.write(self.style.WARNING(
+                f"{not_found} hotels matched no gazetteer place; set their coordinates in the admin."
+            ))
@@ -0,0 +1,38 @@
+import json
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ho_ho_hotel_app import bulk_rooms
+from login_app.models import Hotel
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds rooms to a hotel from a CSV or JSON file, in the format of the owner's room "
+        "export. Rows with errors are skipped and reported (JSON)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('hotel_id', help="The hotel's id (a UUID).")
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=bulk_rooms.FORMATS,
+                            help="Default: from the file extension.")
+        parser.add_argument('--batch-size', type=int, default=bulk_rooms.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Only validate the file.")
+
+    def handle(self, *args, **options):
+        try:
+            hotel = Hotel.objects.get(pk=uuid.UUID(options['hotel_id']))
+        except (ValueError, Hotel.DoesNotExist):
+            raise CommandError(f"No hotel with id {options['hotel_id']}.")
+        fmt = options['format'] or bulk_rooms.format_for(options['path'])
+        with open(options['path'], 'rb') as f:
+            try:
+                result = bulk_rooms.import_rooms(
+                    hotel, bulk_rooms.read_rows(f, fmt),
+                    batch_size=options['batch_size'], dry_run=options['dry_run'],
+                )
+            except bulk_rooms.ImportFileError as e:
+                raise CommandError(str(e))
+        self.stdout.write(json.dumps(result.as_dict(), indent=2))
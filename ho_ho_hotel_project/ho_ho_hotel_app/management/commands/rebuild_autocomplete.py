@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ho_ho_hotel_app import autocomplete
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the search box suggestions from the Hotel and Room tables and "
+        "writes the snapshot the workers load them from."
+    )
+
+    def handle(self, *args, **options):
+        count = autocomplete.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} suggestions written to {autocomplete.snapshot_path()}."
+        ))
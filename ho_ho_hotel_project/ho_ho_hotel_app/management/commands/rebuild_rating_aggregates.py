@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ho_ho_hotel_app import ratings
+
+
+class Command(BaseCommand):
+    help = "Recomputes review_count/rating_sum/rating_avg on every Room and Hotel from the reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rooms, hotels = ratings.rebuild_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rating aggregates rebuilt ({rooms} rooms and {hotels} hotels corrected)."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ho_ho_hotel_app import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the room search index from the Room and Hotel tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} rooms."))
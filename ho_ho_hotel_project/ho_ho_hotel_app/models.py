@@ -34,6 +34,15 @@ class Room(models.Model):
         help_text="Upload a photo of the room."
     )
 
+    # Resized WebP/AVIF/JPEG copies of `photo`, filled in by images.py:
+    # {"webp": [[320, "room_photos/variants/<hash>-320w.webp"], ...], ...}
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Denormalized review aggregates, kept up to date by ratings.py
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+
     def get_absolute_url(self):
         # Assuming your URL pattern for a single room is named 'room_detail' 
         # and takes the room's ID as a keyword argument.
@@ -42,6 +51,14 @@ class Room(models.Model):
     class Meta:
         # Ensures no two rooms have the same number within the same hotel
         unique_together = ('hotel', 'room_number') 
+        indexes = [
+            # Search results: available rooms, cheapest first (InnoDB appends the pk)
+            models.Index(fields=['is_available', 'price_per_night', 'room_number'], name='room_avail_price_idx'),
+            # The same for SQLite, which can't match its bare boolean WHERE against
+            # the index above but does match a partial index (MySQL skips this one)
+            models.Index(fields=['price_per_night', 'room_number', 'id'], condition=models.Q(is_available=True),
+                         name='room_available_price_idx'),
+        ]
         verbose_name = "Hotel Room"
         verbose_name_plural = "Hotel Rooms"
 
@@ -126,3 +143,62 @@ class Review(models.Model):
             return f"Review by {self.user.username} for Room {self.room.room_number} ({self.rating} stars)"
         except AttributeError:
             return f"Review object {self.id}"
+
+class SearchToken(models.Model):
+    # One row per (room, term): the inverted index behind room search.
+    # Hotel-level text (name, place) is copied onto every room of the hotel
+    # so a search never has to join back to Hotel to rank results.
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='search_tokens')
+    term = models.CharField(max_length=50, db_index=True)
+
+    # Summed field weights for this term in this room (see search.FIELD_WEIGHTS)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        verbose_name = "Search Token"
+        verbose_name_plural = "Search Tokens"
+        unique_together = ('room', 'term')
+
+    def __str__(self):
+        return f"{self.term} -> {self.room_id} ({self.weight})"
+
+
+class ScheduledRateChange(models.Model):
+    # A bulk price change an owner dated in the future. The apply_rate_changes
+    # command (run from cron) applies it on that day, see rates.py.
+    MODE_CHOICES = [
+        ('set', 'Set price to'),
+        ('add', 'Add to price'),
+        ('percent', 'Change price by %'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('APPLIED', 'Applied'),
+        ('FAILED', 'Failed'),
+    ]
+
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, related_name='rate_changes')
+    # Blank: every room of the hotel
+    room_type = models.CharField(max_length=50, blank=True)
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES)
+    amount = models.DecimalField(max_digits=8, decimal_places=2)
+    effective_on = models.DateField()
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    rooms_updated = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Why a FAILED change wasn't applied (e.g. a price would drop to zero)
+    error = models.CharField(max_length=255, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ('effective_on', 'created_at')
+        verbose_name = "Scheduled Rate Change"
+        indexes = [
+            # apply_rate_changes: pending changes that are due
+            models.Index(fields=['status', 'effective_on'], name='ratechange_status_due_idx'),
+        ]
+
+    def __str__(self):
+        rooms = self.room_type or "all rooms"
+        return f"{self.get_mode_display()} {self.amount} for {rooms} on {self.effective_on} ({self.status})"
@@ -0,0 +1,202 @@
+"""
+Keyset ("cursor") pagination.
+
+Instead of OFFSET n, a page is fetched with a WHERE on the ordering columns of
+the last row already shown, so page 50 costs the same as page 1 and no
+COUNT(*) is needed. The position is handed to the browser as an opaque, signed
+token in ?cursor=.
+"""
+import datetime
+import decimal
+import uuid
+
+from django.core import signing
+from django.db.models import Q
+from django.http import Http404
+
+CURSOR_SALT = 'ho_ho_hotel_app.pagination'
+
+
+class InvalidCursor(Exception):
+    """Raised for tokens that were tampered with or belong to another ordering."""
+
+
+def _to_json(value):
+    # Full precision: DjangoJSONEncoder drops microseconds, which would skip rows
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+def encode_cursor(values, backwards=False):
+    return signing.dumps(
+        {'v': [_to_json(value) for value in values], 'b': backwards},
+        salt=CURSOR_SALT,
+        compress=True,
+    )
+
+
+def decode_cursor(token):
+    """Returns (values, backwards). The values are strings the ORM converts back."""
+    try:
+        data = signing.loads(token, salt=CURSOR_SALT)
+        return list(data['v']), bool(data['b'])
+    except (signing.BadSignature, KeyError, TypeError):
+        raise InvalidCursor(token)
+
+
+class CursorPage:
+    """What the templates see as page_obj."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    """
+    Paginates `queryset` on `ordering` (defaults to the queryset's own order_by).
+    The primary key is appended as a tie-breaker so the ordering is total.
+    Ordering entries must be plain field or annotation names, not expressions.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering)
+        if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+            ordering.append('pk')
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+
+    def _value(self, obj, field):
+        for attr in field.lstrip('-').split('__'):
+            obj = getattr(obj, attr)
+        return obj
+
+    def _keyset(self, values, backwards):
+        """Rows strictly after `values` in the ordering (before, when backwards)."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def cursor_for(self, obj, backwards=False):
+        """The cursor pointing just past `obj` (just before it, when backwards)."""
+        return encode_cursor([self._value(obj, field) for field in self.ordering], backwards)
+
+    def window(self, cursor=None):
+        """
+        Forward-only alternative to page() for streaming responses: a queryset
+        of the per_page + 1 rows after `cursor`. The extra row, if it comes,
+        means there is a next page starting at cursor_for(the last row shown).
+        """
+        queryset = self.queryset
+        if cursor:
+            values, backwards = decode_cursor(cursor)
+            if backwards or len(values) != len(self.ordering):
+                raise InvalidCursor(cursor)
+            queryset = queryset.filter(self._keyset(values, False))
+        return queryset.order_by(*self.ordering)[:self.per_page + 1]
+
+    def _page_queryset(self, cursor):
+        """(queryset of the rows of the page plus one, backwards) for page()/apage()."""
+        backwards = False
+        queryset = self.queryset
+
+        if cursor:
+            values, backwards = decode_cursor(cursor)
+            if len(values) != len(self.ordering):
+                raise InvalidCursor(cursor)
+            queryset = queryset.filter(self._keyset(values, backwards))
+
+        if backwards:
+            # Walk the reversed ordering, then flip the rows back
+            ordering = [field[1:] if field.startswith('-') else f"-{field}" for field in self.ordering]
+        else:
+            ordering = self.ordering
+
+        # One extra row tells whether there is anything beyond this page
+        return queryset.order_by(*ordering)[:self.per_page + 1], backwards
+
+    def _make_page(self, rows, cursor, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return CursorPage([])
+
+        first = [self._value(rows[0], field) for field in self.ordering]
+        last = [self._value(rows[-1], field) for field in self.ordering]
+        # Coming from a cursor means there is a page on the side we came from
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else bool(cursor)
+
+        return CursorPage(
+            rows,
+            next_cursor=encode_cursor(last) if has_next else None,
+            previous_cursor=encode_cursor(first, backwards=True) if has_previous else None,
+        )
+
+    def page(self, cursor=None):
+        queryset, backwards = self._page_queryset(cursor)
+        return self._make_page(list(queryset), cursor, backwards)
+
+    async def apage(self, cursor=None):
+        """page() for async views: the rows are read with the async ORM."""
+        queryset, backwards = self._page_queryset(cursor)
+        return self._make_page([row async for row in queryset], cursor, backwards)
+
+
+class CursorPaginationMixin:
+    """
+    Swaps ListView's OFFSET paginator for CursorPaginator.
+    Templates link pages with {% querystring cursor=page_obj.next_cursor %}.
+    """
+    cursor_param = 'cursor'
+    # Defaults to the queryset's ordering
+    cursor_ordering = None
+
+    def get_cursor_paginator(self, queryset, page_size):
+        return CursorPaginator(queryset, page_size, self.cursor_ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_param))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor.")
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """paginate_queryset() with CursorPaginator.apage(), for async views."""
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        try:
+            page = await paginator.apage(self.request.GET.get(self.cursor_param))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor.")
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,322 @@
+"""
+Per-request query profiling.
+
+QueryProfilingMiddleware profiles a sample of requests: number of queries,
+DB time, top-level template render time and the queries that ran more than
+once (grouped by fingerprint, with the project lines that issued them).
+Each profile is written to the 'ho_ho_hotel_app.profiling' logger as one JSON
+line and the most recent ones are kept in the cache for the admin dashboard
+(admin/query-profiles/).
+
+Settings:
+    QUERY_PROFILING_SAMPLE_RATE      share of requests profiled (0 disables)
+    QUERY_PROFILING_REPEAT_THRESHOLD runs of one fingerprint that flag an N+1
+    QUERY_PROFILING_HISTORY          profiles kept for the dashboard
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import traceback
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template import TemplateDoesNotExist
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+HISTORY_KEY = 'profiling:recent'
+# Call sites remembered per repeated fingerprint
+MAX_CALL_SITES = 3
+
+_current = contextvars.ContextVar('query_profile', default=None)
+# Other execute_wrapper hooks that follow the context into fanout's threads
+_observers = contextvars.ContextVar('query_observers', default=())
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r"\bIN \((?:%s|\?|,|\s)+\)")
+
+
+def sample_rate():
+    return getattr(settings, 'QUERY_PROFILING_SAMPLE_RATE', 0.0)
+
+
+def repeat_threshold():
+    return getattr(settings, 'QUERY_PROFILING_REPEAT_THRESHOLD', 3)
+
+
+def fingerprint(sql):
+    """SQL with literals and IN lists collapsed, so an N+1 loop maps to one entry."""
+    sql = _in_lists.sub('IN (...)', _literals.sub('?', sql))
+    return hashlib.md5(sql.encode()).hexdigest()[:12], sql
+
+
+def call_site():
+    """Innermost stack frame in project code (outside this module and manage.py)."""
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename
+        if (
+            filename.startswith(base_dir)
+            and filename != __file__
+            and 'site-packages' not in filename
+            and os.path.basename(filename) != 'manage.py'
+        ):
+            return f"{os.path.relpath(filename, base_dir)}:{frame.lineno} in {frame.name}"
+    return None
+
+
+class RequestProfile:
+    """Collects the queries and template renders of one request."""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started = perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.templates = []
+        self.fingerprints = {}
+        self._seen = set()
+        # Queries can come from several threads at once (fanout.py)
+        self._lock = threading.Lock()
+
+    # connection.execute_wrapper() hook
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self._lock:
+                self.record_query(sql, params, perf_counter() - start)
+
+    def record_query(self, sql, params, duration):
+        self.query_count += 1
+        self.db_time += duration
+
+        key, normalized = fingerprint(sql)
+        entry = self.fingerprints.get(key)
+        if entry is None:
+            entry = self.fingerprints[key] = {
+                'sql': normalized, 'count': 0, 'identical': 0, 'time': 0.0, 'call_sites': [],
+            }
+        entry['count'] += 1
+        entry['time'] += duration
+
+        # Same SQL *and* parameters: the result could have been reused
+        exact = (sql, repr(params))
+        if exact in self._seen:
+            entry['identical'] += 1
+        else:
+            self._seen.add(exact)
+
+        # Walking the stack is the expensive part, only do it for repeats
+        if entry['count'] > 1 and len(entry['call_sites']) < MAX_CALL_SITES:
+            site = call_site()
+            if site and site not in entry['call_sites']:
+                entry['call_sites'].append(site)
+
+    def record_template(self, name, duration):
+        self.template_time += duration
+        self.templates.append(name)
+
+    def summary(self, status_code):
+        repeated = [
+            {
+                'fingerprint': key,
+                'sql': entry['sql'],
+                'count': entry['count'],
+                'identical': entry['identical'],
+                'time_ms': round(entry['time'] * 1000, 2),
+                'call_sites': entry['call_sites'],
+            }
+            for key, entry in self.fingerprints.items()
+            if entry['count'] > 1
+        ]
+        repeated.sort(key=lambda entry: entry['count'], reverse=True)
+        threshold = repeat_threshold()
+        return {
+            'at': timezone.now().isoformat(),
+            'method': self.method,
+            'path': self.path,
+            'status': status_code,
+            'total_ms': round((perf_counter() - self.started) * 1000, 2),
+            'query_count': self.query_count,
+            'db_ms': round(self.db_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'templates': self.templates,
+            'repeated_queries': repeated,
+            'n_plus_one': [entry['fingerprint'] for entry in repeated if entry['count'] >= threshold],
+        }
+
+
+def current_profile():
+    """The RequestProfile of the request being profiled, if any."""
+    return _current.get()
+
+
+def hook_connections(stack, profile):
+    """Sends the queries of this thread's connections to `profile` until `stack` closes."""
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(profile))
+
+
+def context_hooks():
+    """The hooks fanout.py installs in its threads: the current profile, then the observers."""
+    profile = _current.get()
+    return ((profile,) if profile is not None else ()) + _observers.get()
+
+
+@contextmanager
+def observe_queries(hook):
+    """
+    Sends every query run in this context to the execute_wrapper `hook`,
+    including the ones of fanout's threads (which may call it concurrently).
+    """
+    token = _observers.set(_observers.get() + (hook,))
+    try:
+        with ExitStack() as stack:
+            hook_connections(stack, hook)
+            yield hook
+    finally:
+        _observers.reset(token)
+
+
+# --- Template timing ---
+# Set as the TEMPLATES backend so render() and TemplateResponse are both timed.
+# Only top-level templates go through here; {% include %}s count towards their parent.
+
+class ProfiledTemplate(Template):
+
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None:
+            return super().render(context, request)
+        start = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.record_template(self.origin.template_name, perf_counter() - start)
+
+
+class ProfilingDjangoTemplates(DjangoTemplates):
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+# --- Storage ---
+
+def save_profile(data):
+    history = cache.get(HISTORY_KEY, [])
+    history.insert(0, data)
+    cache.set(HISTORY_KEY, history[:getattr(settings, 'QUERY_PROFILING_HISTORY', 200)], timeout=None)
+
+
+def recent_profiles():
+    return cache.get(HISTORY_KEY, [])
+
+
+def clear_profiles():
+    cache.delete(HISTORY_KEY)
+
+
+def worst_offenders(profiles, limit=20):
+    """Repeated fingerprints across `profiles`, most total repeats first."""
+    totals = {}
+    for profile in profiles:
+        for entry in profile['repeated_queries']:
+            total = totals.setdefault(entry['fingerprint'], {
+                'fingerprint': entry['fingerprint'], 'sql': entry['sql'],
+                'requests': 0, 'count': 0, 'call_sites': [], 'paths': [],
+            })
+            total['requests'] += 1
+            total['count'] += entry['count']
+            for site in entry['call_sites']:
+                if site not in total['call_sites']:
+                    total['call_sites'].append(site)
+            if profile['path'] not in total['paths']:
+                total['paths'].append(profile['path'])
+    return sorted(totals.values(), key=lambda total: total['count'], reverse=True)[:limit]
+
+
+class QueryProfilingMiddleware:
+    """
+    Profiles a random sample of requests (QUERY_PROFILING_SAMPLE_RATE).
+    Works under WSGI and ASGI: database connections belong to a thread, so in
+    async mode the hooks go on the connections of the request's sync thread,
+    the one its ORM calls (and sync middleware/template rendering) run in.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profile = self.start(request)
+        if profile is None:
+            return self.get_response(request)
+
+        token = _current.set(profile)
+        try:
+            with ExitStack() as stack:
+                hook_connections(stack, profile)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(profile, response)
+        return response
+
+    async def __acall__(self, request):
+        profile = self.start(request)
+        if profile is None:
+            return await self.get_response(request)
+
+        token = _current.set(profile)
+        try:
+            stack = ExitStack()
+            await sync_to_async(hook_connections)(stack, profile)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _current.reset(token)
+        await sync_to_async(self.finish)(profile, response)
+        return response
+
+    def start(self, request):
+        """A RequestProfile when this request is sampled, else None."""
+        rate = sample_rate()
+        if not rate or random.random() >= rate:
+            return None
+        return RequestProfile(request.method, request.path)
+
+    def finish(self, profile, response):
+        data = profile.summary(response.status_code)
+        level = logging.WARNING if data['n_plus_one'] else logging.INFO
+        logger.log(level, json.dumps(data), extra={'profile': data})
+        save_profile(data)
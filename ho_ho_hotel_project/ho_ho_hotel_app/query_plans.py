@@ -0,0 +1,140 @@
+"""
+EXPLAIN checks for the hot querysets.
+
+hot_queries() builds each queryset the way the app runs it, through the
+views' own get_queryset() where there is one, so the check follows the code
+as it changes. full_scans() reads the plan and returns the tables that are
+read in full (MySQL access type ALL, PostgreSQL Seq Scan, SQLite SCAN
+without an index). Used by the check_query_plans command.
+
+Note: SQLite compiles boolean filters to a bare column (WHERE is_available),
+which it can't match against an index; MySQL compares with = 1 and uses it.
+The room search has a partial index (WHERE is_available) for SQLite's sake.
+"""
+import json
+import re
+import uuid
+from datetime import timedelta
+
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.db.models import Q
+from django.test import RequestFactory
+from django.utils import timezone
+
+from login_app.models import CustomUser, Hotel, NotificationJob
+from payment import reconcile
+from payment.models import Payment
+from payment.views import UserOrderView
+
+from . import geo
+from .models import Review, Room
+from .pagination import CursorPaginator
+from .views import FavouriteRoomsView, RoomResultsView
+
+_sqlite_scan = re.compile(r'\bSCAN (\w+)(.*)$')
+_postgres_scan = re.compile(r'Seq Scan on (\w+)')
+
+
+def _view_page(view_class, params=None, user=None):
+    """The first page query of a (cursor paginated) ListView."""
+    request = RequestFactory().get('/', params or {})
+    request.user = user or AnonymousUser()
+    view = view_class()
+    view.setup(request)
+    queryset = view.get_queryset()
+    paginator = CursorPaginator(queryset, view.paginate_by, getattr(view, 'cursor_ordering', None))
+    return queryset.order_by(*paginator.ordering)[:view.paginate_by + 1]
+
+
+def _stay():
+    check_in = timezone.localdate() + timedelta(days=30)
+    return {'check_in': check_in.isoformat(), 'check_out': (check_in + timedelta(days=2)).isoformat()}
+
+
+def hot_queries():
+    """(name, queryset) for every query on the booking funnel and the background jobs."""
+    # Placeholder rows: EXPLAIN only needs the shape of the query
+    user = CustomUser(pk=0)
+    room = Room(pk=uuid.uuid4())
+    now = timezone.now()
+    return [
+        ('search: available for dates', _view_page(RoomResultsView, _stay())),
+        ('search: price range', _view_page(RoomResultsView, {'min_price': '2000', 'max_price': '5000'})),
+        ('search: text', _view_page(RoomResultsView, {'query': 'goa suite'})),
+        ('search: top rated', _view_page(RoomResultsView, {'query': 'goa', 'sort': 'rating'})),
+        ('room detail: paid booking', Payment.objects.filter(user=user, room=room, status='PAID')),
+        ('room detail: reviews', room.reviews.all().select_related('user')),
+        ('room detail: has reviewed', Review.objects.filter(user=user, room=room)),
+        ('favourites', _view_page(FavouriteRoomsView, user=user)),
+        ('orders', _view_page(UserOrderView, user=user)),
+        ('hotels by place', Hotel.objects.filter(place='Goa')),
+        ('hotels near a point', Hotel.objects.filter(geo.cells_filter(geo.cover(15.5, 73.8, 10)))),
+        ('notification poll', NotificationJob.objects.filter(
+            Q(status='PENDING', run_after__lte=now) | Q(status='RUNNING', locked_at__lt=now)
+        ).order_by('run_after')[:50]),
+        ('expire pending payments', Payment.objects.filter(status='PENDING', expires_at__lte=now)),
+        ('reconcile payments', reconcile.open_payments(now)[:200]),
+    ]
+
+
+def explain(queryset):
+    vendor = connections[queryset.db].vendor
+    if vendor == 'mysql':
+        return queryset.explain(format='JSON')
+    return queryset.explain()
+
+
+def _mysql_tables(node, scans):
+    if isinstance(node, dict):
+        if node.get('access_type') == 'ALL' and 'table_name' in node:
+            scans.append(node['table_name'])
+        for value in node.values():
+            _mysql_tables(value, scans)
+    elif isinstance(node, list):
+        for value in node:
+            _mysql_tables(value, scans)
+    return scans
+
+
+def full_scans(plan, vendor):
+    """Tables (or aliases) the plan reads in full."""
+    if vendor == 'mysql':
+        return _mysql_tables(json.loads(plan), [])
+    if vendor == 'postgresql':
+        return _postgres_scan.findall(plan)
+    if vendor == 'sqlite':
+        scans = []
+        for line in plan.splitlines():
+            match = _sqlite_scan.search(line)
+            # "SCAN t USING INDEX i" walks an index in order, that's fine
+            if match and 'INDEX' not in match.group(2) and match.group(1) != 'CONSTANT':
+                scans.append(match.group(1))
+        return scans
+    raise NotImplementedError(f"Can't read {vendor} query plans")
+
+
+def check_all(min_rows=0):
+    """
+    EXPLAINs every hot query. Returns a list of (name, scanned tables, plan).
+    Scans of tables with fewer than `min_rows` rows are ignored, since
+    planners rightly prefer reading small tables in full.
+    """
+    sizes = {}
+    results = []
+    for name, queryset in hot_queries():
+        plan = explain(queryset)
+        scans = full_scans(plan, connections[queryset.db].vendor)
+        if min_rows:
+            scans = [table for table in scans if _table_size(table, sizes) >= min_rows]
+        results.append((name, scans, plan))
+    return results
+
+
+def _table_size(table, sizes):
+    if table not in sizes:
+        models = [model for model in apps.get_models() if model._meta.db_table == table]
+        # Unknown names are aliases (U0, ...): count them as big to stay on the safe side
+        sizes[table] = models[0]._default_manager.count() if models else float('inf')
+    return sizes[table]
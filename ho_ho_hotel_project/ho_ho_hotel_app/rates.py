@@ -0,0 +1,125 @@
+"""
+Bulk price and availability changes for a hotel's rooms.
+
+update_rooms() changes every selected room (the whole hotel, one room type,
+or rooms picked by the owner) with a single UPDATE. The new price is
+computed by the database from the current one: set to an amount, add an
+amount, or change by a percentage. One aggregate query over the same
+expression first checks that no price leaves the column's range.
+
+A price change dated in the future is stored as a ScheduledRateChange.
+apply_due_changes() (the apply_rate_changes command, run from cron) applies
+the changes that are due, oldest date first.
+
+UPDATE sends no signals. Prices and availability aren't in the search index
+or the suggestions, so only the cache versions need to change: the hotel's
+(part of its room pages' key) and the catalog's, bumped on commit.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Max, Min, Value
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from . import caching
+from .models import Room, ScheduledRateChange
+
+PRICE_MODES = tuple(mode for mode, _label in ScheduledRateChange.MODE_CHOICES)
+
+# price_per_night is a DecimalField(max_digits=8, decimal_places=2)
+MIN_PRICE = Decimal('0.01')
+MAX_PRICE = Decimal('999999.99')
+
+
+class PriceChangeError(ValueError):
+    """The change would take a room's price out of MIN_PRICE..MAX_PRICE."""
+
+
+def new_price(mode, amount):
+    """Expression for a room's price after the change."""
+    amount = Decimal(amount)
+    if mode == 'set':
+        return Value(amount)
+    if mode == 'add':
+        return F('price_per_night') + Value(amount)
+    if mode == 'percent':
+        return Round(F('price_per_night') * Value((100 + amount) / 100), 2)
+    raise ValueError(f"Unknown price change: {mode!r}")
+
+
+def select_rooms(hotel_id, room_type='', room_ids=None):
+    rooms = Room.objects.filter(hotel_id=hotel_id)
+    if room_type:
+        rooms = rooms.filter(room_type=room_type)
+    if room_ids is not None:
+        rooms = rooms.filter(pk__in=room_ids)
+    return rooms
+
+
+def update_rooms(hotel_id, price_mode=None, amount=None, available=None, room_type='', room_ids=None):
+    """
+    Changes the price (price_mode/amount) and/or the availability of the
+    hotel's rooms, limited to `room_type` and/or `room_ids` when given.
+    Returns the number of rooms updated. Raises PriceChangeError, with
+    nothing changed, if a price would go out of range.
+    """
+    rooms = select_rooms(hotel_id, room_type, room_ids)
+    changes = {}
+    if price_mode:
+        changes['price_per_night'] = new_price(price_mode, amount)
+    if available is not None:
+        changes['is_available'] = available
+    if not changes:
+        return 0
+
+    with transaction.atomic():
+        if price_mode:
+            prices = rooms.aggregate(lowest=Min(changes['price_per_night']), highest=Max(changes['price_per_night']))
+            if prices['lowest'] is not None and prices['lowest'] < MIN_PRICE:
+                raise PriceChangeError(f"This would bring a room's price down to {prices['lowest']}.")
+            if prices['highest'] is not None and prices['highest'] > MAX_PRICE:
+                raise PriceChangeError(f"This would raise a room's price to {prices['highest']}, above {MAX_PRICE}.")
+        updated = rooms.update(**changes)
+        if updated:
+            transaction.on_commit(lambda: _invalidate(hotel_id))
+    return updated
+
+
+def _invalidate(hotel_id):
+    caching.bump('hotel', hotel_id)
+    caching.bump('catalog')
+
+
+# --- Scheduled changes ---
+
+def apply_due_changes(today=None):
+    """
+    Applies the PENDING rate changes dated `today` (default: the local date)
+    or earlier, in date order. A change that would take a price out of range
+    is marked FAILED, with the reason. Returns the number of changes processed.
+    """
+    today = today or timezone.localdate()
+    due = ScheduledRateChange.objects.filter(status='PENDING', effective_on__lte=today)
+    processed = 0
+    for change_id in list(due.order_by('effective_on', 'created_at').values_list('pk', flat=True)):
+        with transaction.atomic():
+            # Skipped if a concurrent run has it, or cancelled it in the meantime
+            change = (
+                ScheduledRateChange.objects.select_for_update(skip_locked=True)
+                .filter(pk=change_id, status='PENDING').first()
+            )
+            if change is None:
+                continue
+            try:
+                change.rooms_updated = update_rooms(
+                    change.hotel_id, price_mode=change.mode, amount=change.amount, room_type=change.room_type,
+                )
+                change.status = 'APPLIED'
+            except PriceChangeError as e:
+                change.status = 'FAILED'
+                change.error = str(e)[:255]
+            change.applied_at = timezone.now()
+            change.save(update_fields=['status', 'rooms_updated', 'error', 'applied_at'])
+        processed += 1
+    return processed
@@ -0,0 +1,110 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, Exists, F, FloatField, OuterRef, Sum, Value, When
+from django.db.models.functions import Cast, Round
+
+from login_app.models import Hotel
+from payment.models import Payment
+from .models import Room, Review
+
+# rating_avg = rating_sum / review_count, computed by the database.
+# It has to be a separate UPDATE: MySQL applies SET clauses left to right,
+# so reading review_count in the same statement would see the new value on
+# MySQL and the old one everywhere else.
+# Rounded to the column's two places: SQLite would store the full float, and
+# the rating cursor (read back as Decimal('2.67')) would then match no row.
+AVERAGE_EXPRESSION = Case(
+    When(review_count=0, then=Value(0)),
+    default=Round(Cast('rating_sum', FloatField()) / F('review_count'), 2),
+    output_field=DecimalField(max_digits=3, decimal_places=2),
+)
+
+
+def _apply(model, pk, count_delta, rating_delta):
+    rows = model.objects.filter(pk=pk)
+    rows.update(
+        review_count=F('review_count') + count_delta,
+        rating_sum=F('rating_sum') + rating_delta,
+    )
+    rows.update(rating_avg=AVERAGE_EXPRESSION)
+
+
+def review_added(review):
+    """Adds a new review to its room and hotel aggregates."""
+    with transaction.atomic():
+        _apply(Room, review.room_id, 1, review.rating)
+        _apply(Hotel, review.hotel_id, 1, review.rating)
+
+
+def review_removed(review):
+    """Takes a deleted review out of its room and hotel aggregates."""
+    with transaction.atomic():
+        _apply(Room, review.room_id, -1, -review.rating)
+        _apply(Hotel, review.hotel_id, -1, -review.rating)
+
+
+def review_changed(review, old_rating):
+    """Adjusts the aggregates when the rating of an existing review is edited."""
+    delta = review.rating - old_rating
+    if not delta:
+        return
+    with transaction.atomic():
+        _apply(Room, review.room_id, 0, delta)
+        _apply(Hotel, review.hotel_id, 0, delta)
+
+
+def _rebuild(model, group_field, batch_size):
+    totals = defaultdict(lambda: (0, 0))
+    grouped = (
+        Review.objects.order_by()
+        .values(group_field)
+        .annotate(count=Count('id'), total=Sum('rating'))
+    )
+    for row in grouped:
+        totals[row[group_field]] = (row['count'], row['total'] or 0)
+
+    changed = []
+    for obj in model.objects.only('id', 'review_count', 'rating_sum', 'rating_avg').iterator(chunk_size=batch_size):
+        count, total = totals[obj.pk]
+        if (obj.review_count, obj.rating_sum) != (count, total):
+            obj.review_count = count
+            obj.rating_sum = total
+            changed.append(obj)
+    model.objects.bulk_update(changed, ['review_count', 'rating_sum'], batch_size=batch_size)
+    model.objects.update(rating_avg=AVERAGE_EXPRESSION)
+    return len(changed)
+
+
+def rebuild_all(batch_size=500):
+    """
+    Recomputes every room and hotel aggregate from the Review table.
+    Returns (rooms_changed, hotels_changed).
+    """
+    with transaction.atomic():
+        rooms = _rebuild(Room, 'room_id', batch_size)
+        hotels = _rebuild(Hotel, 'hotel_id', batch_size)
+    return rooms, hotels
+
+
+# --- Who may review ---
+
+def review_status(user, room_id):
+    """
+    (has_paid_booking, has_reviewed) of `user` for a room as one row: both
+    EXISTS checks in a single SELECT instead of a round trip each.
+    """
+    return _review_status(user, room_id).get()
+
+
+async def areview_status(user, room_id):
+    """review_status() for async views."""
+    return await _review_status(user, room_id).aget()
+
+
+def _review_status(user, room_id):
+    return get_user_model().objects.filter(pk=user.pk).annotate(
+        has_paid_booking=Exists(Payment.objects.filter(user=OuterRef('pk'), room_id=room_id, status='PAID')),
+        has_reviewed=Exists(Review.objects.filter(user=OuterRef('pk'), room_id=room_id)),
+    ).values_list('has_paid_booking', 'has_reviewed')
@@ -0,0 +1,146 @@
+import re
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Q, Sum, When
+
+from .models import Room, SearchToken
+
+# How much a term counts towards the rank depending on where it was found
+FIELD_WEIGHTS = {
+    'hotel_name': 5,
+    'place': 4,
+    'room_type': 3,
+    'room_number': 3,
+    'description': 1,
+}
+
+# Bonus multiplier when a query term matches a whole token, not just a prefix
+EXACT_MATCH_BONUS = 2
+
+# Queries longer than this are truncated, each term adds a CASE to the query
+MAX_QUERY_TERMS = 8
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERM_LENGTH = SearchToken._meta.get_field('term').max_length
+
+
+def tokenize(text):
+    """Splits text into lowercase word tokens, truncated to the column size."""
+    if not text:
+        return []
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(str(text).lower())]
+
+
+def build_room_terms(room):
+    """Returns {term: weight} for a room, including its hotel's name and place."""
+    hotel = room.hotel
+    sources = {
+        'hotel_name': hotel.hotel_name,
+        'place': hotel.place,
+        'room_type': room.room_type,
+        'room_number': room.room_number,
+        'description': room.description,
+    }
+    terms = {}
+    for field, text in sources.items():
+        # A term repeated inside one field only counts once for that field
+        for term in set(tokenize(text)):
+            terms[term] = terms.get(term, 0) + FIELD_WEIGHTS[field]
+    return terms
+
+
+def index_room(room):
+    """Replaces the index rows of a single room."""
+    terms = build_room_terms(room)
+    with transaction.atomic():
+        SearchToken.objects.filter(room=room).delete()
+        SearchToken.objects.bulk_create([
+            SearchToken(room=room, term=term, weight=weight)
+            for term, weight in terms.items()
+        ])
+
+
+def index_new_rooms(rooms):
+    """Indexes rooms inserted with bulk_create(), which sends no post_save."""
+    SearchToken.objects.bulk_create([
+        SearchToken(room=room, term=term, weight=weight)
+        for room in rooms
+        for term, weight in build_room_terms(room).items()
+    ])
+
+
+def index_hotel(hotel):
+    """
+    Re-indexes every room of a hotel (its name or place changed): one DELETE
+    for the hotel's tokens and one bulk INSERT, whatever the number of rooms.
+    """
+    rooms = list(Room.objects.filter(hotel=hotel))
+    for room in rooms:
+        # The saved hotel, not a query per room for it
+        room.hotel = hotel
+    with transaction.atomic():
+        SearchToken.objects.filter(room__hotel=hotel).delete()
+        index_new_rooms(rooms)
+
+
+def rebuild_index(batch_size=500):
+    """Rebuilds the whole index from scratch. Returns the number of rooms indexed."""
+    count = 0
+    with transaction.atomic():
+        SearchToken.objects.all().delete()
+        batch = []
+        for room in Room.objects.select_related('hotel').iterator(chunk_size=batch_size):
+            batch.extend(
+                SearchToken(room=room, term=term, weight=weight)
+                for term, weight in build_room_terms(room).items()
+            )
+            count += 1
+            if len(batch) >= batch_size:
+                SearchToken.objects.bulk_create(batch)
+                batch = []
+        SearchToken.objects.bulk_create(batch)
+    return count
+
+
+def search_rooms(query, queryset=None):
+    """
+    Ranked prefix search over the token index.
+
+    Every term in the query has to match (as a prefix) at least one token of
+    the room. The result is annotated with `search_rank` and ordered by it,
+    then by price and room number like the rest of the search pages.
+    """
+    if queryset is None:
+        queryset = Room.objects.all()
+
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return queryset.none()
+
+    # istartswith compiles to LIKE 'term%' which can use the index on `term`
+    term_filter = Q()
+    for term in terms:
+        term_filter |= Q(search_tokens__term__istartswith=term)
+
+    # Filtering before annotating makes the aggregates only see matching tokens
+    matched_terms = None
+    for term in terms:
+        hit = Max(Case(
+            When(search_tokens__term__istartswith=term, then=1),
+            default=0,
+            output_field=IntegerField(),
+        ))
+        matched_terms = hit if matched_terms is None else matched_terms + hit
+
+    rank = Sum(Case(
+        When(search_tokens__term__in=terms, then=F('search_tokens__weight') * EXACT_MATCH_BONUS),
+        default=F('search_tokens__weight'),
+        output_field=IntegerField(),
+    ))
+
+    return (
+        queryset.filter(term_filter)
+        .annotate(search_matched=matched_terms, search_rank=rank)
+        .filter(search_matched=len(terms))
+        .order_by('-search_rank', 'price_per_night', 'room_number')
+    )
@@ -0,0 +1,176 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from login_app.models import CustomUser, Hotel
+from payment.models import Booking
+from .models import Favourite, Room, Review
+from . import autocomplete, caching, geo, ratings, search
+
+
+# --- Search index ---
+
+@receiver(post_save, sender=Room)
+def index_room_on_save(sender, instance, raw=False, **kwargs):
+    # Fixture loading (loaddata) passes raw=True, related rows may not exist yet
+    if raw:
+        return
+    search.index_room(instance)
+
+
+@receiver(pre_save, sender=Hotel)
+def remember_old_hotel_names(sender, instance, raw=False, **kwargs):
+    # (hotel_name, place) before the save, both the search index and the
+    # suggestions below copy them
+    old = None
+    if not raw and not instance._state.adding:
+        old = Hotel.objects.filter(pk=instance.pk).values_list('hotel_name', 'place').first()
+    instance._old_names = old
+
+
+@receiver(post_save, sender=Hotel)
+def index_hotel_on_save(sender, instance, created=False, raw=False, **kwargs):
+    # A brand new hotel has no rooms to re-index, and the rooms only copy the
+    # name and place: other changes (contact details, location) leave them be
+    if raw or created or instance._old_names == (instance.hotel_name, instance.place):
+        return
+    search.index_hotel(instance)
+
+
+# --- Autocomplete ---
+# Saves send the difference between the old and new names/places/room types,
+# applied on commit so a rolled back save never shows up in suggestions
+
+def _update_suggestions(old_items, new_items):
+    changes = autocomplete.changes(old_items, new_items)
+    if changes:
+        transaction.on_commit(lambda: autocomplete.update(changes))
+
+
+@receiver(pre_save, sender=Room)
+def remember_old_room_suggestions(sender, instance, raw=False, **kwargs):
+    old = None
+    if not raw and not instance._state.adding:
+        old = Room.objects.filter(pk=instance.pk).values_list('room_type', flat=True).first()
+    instance._old_suggestions = autocomplete.room_items(old) if old else []
+
+
+@receiver(post_save, sender=Hotel)
+def update_hotel_suggestions(sender, instance, raw=False, **kwargs):
+    if not raw:
+        old = instance._old_names
+        _update_suggestions(autocomplete.hotel_items(*old) if old else [],
+                            autocomplete.hotel_items(instance.hotel_name, instance.place))
+
+
+@receiver(post_save, sender=Room)
+def update_room_suggestions(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _update_suggestions(instance._old_suggestions, autocomplete.room_items(instance.room_type))
+
+
+@receiver(post_delete, sender=Hotel)
+def remove_hotel_suggestions(sender, instance, **kwargs):
+    _update_suggestions(autocomplete.hotel_items(instance.hotel_name, instance.place), [])
+
+
+@receiver(post_delete, sender=Room)
+def remove_room_suggestions(sender, instance, **kwargs):
+    _update_suggestions(autocomplete.room_items(instance.room_type), [])
+
+
+# --- Location ---
+
+@receiver(pre_save, sender=Hotel)
+def set_hotel_geohash(sender, instance, raw=False, **kwargs):
+    # Keeps the "near me" index in step with hand-edited coordinates
+    if instance.latitude is None or instance.longitude is None:
+        instance.geohash = ''
+    else:
+        instance.geohash = geo.encode(instance.latitude, instance.longitude)
+
+
+# --- Rating aggregates ---
+
+@receiver(pre_save, sender=Review)
+def remember_old_rating(sender, instance, raw=False, **kwargs):
+    # Edits (admin only) need the previous rating to adjust the sums
+    if raw or instance._state.adding:
+        instance._old_rating = None
+        return
+    instance._old_rating = (
+        Review.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_ratings_on_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        ratings.review_added(instance)
+    elif instance._old_rating is not None:
+        ratings.review_changed(instance, instance._old_rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_ratings_on_delete(sender, instance, **kwargs):
+    ratings.review_removed(instance)
+
+
+# --- Cache invalidation ---
+# Versions are bumped on commit, so a request running in between can't cache
+# data from a transaction that is still open (e.g. a booking and its nights).
+
+def _bump_on_commit(*scopes):
+    def bump():
+        for scope in scopes:
+            caching.bump(*scope)
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room(sender, instance, **kwargs):
+    _bump_on_commit(('room', instance.pk), ('catalog',))
+
+
+@receiver(post_save, sender=Hotel)
+@receiver(post_delete, sender=Hotel)
+def invalidate_hotel(sender, instance, **kwargs):
+    _bump_on_commit(('hotel', instance.pk), ('catalog',))
+
+
+# Owner fields shown on the room page
+OWNER_CONTACT_FIELDS = {'email', 'phone_number'}
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_owner_contact(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Logins save last_login alone, they can't change the contact details
+    if raw or not instance.is_hotel_owner or (update_fields and not OWNER_CONTACT_FIELDS & set(update_fields)):
+        return
+    hotel_ids = list(Hotel.objects.filter(owner_id=instance.pk).values_list('pk', flat=True))
+    _bump_on_commit(*(('hotel', hotel_id) for hotel_id in hotel_ids))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review(sender, instance, **kwargs):
+    # Reviews change the room page and rating-sorted results
+    _bump_on_commit(('room', instance.room_id), ('catalog',))
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_availability(sender, instance, **kwargs):
+    # Booked/cancelled stays change which rooms date searches return. Payments
+    # only change availability through their booking, so they aren't watched.
+    _bump_on_commit(('room', instance.room_id), ('catalog',))
+
+
+@receiver(post_save, sender=Favourite)
+@receiver(post_delete, sender=Favourite)
+def invalidate_favourites(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: caching.invalidate_favourites(user_id))
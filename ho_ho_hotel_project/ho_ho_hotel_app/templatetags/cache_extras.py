@@ -0,0 +1,42 @@
+from django import template
+
+from ho_ho_hotel_app import caching
+
+register = template.Library()
+
+
+class CachedFragmentNode(template.Node):
+
+    def __init__(self, nodelist, name, parts):
+        self.nodelist = nodelist
+        self.name = name
+        self.parts = parts
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        parts = [part.resolve(context) for part in self.parts]
+        key = caching.fragment_key(name, parts)
+        # Counted under the 'fragment' namespace of the cache stats
+        return caching.get_or_set('fragment', key, lambda: self.nodelist.render(context))
+
+
+@register.tag
+def cachedfragment(parser, token):
+    """
+    Caches the rendered block, like Django's {% cache %} but with hit/miss
+    counters. Everything the block depends on must be in the key, e.g.:
+
+        {% cachedfragment "room_detail" room.id room_cache_version %}
+            ...
+        {% endcachedfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires at least a fragment name.")
+    nodelist = parser.parse(('endcachedfragment',))
+    parser.delete_first_token()
+    return CachedFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
@@ -1,6 +1,7 @@
 from django import template
 from ho_ho_hotel_app.models import Favourite
 from ho_ho_hotel_app.models import Room # Import Room just in case
+from ho_ho_hotel_app.context_processors import get_favourite_room_ids
 import uuid
 
 register = template.Library()
@@ -28,5 +29,10 @@ def is_favorited(context, room_id):
     except ValueError:
         return False
     
-    # 3. Perform the check in Python
+    # 3. Check against the request-wide favourites set (one query per request)
+    request = context.get('request')
+    if request is not None and getattr(request, 'user', None) == user:
+        return room_uuid in get_favourite_room_ids(request)
+
+    # 4. No request in the context (e.g. render_to_string), query directly
     return Favourite.objects.filter(user=user, room_id=room_uuid).exists()
\ No newline at end of file
@@ -0,0 +1,35 @@
+from django import template
+
+register = template.Library()
+
+
+def _srcset(entries):
+    return ', '.join(f"{name_url} {width}w" for width, name_url in entries)
+
+
+@register.inclusion_tag('partials/room_picture.html')
+def room_picture(room, sizes='100vw', css_class='', style='', alt=''):
+    """
+    Renders a room photo as a <picture> with AVIF/WebP/JPEG srcsets so the
+    browser downloads the smallest suitable variant. Rooms whose variants are
+    not generated yet fall back to the original upload.
+    """
+    storage = room.photo.storage
+    sources = []
+    fallback = None
+    for ext, entries in (room.photo_variants or {}).items():
+        urls = [(width, storage.url(name)) for width, name in entries]
+        if ext == 'jpeg':
+            fallback = urls
+        else:
+            sources.append({'type': f"image/{ext}", 'srcset': _srcset(urls)})
+
+    return {
+        'src': fallback[-1][1] if fallback else room.photo.url,
+        'srcset': _srcset(fallback) if fallback else '',
+        'sources': sources,
+        'sizes': sizes,
+        'css_class': css_class,
+        'style': style,
+        'alt': alt or f"Photo of Room {room.room_number}",
+    }
@@ -1,3 +1,975 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from PIL import Image
+
+from login_app.models import CustomUser, Hotel
+from payment.models import Payment
+
+from . import (
+    autocomplete, bulk_rooms, caching, db_routing, facets, fanout, favourites, geo, images, pagination, profiling,
+    query_plans, rates, ratings, search, views,
+)
+from .management.commands import benchmark_concurrency, benchmark_funnel
+from .models import Favourite, Review, Room, ScheduledRateChange, SearchToken
+
+
+def make_hotel(name='Sea View', place='Goa'):
+    owner = CustomUser.objects.create_user(username=f"{name.replace(' ', '')}owner", password='pw', is_hotel_owner=True)
+    return Hotel.objects.create(
+        owner=owner, hotel_name=name, place=place, address='1 Beach Road',
+        license_number=f"LIC-{name}", ownership_proof='x.pdf', owner_id_proof='y.pdf',
+    )
+
+
+class RatingSortPaginationTests(TestCase):
+    """
+    Pages through sort=rating results. The cursor carries rating_avg as read
+    back from the database, so the stored averages must be rounded like the
+    column or the next page starts at the wrong place.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        hotel = make_hotel()
+        reviewers = [CustomUser.objects.create_user(username=f"guest{i}", password='pw') for i in range(3)]
+        cls.rooms = []
+        for i in range(25):
+            room = Room.objects.create(
+                hotel=hotel, room_number=f"{100 + i}", room_type='Deluxe room',
+                price_per_night=Decimal('1000.00') + i % 4,
+            )
+            # Averages like 2.67 and 4.33 that a float can't hold exactly
+            for reviewer, rating in zip(reviewers, ((i % 5) + 1, (i % 3) + 1, (i % 2) + 4)):
+                Review.objects.create(user=reviewer, room=room, hotel=hotel, rating=rating)
+            cls.rooms.append(room)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_stored_average_is_rounded(self):
+        room = Room.objects.get(pk=self.rooms[2].pk)  # 3, 3 and 4 stars
+        self.assertEqual(room.rating_avg, Decimal('3.33'))
+        self.assertTrue(Room.objects.filter(pk=room.pk, rating_avg=Decimal('3.33')).exists())
+
+    def test_api_pages_to_the_end(self):
+        ids = []
+        params = {'query': 'room', 'sort': 'rating', 'limit': 4, 'fields': 'id'}
+        for _ in range(20):
+            response = self.client.get(reverse('room_search_api'), params)
+            data = json.loads(b''.join(response.streaming_content))
+            ids.extend(room['id'] for room in data['results'])
+            if not data['next']:
+                break
+            params['cursor'] = data['next']
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), {str(room.pk) for room in self.rooms})
+
+    def test_results_pages_to_the_end(self):
+        ids = []
+        params = {'query': 'room', 'sort': 'rating'}
+        for _ in range(20):
+            page = self.client.get(reverse('room_results'), params).context['page_obj']
+            ids.extend(room.pk for room in page)
+            if not page.has_next():
+                break
+            params['cursor'] = page.next_cursor
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), {room.pk for room in self.rooms})
+
+
+class FacetCountTests(TestCase):
+    """Following a facet link shows as many rooms as the facet said."""
+
+    @classmethod
+    def setUpTestData(cls):
+        goa, manali = make_hotel('Sea View', 'Goa'), make_hotel('Snow Peak', 'Manali')
+        rooms = [
+            (goa, 'Deluxe', 1500), (goa, 'Deluxe', 3000), (goa, 'Suite', 6000), (goa, 'Suite', 12000),
+            (manali, 'Deluxe', 2500), (manali, 'Suite', 4000),
+        ]
+        for number, (hotel, room_type, price) in enumerate(rooms, start=101):
+            Room.objects.create(
+                hotel=hotel, room_number=str(number), room_type=room_type, price_per_night=Decimal(price),
+            )
+        # Never counted
+        Room.objects.create(
+            hotel=manali, room_number='201', room_type='Suite', price_per_night=Decimal(7000), is_available=False,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, **params):
+        response = self.client.get(reverse('room_results'), params)
+        return response.context['rooms'], response.context['facets']
+
+    def test_counts_match_the_results(self):
+        search = {'room_type': 'Suite', 'min_price': '2000'}
+        rooms, counts = self.search(**search)
+        self.assertEqual(len(rooms), 3)
+        # Each facet ignores its own filter
+        self.assertEqual(dict(counts['place']), {'Goa': 2, 'Manali': 1})
+        self.assertEqual(dict(counts['room_type']), {'Suite': 3, 'Deluxe': 2})
+        self.assertEqual([count for _label, count, _min, _max in counts['price']], [1, 1, 1])
+
+        for place, count in counts['place']:
+            self.assertEqual(len(self.search(**search, place=place)[0]), count)
+        for room_type, count in counts['room_type']:
+            self.assertEqual(len(self.search(**{**search, 'room_type': room_type})[0]), count)
+        for _label, count, min_price, max_price in counts['price']:
+            rooms = self.search(room_type='Suite', min_price=min_price, max_price=max_price)[0]
+            self.assertEqual(len(rooms), count)
+
+
+class CursorValidationTests(TestCase):
+    """Cursors are signed: tampered ones, or ones from another ordering, are refused."""
+
+    @classmethod
+    def setUpTestData(cls):
+        hotel = make_hotel()
+        for i in range(12):
+            Room.objects.create(
+                hotel=hotel, room_number=f"{100 + i}", room_type='Deluxe room', price_per_night=Decimal('1000.00') + i,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def results(self, **params):
+        return self.client.get(reverse('room_results'), {'query': 'room', **params})
+
+    def api(self, **params):
+        return self.client.get(reverse('room_search_api'), {'query': 'room', 'fields': 'id', **params})
+
+    def test_forged_and_stale_cursors(self):
+        page = self.results(cursor=self.results().context['page_obj'].next_cursor).context['page_obj']
+        self.assertEqual(len(page), 2)
+        price_cursor = page.previous_cursor
+        rating_cursor = self.results(sort='rating').context['page_obj'].next_cursor
+
+        forged = [
+            price_cursor[:-4] + 'AAAA',
+            signing.dumps({'v': ['0', '0', str(uuid.uuid4())], 'b': False}, salt='another.salt', compress=True),
+            signing.dumps({'values': []}, salt=pagination.CURSOR_SALT),
+            'not-a-cursor',
+        ]
+        for cursor in forged:
+            self.assertEqual(self.results(cursor=cursor).status_code, 404)
+            self.assertEqual(self.api(cursor=cursor).status_code, 400)
+        # Signed, but for the rating ordering (one column per sort key)
+        self.assertEqual(self.results(cursor=rating_cursor).status_code, 404)
+        self.assertEqual(self.api(cursor=rating_cursor).status_code, 400)
+        # The API only pages forward
+        self.assertEqual(self.api(cursor=price_cursor).status_code, 400)
+        self.assertEqual(self.results(cursor=price_cursor).status_code, 200)
+
+
+class QueryPlanTests(TestCase):
+
+    def test_hot_queries_use_an_index(self):
+        scans = [(name, tables) for name, tables, plan in query_plans.check_all() if tables]
+        self.assertEqual(scans, [])
+
+
+class SearchIndexTests(TestCase):
+    """Ranking over the token index, and keeping the index in step with hotel edits."""
+
+    def setUp(self):
+        self.sea_view = make_hotel('Sea View', 'Goa')
+        self.hill_top = make_hotel('Hill Top', 'Goa')
+        self.by_name = Room.objects.create(
+            hotel=self.sea_view, room_number='101', room_type='Standard', price_per_night=Decimal('3000.00'),
+        )
+        self.by_description = Room.objects.create(
+            hotel=self.hill_top, room_number='201', room_type='Standard', price_per_night=Decimal('1000.00'),
+            description='Sea facing balcony',
+        )
+        self.by_prefix = Room.objects.create(
+            hotel=self.hill_top, room_number='202', room_type='Standard', price_per_night=Decimal('2000.00'),
+            description='Seaside garden',
+        )
+
+    def search(self, query):
+        return list(search.search_rooms(query))
+
+    def tokens(self):
+        return set(SearchToken.objects.values_list('room_id', 'term', 'weight'))
+
+    def test_ranking(self):
+        # Hotel name over description, a whole word over a prefix of one
+        self.assertEqual(self.search('sea'), [self.by_name, self.by_description, self.by_prefix])
+        # Every term has to match
+        self.assertEqual(self.search('sea balcony'), [self.by_description])
+        self.assertEqual(self.search('sea mumbai'), [])
+
+    def test_rebuild(self):
+        indexed = self.tokens()
+        SearchToken.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn("Indexed 3 rooms.", out.getvalue())
+        self.assertEqual(self.tokens(), indexed)
+
+    def test_rename_reindexes_the_hotels_rooms(self):
+        self.hill_top.hotel_name = 'Palm Grove'
+        with CaptureQueriesContext(connection) as queries:
+            self.hill_top.save()
+        writes = [q['sql'].split()[0] for q in queries if 'searchtoken' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(writes, ['DELETE', 'INSERT'])
+        self.assertEqual(set(self.search('palm')), {self.by_description, self.by_prefix})
+        self.assertEqual(self.search('hill'), [])
+
+    def test_other_hotel_edits_leave_the_index(self):
+        indexed = self.tokens()
+        self.hill_top.address = '2 Hill Road'
+        with CaptureQueriesContext(connection) as queries:
+            self.hill_top.save()
+        self.assertFalse([q for q in queries if 'searchtoken' in q['sql']])
+        self.assertEqual(self.tokens(), indexed)
+
+
+class SearchAPITests(TestCase):
+    """RoomSearchAPIView: field projection and conditional GETs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        hotel = make_hotel()
+        cls.rooms = [
+            Room.objects.create(
+                hotel=hotel, room_number=f"{101 + i}", room_type='Deluxe', price_per_night=Decimal('1000.00') + i,
+                description='A long description that only some clients want',
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, params, **headers):
+        return self.client.get(reverse('room_search_api'), {'query': 'goa', **params}, **headers)
+
+    def read(self, response):
+        """The results, and the SELECT that read the rooms."""
+        with CaptureQueriesContext(connection) as queries:
+            data = json.loads(b''.join(response.streaming_content))
+        table = connection.ops.quote_name(Room._meta.db_table)
+        return data, next(query['sql'] for query in queries if f'FROM {table}' in query['sql'])
+
+    def test_projection(self):
+        quote = connection.ops.quote_name
+        data, sql = self.read(self.get({'fields': 'room_number,hotel_name'}))
+        self.assertEqual(data['results'], [
+            {'room_number': room.room_number, 'hotel_name': 'Sea View'} for room in self.rooms
+        ])
+        self.assertNotIn(quote('description'), sql)
+        self.assertIn(quote('hotel_name'), sql)
+
+        data, sql = self.read(self.get({'fields': 'id,description'}))
+        self.assertEqual(set(data['results'][0]), {'id', 'description'})
+        # No join for hotel columns nobody asked for
+        self.assertNotIn(quote(Hotel._meta.db_table), sql)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.get({'fields': 'room_number,owner_email,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], "Unknown fields: owner_email, password")
+
+    def test_conditional_get(self):
+        response = self.get({'fields': 'id'})
+        etag = response['ETag']
+        self.assertEqual(self.get({'fields': 'id'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another search, or the same one after a catalog change, is sent in full
+        self.assertEqual(self.get({'fields': 'id,room_number'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        caching.bump('catalog')
+        self.assertEqual(self.get({'fields': 'id'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class GeoSearchTests(TestCase):
+    """Radius searches over the geohash index (geo.py)."""
+
+    def place(self, name, latitude, longitude):
+        hotel = make_hotel(name)
+        hotel.latitude, hotel.longitude = latitude, longitude
+        hotel.save()
+        return hotel
+
+    def test_match_across_a_cell_edge(self):
+        # The equator and the prime meridian split the map at the first
+        # character: these share no geohash prefix at all
+        searched = (0.0005, 0.0005)
+        across = self.place('Across', -0.003, -0.003)
+        self.assertNotEqual(geo.encode(*searched)[0], across.geohash[0])
+        self.assertEqual(list(geo.hotels_within(*searched, 1)), [across.pk])
+
+        # Same on the antimeridian, where longitudes wrap around
+        wrapped = self.place('Wrapped', 10.0, -179.999)
+        self.assertEqual(list(geo.hotels_within(10.0, 179.999, 1)), [wrapped.pk])
+
+    def test_distance_cutoff(self):
+        near = self.place('Near', 15.5045, 73.8)  # 0.5km north
+        edge = self.place('Edge', 15.5, 73.8093)  # 1.0km east
+        # In the corner of the box around the circle: read, then dropped by distance
+        corner = self.place('Corner', 15.507, 73.8075)
+        self.place('Elsewhere', 19.07, 72.87)
+
+        self.assertIn(corner.pk, [row[0] for row in geo._candidates(15.5, 73.8, 1.05)])
+        found = geo.hotels_within(15.5, 73.8, 1.05)
+        self.assertEqual(list(found), [near.pk, edge.pk])
+        self.assertAlmostEqual(found[near.pk], 0.5, places=2)
+        self.assertAlmostEqual(found[edge.pk], 1.0, places=2)
+        self.assertIn(corner.pk, geo.hotels_within(15.5, 73.8, 1.2))
+        # Nearest N: the closest ones, within the limit
+        self.assertEqual(list(geo.nearest_hotels(15.5, 73.8, 2)), [near.pk, edge.pk])
+        self.assertEqual(list(geo.nearest_hotels(15.5, 73.8, 10, max_km=1.05)), [near.pk, edge.pk])
+
+
+class RoomDetailCacheTests(TestCase):
+    """The room page caches the room/hotel block, owner contact details included."""
+
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create(
+            hotel=make_hotel(), room_number='101', room_type='Deluxe', price_per_night=Decimal('1000.00'),
+        )
+        self.owner = self.room.hotel.owner
+        self.owner.email = 'old@example.com'
+        self.owner.save()
+
+    def test_owner_contact_changes_show(self):
+        url = reverse('room_detail', kwargs={'pk': self.room.pk})
+        self.assertContains(self.client.get(url), 'old@example.com')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.email = 'new@example.com'
+            self.owner.phone_number = '+919800000000'
+            self.owner.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'new@example.com')
+        self.assertContains(response, '+919800000000')
+
+    def test_logins_keep_the_cache(self):
+        version = caching.room_version(self.room)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(username=self.owner.username, password='pw')
+        self.assertEqual(caching.room_version(self.room), version)
+
+    def test_payment_updates_keep_the_cache(self):
+        versions = caching.room_version(self.room), caching.catalog_version()
+        guest = CustomUser.objects.create_user(username='guest', password='pw')
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = Payment.objects.create(
+                user=guest, room=self.room, amount=Decimal('1000.00'), check_in='2026-01-01',
+                check_out='2026-01-02', razorpay_order_id='order_1',
+            )
+            payment.status = 'FAILED'
+            payment.save()
+        self.assertEqual((caching.room_version(self.room), caching.catalog_version()), versions)
+
+
+class RateChangeTests(TestCase):
+    """Bulk price changes (rates.py): one UPDATE, and nothing at all when a price would go out of range."""
+
+    def setUp(self):
+        self.hotel = make_hotel()
+        self.other_hotel = make_hotel('Hill Top')
+        self.rooms = {
+            number: Room.objects.create(
+                hotel=self.hotel, room_number=number, room_type=room_type, price_per_night=Decimal(price),
+            )
+            for number, room_type, price in (('101', 'Deluxe', '1000.00'), ('102', 'Deluxe', '1500.00'),
+                                             ('201', 'Suite', '3333.33'))
+        }
+        self.elsewhere = Room.objects.create(
+            hotel=self.other_hotel, room_number='101', room_type='Deluxe', price_per_night=Decimal('1000.00'),
+        )
+
+    def prices(self):
+        prices = dict(Room.objects.filter(hotel=self.hotel).values_list('room_number', 'price_per_night'))
+        prices['elsewhere'] = Room.objects.get(pk=self.elsewhere.pk).price_per_night
+        return prices
+
+    def test_price_modes(self):
+        self.assertEqual(rates.update_rooms(self.hotel.pk, 'add', '250.50'), 3)
+        self.assertEqual(self.prices(), {
+            '101': Decimal('1250.50'), '102': Decimal('1750.50'), '201': Decimal('3583.83'),
+            'elsewhere': Decimal('1000.00'),
+        })
+        rates.update_rooms(self.hotel.pk, 'percent', '-10')
+        self.assertEqual(self.prices(), {
+            '101': Decimal('1125.45'), '102': Decimal('1575.45'), '201': Decimal('3225.45'),
+            'elsewhere': Decimal('1000.00'),
+        })
+        rates.update_rooms(self.hotel.pk, 'set', '999')
+        self.assertEqual(set(self.prices().values()), {Decimal('999.00'), Decimal('1000.00')})
+
+    def test_out_of_range_changes_nothing(self):
+        before = self.prices()
+        with self.assertRaises(rates.PriceChangeError):
+            rates.update_rooms(self.hotel.pk, 'add', '-1000', available=False)
+        with self.assertRaises(rates.PriceChangeError):
+            rates.update_rooms(self.hotel.pk, 'percent', '30000')
+        self.assertEqual(self.prices(), before)
+        self.assertFalse(Room.objects.filter(is_available=False).exists())
+
+    def test_scoped_to_room_type_or_rooms(self):
+        self.assertEqual(rates.update_rooms(self.hotel.pk, 'set', '2000', room_type='Deluxe'), 2)
+        self.assertEqual(self.prices()['201'], Decimal('3333.33'))
+        room_ids = [self.rooms['101'].pk, self.elsewhere.pk]
+        self.assertEqual(rates.update_rooms(self.hotel.pk, available=False, room_ids=room_ids), 1)
+        self.assertEqual(list(Room.objects.filter(is_available=False)), [self.rooms['101']])
+
+    def test_scheduled_changes(self):
+        today = date(2026, 3, 1)
+        applied = ScheduledRateChange.objects.create(
+            hotel=self.hotel, room_type='Suite', mode='add', amount=Decimal('100'), effective_on=today,
+        )
+        failed = ScheduledRateChange.objects.create(
+            hotel=self.hotel, mode='set', amount=Decimal('0'), effective_on=today - timedelta(days=1),
+        )
+        later = ScheduledRateChange.objects.create(
+            hotel=self.hotel, mode='set', amount=Decimal('1'), effective_on=today + timedelta(days=1),
+        )
+
+        self.assertEqual(rates.apply_due_changes(today), 2)
+        applied.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual((applied.status, applied.rooms_updated), ('APPLIED', 1))
+        self.assertEqual(failed.status, 'FAILED')
+        self.assertEqual(failed.error, "This would bring a room's price down to 0.")
+        self.assertEqual(ScheduledRateChange.objects.get(pk=later.pk).status, 'PENDING')
+        self.assertEqual(self.prices()['201'], Decimal('3433.33'))
+
+        # Applied once: a second run the same day has nothing to do
+        self.assertEqual(rates.apply_due_changes(today), 0)
+        self.assertEqual(self.prices()['201'], Decimal('3433.33'))
+
+
+class AutocompleteLogTests(TestCase):
+    """Saves append to the change log; the snapshot is only rewritten by compaction."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'autocomplete.json')
+        settings = override_settings(AUTOCOMPLETE_SNAPSHOT_PATH=self.path, AUTOCOMPLETE_RELOAD_SECONDS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.new_worker()
+        self.addCleanup(self.new_worker)
+
+        self.hotel = make_hotel('Sea View Resort', 'Goa')
+        autocomplete.rebuild()
+        self.snapshot = autocomplete._stat(self.path)
+
+    def new_worker(self):
+        """Forgets the loaded index, like a worker that just started."""
+        autocomplete._index = autocomplete._loaded = None
+        autocomplete._log = (None, 0)
+
+    def rename(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hotel.hotel_name = name
+            self.hotel.save()
+
+    def suggestions(self, query):
+        return [(item['kind'], item['text']) for item in autocomplete.suggest(query)]
+
+    def log_lines(self):
+        with open(autocomplete.log_path(self.path)) as f:
+            return f.read().splitlines()[1:]
+
+    def test_saves_append_to_the_log(self):
+        self.rename('Palm Grove')
+        self.rename('Palm Grove Inn')
+        self.assertEqual(autocomplete._stat(self.path), self.snapshot)
+        self.assertEqual(len(self.log_lines()), 2)
+        self.assertEqual(self.suggestions('palm'), [('hotel', 'Palm Grove Inn')])
+        self.assertEqual(self.suggestions('sea'), [])
+
+        # Another worker: the snapshot plus the log
+        entries = dict(autocomplete._index.entries)
+        self.new_worker()
+        self.assertEqual(self.suggestions('palm'), [('hotel', 'Palm Grove Inn')])
+        self.assertEqual(autocomplete._index.entries, entries)
+
+    def test_replays_lines_from_other_workers(self):
+        self.assertEqual(self.suggestions('zeb'), [])
+        changes = autocomplete.changes([], autocomplete.hotel_items('Zebra Inn', 'Goa'))
+        with open(autocomplete.log_path(self.path), 'a') as f:
+            f.write(json.dumps(changes) + '\n')
+            # Half written: left for the next check
+            f.write('[["hotel","Yak')
+        self.assertEqual(self.suggestions('zeb'), [('hotel', 'Zebra Inn')])
+        self.assertEqual(self.suggestions('yak'), [])
+
+    def test_compaction(self):
+        with override_settings(AUTOCOMPLETE_LOG_COMPACT_BYTES=1):
+            self.rename('Palm Grove')
+        self.assertNotEqual(autocomplete._stat(self.path), self.snapshot)
+        self.assertEqual(self.log_lines(), [])
+        self.rename('Palm Grove Inn')
+        self.assertEqual(len(self.log_lines()), 1)
+
+        self.new_worker()
+        self.assertEqual(self.suggestions('palm'), [('hotel', 'Palm Grove Inn')])
+        self.assertEqual(autocomplete._index.entries, autocomplete.build_index().entries)
+
+    def test_missing_log_is_started_again(self):
+        os.remove(autocomplete.log_path(self.path))
+        self.rename('Palm Grove')
+        self.assertEqual(self.log_lines(), [])
+        self.new_worker()
+        self.assertEqual(self.suggestions('palm'), [('hotel', 'Palm Grove')])
+
+
+class ImportRoomsCommandTests(TestCase):
+
+    def test_hotel_by_uuid(self):
+        hotel = make_hotel()
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('room_number,room_type,price_per_night\n901,Standard,1500\n')
+        self.addCleanup(os.remove, f.name)
+
+        call_command('import_rooms', str(hotel.pk), f.name, stdout=StringIO())
+        self.assertTrue(Room.objects.filter(hotel=hotel, room_number='901').exists())
+
+        for hotel_id in ('12', 'fa7f6eff-0000-4000-8000-000000000000'):
+            with self.assertRaisesMessage(CommandError, 'No hotel'):
+                call_command('import_rooms', hotel_id, f.name, stdout=StringIO())
+
+
+class OwnerRoomTransferTests(TestCase):
+    """The owners' export and import pages only ever touch the owner's own hotel."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sea_view, cls.hill_top = make_hotel('Sea View'), make_hotel('Hill Top')
+        for number, room_type, price, available in (('101', 'Deluxe', 1000, True), ('102', 'Suite', 2500, False)):
+            Room.objects.create(
+                hotel=cls.sea_view, room_number=number, room_type=room_type, price_per_night=Decimal(price),
+                is_available=available,
+            )
+        Room.objects.create(hotel=cls.hill_top, room_number='101', room_type='Deluxe', price_per_night=Decimal(900))
+
+    def room_numbers(self, hotel):
+        return sorted(Room.objects.filter(hotel=hotel).values_list('room_number', flat=True))
+
+    def export(self, fmt):
+        response = self.client.get(reverse('owner_room_export'), {'format': fmt})
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_export_streams_the_owners_rooms(self):
+        self.client.force_login(self.sea_view.owner)
+        response, content = self.export('csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="sea-view-rooms.csv"')
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(tuple(rows[0]), bulk_rooms.FIELDS)
+        self.assertEqual([row['room_number'] for row in rows], ['101', '102'])
+
+        response, content = self.export('json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual([room['room_number'] for room in json.loads(content)], ['101', '102'])
+        self.assertEqual(self.client.get(reverse('owner_room_export'), {'format': 'xml'}).status_code, 400)
+
+    def test_import_goes_to_the_owners_hotel(self):
+        self.client.force_login(self.sea_view.owner)
+        exported = self.export('csv')[1].encode()
+
+        # Naming Sea View's hotel doesn't make Hill Top's owner import into it
+        self.client.force_login(self.hill_top.owner)
+        response = self.client.post(reverse('owner_room_import'), {
+            'rooms_file': SimpleUploadedFile('rooms.csv', exported),
+            'hotel': str(self.sea_view.pk),
+        })
+        result = response.context['result']
+        self.assertEqual((result.rows, result.created, result.error_count), (2, 1, 1))
+        self.assertEqual(self.room_numbers(self.hill_top), ['101', '102'])
+        self.assertEqual(self.room_numbers(self.sea_view), ['101', '102'])
+
+        # Guests aren't owners: nothing is imported
+        self.client.force_login(CustomUser.objects.create_user(username='guest', password='pw'))
+        response = self.client.post(reverse('owner_room_import'), {
+            'rooms_file': SimpleUploadedFile('rooms.csv', exported.replace(b'102', b'103')),
+        })
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertFalse(Room.objects.filter(room_number='103').exists())
+
+
+class PhotoVariantsCommandTests(TransactionTestCase):
+    """generate_photo_variants backfills the resized copies through its process pool."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        photo = BytesIO()
+        Image.new('RGB', (800, 400), 'teal').save(photo, format='PNG')
+        self.room = Room.objects.create(
+            hotel=make_hotel(), room_number='101', room_type='Deluxe', price_per_night=Decimal('1000.00'),
+            photo=ContentFile(photo.getvalue(), name='room.png'),
+        )
+
+    def backfill(self, *args):
+        out = StringIO()
+        call_command('generate_photo_variants', '--workers', '1', *args, stdout=out, stderr=out)
+        return out.getvalue()
+
+    def test_backfill(self):
+        self.assertIn("Processed 1 photos (0 failed)", self.backfill())
+        self.room.refresh_from_db()
+        variants = self.room.photo_variants
+        self.assertEqual(list(variants), [ext for ext, _, _ in images.supported_formats()])
+        for ext, sizes in variants.items():
+            # 1024 would be an upscale of the 800px original
+            self.assertEqual([width for width, _ in sizes], [320, 640])
+            for width, name in sizes:
+                self.assertTrue(name.endswith(f"-{width}w.{ext}"))
+                with default_storage.open(name) as f:
+                    self.assertEqual(Image.open(f).size, (width, width // 2))
+
+        self.assertIn("No room photos to process.", self.backfill())
+        # Same photo, same file names: nothing is resized again
+        stored = sorted(default_storage.listdir(images.VARIANT_DIR)[1])
+        self.assertIn("Processed 1 photos (0 failed)", self.backfill('--all'))
+        self.assertEqual(sorted(default_storage.listdir(images.VARIANT_DIR)[1]), stored)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.photo_variants, variants)
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    """
+    Smoke runs of the benchmark commands on a tiny dataset. They normally
+    create their own test database; here they use the one of this test.
+    """
+    dataset = [
+        '--hotels', '2', '--rooms-per-hotel', '3', '--users', '4', '--reviews', '5', '--favourites', '4',
+        '--payments', '2', '--seed', '1',
+    ]
+
+    def run_command(self, module, *args):
+        setup = mock.patch.multiple(
+            module,
+            setup_test_environment=mock.DEFAULT, teardown_test_environment=mock.DEFAULT,
+            setup_databases=mock.DEFAULT, teardown_databases=mock.DEFAULT,
+        )
+        with setup as patched, tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            name = module.__name__.rsplit('.', 1)[1]
+            call_command(name, *self.dataset, *args, '--output', output.name, stderr=StringIO())
+            report = json.load(output)
+        patched['teardown_databases'].assert_called_once()
+        self.assertEqual(report['dataset']['hotels'], 2)
+        self.assertEqual(report['dataset']['rooms'], 6)
+        return report
+
+    def test_benchmark_funnel(self):
+        report = self.run_command(benchmark_funnel, '--iterations', '3', '--warmup', '1')
+        steps = report['steps']
+        self.assertEqual(steps['search']['requests'], 3)
+        self.assertEqual(steps['verify']['requests'], report['funnels_completed'])
+        self.assertGreater(report['funnels_completed'], 0)
+        self.assertEqual([step['errors'] for step in steps.values()], [0] * len(steps))
+
+    def assert_concurrency_run(self, server):
+        report = self.run_command(
+            benchmark_concurrency, '--server', server, '--concurrency', '2', '--requests', '8', '--warmup', '2',
+        )
+        [run] = report['runs']
+        self.assertEqual((run['server'], run['concurrency'], run['requests'], run['errors']), (server, 2, 8, 0))
+
+    def test_benchmark_concurrency_wsgi(self):
+        self.assert_concurrency_run('wsgi')
+
+    def test_benchmark_concurrency_asgi(self):
+        self.assert_concurrency_run('asgi')
+
+
+class FavouriteCardsTests(TestCase):
+    """The hearts on a page of room cards come from one favourites query."""
+
+    def setUp(self):
+        cache.clear()
+        hotel = make_hotel()
+        self.rooms = [
+            Room.objects.create(
+                hotel=hotel, room_number=f"{100 + i}", room_type='Deluxe room', price_per_night=Decimal('1000.00') + i,
+            )
+            for i in range(6)
+        ]
+        self.user = CustomUser.objects.create_user(username='guest', password='pw')
+        for room in self.rooms[:2]:
+            Favourite.objects.create(user=self.user, room=room)
+        self.client.force_login(self.user)
+
+    def favourites_queries(self):
+        table = Favourite._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('room_results'), {'query': 'room'})
+        self.assertEqual(len(response.context['rooms']), 6)
+        self.assertContains(response, 'class="btn-love loved"', count=2)
+        return [query['sql'] for query in queries if table in query['sql']]
+
+    def test_one_query_per_page(self):
+        self.assertEqual(len(self.favourites_queries()), 1)
+        # Then served from the cache until the user's favourites change
+        self.assertEqual(self.favourites_queries(), [])
+
+
+class ToggleFavouriteTests(TransactionTestCase):
+    """Outside a transaction, like a request: the statements a toggle sends."""
+
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.create(
+            hotel=make_hotel(), room_number='101', room_type='Deluxe', price_per_night=Decimal('1000.00'),
+        )
+        self.user = CustomUser.objects.create_user(username='guest', password='pw')
+
+    def statements(self, function):
+        with CaptureQueriesContext(connection) as queries:
+            result = function()
+        return result, [query['sql'].split()[0] for query in queries]
+
+    def test_one_write_per_toggle(self):
+        self.assertEqual(favourites.favourite_room_ids(self.user), frozenset())
+
+        loved, sql = self.statements(lambda: favourites.toggle(self.user, self.room.pk))
+        self.assertTrue(loved)
+        self.assertEqual(sql, ['DELETE', 'INSERT'])
+        self.assertEqual(favourites.favourite_room_ids(self.user), {self.room.pk})
+
+        loved, sql = self.statements(lambda: favourites.toggle(self.user, self.room.pk))
+        self.assertFalse(loved)
+        self.assertEqual(sql, ['DELETE'])
+        self.assertEqual(favourites.favourite_room_ids(self.user), frozenset())
+
+    @override_settings(FAVOURITES_WRITE_BEHIND_SECONDS=60)
+    @mock.patch.object(favourites, '_schedule_flush')
+    def test_flush_writes_buffered_toggles(self, schedule_flush):
+        other = Room.objects.create(
+            hotel=self.room.hotel, room_number='102', room_type='Deluxe', price_per_night=Decimal('1000.00'),
+        )
+        Favourite.objects.create(user=self.user, room=other)
+
+        self.assertTrue(favourites.toggle(self.user, self.room.pk))
+        self.assertFalse(favourites.toggle(self.user, other.pk))
+        self.assertEqual(schedule_flush.call_count, 2)
+        # Pending: the hearts show the new state, the table doesn't yet
+        self.assertEqual(favourites.favourite_room_ids(self.user), {self.room.pk})
+        self.assertEqual(set(Favourite.objects.values_list('room_id', flat=True)), {other.pk})
+
+        flushed, sql = self.statements(lambda: favourites.flush([self.user.pk]))
+        self.assertEqual(flushed, 1)
+        self.assertEqual((sql.count('INSERT'), sql.count('DELETE')), (1, 1))
+        self.assertEqual(set(Favourite.objects.values_list('room_id', flat=True)), {self.room.pk})
+        self.assertEqual(favourites.favourite_room_ids(self.user), {self.room.pk})
+        self.assertEqual(favourites.flush([self.user.pk]), 0)
+
+    async def test_async_toggle_of_a_missing_room(self):
+        with self.assertRaises(Room.DoesNotExist):
+            await favourites.atoggle(self.user, uuid.uuid4())
+        self.assertFalse(await Favourite.objects.aexists())
+
+
+class FanoutQueryObserverTests(TransactionTestCase):
+    """Outside a transaction fanout.run() uses its pool; observers still see every query."""
+
+    def test_pool_queries_are_observed(self):
+        make_hotel()
+        threads = []
+
+        def observer(execute, sql, params, many, context):
+            threads.append(threading.current_thread().name)
+            return execute(sql, params, many, context)
+
+        with profiling.observe_queries(observer):
+            results = fanout.run({
+                'rooms': lambda: Room.objects.count(),
+                'hotels': lambda: Hotel.objects.count(),
+            })
+        self.assertEqual(results, {'rooms': 0, 'hotels': 1})
+        self.assertEqual(len(threads), 2)
+        self.assertTrue(all(name.startswith('fanout') for name in threads))
+
+        # Removed again when the block ends
+        fanout.run({'rooms': lambda: Room.objects.count(), 'hotels': lambda: Hotel.objects.count()})
+        self.assertEqual(len(threads), 2)
+
+
+@mock.patch.object(db_routing, 'replica_aliases', return_value=['replica0'])
+class ReplicaRoutingTests(SimpleTestCase):
+    """Where ReplicaRoutingMiddleware and PrimaryReplicaRouter send a request's queries."""
+
+    def serve(self, request, use_read_replica=True, write=False):
+        """Runs a view through the middleware. Returns (response, [database per read/write])."""
+        databases = []
+
+        def view(request):
+            databases.append(router.db_for_read(Room))
+            if write:
+                databases.append(router.db_for_write(Room))
+                databases.append(router.db_for_read(Room))
+            return HttpResponse()
+        view.use_read_replica = use_read_replica
+
+        def get_response(request):
+            return middleware.process_view(request, view, (), {}) or view(request)
+        middleware = db_routing.ReplicaRoutingMiddleware(get_response)
+        return middleware(request), databases
+
+    def test_reads_go_to_the_replica(self, replica_aliases):
+        response, databases = self.serve(RequestFactory().get('/'))
+        self.assertEqual(databases, ['replica0'])
+        self.assertNotIn(db_routing.STICKY_COOKIE, response.cookies)
+        # Outside a request, and for views that didn't opt in: the primary
+        self.assertEqual(router.db_for_read(Room), 'default')
+        self.assertEqual(self.serve(RequestFactory().get('/'), use_read_replica=False)[1], ['default'])
+
+    def test_writes_go_to_the_primary(self, replica_aliases):
+        response, databases = self.serve(RequestFactory().get('/'), write=True)
+        # Reads after the write see it
+        self.assertEqual(databases, ['replica0', 'default', 'default'])
+        self.assertIn(db_routing.STICKY_COOKIE, response.cookies)
+
+        response, databases = self.serve(RequestFactory().post('/'))
+        self.assertEqual(databases, ['default'])
+        self.assertIn(db_routing.STICKY_COOKIE, response.cookies)
+
+    def test_writers_stay_on_the_primary(self, replica_aliases):
+        response, _ = self.serve(RequestFactory().post('/'))
+        cookie = response.cookies[db_routing.STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], db_routing.sticky_seconds())
+
+        request = RequestFactory().get('/')
+        request.COOKIES[db_routing.STICKY_COOKIE] = cookie.value
+        self.assertEqual(self.serve(request)[1], ['default'])
+
+        request.COOKIES[db_routing.STICKY_COOKIE] = str(int(time.time()) - 1)
+        self.assertEqual(self.serve(request)[1], ['replica0'])
+        request.COOKIES[db_routing.STICKY_COOKIE] = 'garbage'
+        self.assertEqual(self.serve(request)[1], ['replica0'])
+
+
+# URLconf of AsyncViewTests: the async variants, as served with ASYNC_VIEWS on
+urlpatterns = [
+    path('rooms/results/', views.AsyncRoomResultsView.as_view(), name='room_results'),
+    path('favourites/toggle/', views.AsyncToggleFavouriteView.as_view(), name='toggle_favourite'),
+    path('favourites/', views.AsyncFavouriteRoomsView.as_view(), name='user_favourites'),
+    path('room/<uuid:pk>/', views.AsyncRoomDetailView.as_view(), name='room_detail'),
+    path('', include('ho_ho_hotel_project.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewTests(TestCase):
+    """
+    The async views through AsyncClient. The sync helpers they replace raise,
+    so a view falling back to them (and querying from the event loop) fails.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        hotel = make_hotel()
+        hotel.latitude, hotel.longitude = 15.5, 73.8
+        hotel.save()
+        cls.rooms = [
+            Room.objects.create(
+                hotel=hotel, room_number=f"{100 + i}", room_type='Deluxe',
+                price_per_night=Decimal('1000.00') + i,
+            )
+            for i in range(12)
+        ]
+        cls.user = CustomUser.objects.create_user(username='guest', password='pw')
+
+    def setUp(self):
+        cache.clear()
+
+    def sync_path(self, module, *names):
+        patches = [mock.patch.object(module, name, side_effect=AssertionError(name)) for name in names]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_results(self):
+        self.sync_path(facets, 'nearby_hotels', 'facet_counts')
+        self.sync_path(caching, 'cached_search_page', 'catalog_version')
+        url = reverse('room_results')
+        params = {'lat': '15.5', 'lng': '73.8', 'radius_km': '5'}
+
+        response = await self.async_client.get(url, params)
+        page = response.context['page_obj']
+        self.assertEqual([room.pk for room in page], [room.pk for room in self.rooms[:10]])
+        self.assertEqual(response.context['rooms'][0].distance_km, 0.0)
+        self.assertEqual(response.context['facets']['place'], [('Goa', 12)])
+
+        response = await self.async_client.get(url, {**params, 'cursor': page.next_cursor})
+        self.assertEqual([room.pk for room in response.context['page_obj']], [room.pk for room in self.rooms[10:]])
+        # Served from the cached id list
+        response = await self.async_client.get(url, params)
+        self.assertEqual([room.pk for room in response.context['page_obj']], [room.pk for room in self.rooms[:10]])
+
+    async def test_favourites(self):
+        self.sync_path(caching, 'catalog_version')
+        await Favourite.objects.acreate(user=self.user, room=self.rooms[3])
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(reverse('user_favourites'))
+        self.assertEqual([room.pk for room in response.context['favourite_rooms']], [self.rooms[3].pk])
+
+    async def test_detail(self):
+        self.sync_path(ratings, 'review_status')
+        self.sync_path(caching, 'room_version')
+        room = self.rooms[0]
+        url = reverse('room_detail', kwargs={'pk': room.pk})
+        await Payment.objects.acreate(
+            user=self.user, room=room, amount=Decimal('1000.00'), check_in='2026-01-01', check_out='2026-01-02',
+            razorpay_order_id='order_1', status='PAID',
+        )
+
+        response = await self.async_client.get(url)
+        self.assertEqual(response.context['room'], room)
+        self.assertFalse(response.context['can_review'])
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(url)
+        self.assertTrue(response.context['can_review'])
+
+        response = await self.async_client.get(reverse('room_detail', kwargs={'pk': '00000000-0000-0000-0000-000000000000'}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_toggle(self):
+        self.sync_path(favourites, 'toggle')
+        url = reverse('toggle_favourite')
+        body = json.dumps({'room_id': str(self.rooms[0].pk)})
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.post(url, body, content_type='application/json')
+        self.assertTrue(response.json()['is_loved'])
+        self.assertTrue(await Favourite.objects.filter(user=self.user, room=self.rooms[0]).aexists())
+        response = await self.async_client.post(url, body, content_type='application/json')
+        self.assertFalse(response.json()['is_loved'])
+        self.assertFalse(await Favourite.objects.filter(user=self.user).aexists())
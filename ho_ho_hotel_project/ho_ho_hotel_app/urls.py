@@ -1,17 +1,32 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
+
+def as_view(view):
+    # Under ASGI (ASYNC_VIEWS, see asgi.py) the async variant is served where there is one
+    if getattr(settings, 'ASYNC_VIEWS', False):
+        view = views.ASYNC_VARIANTS.get(view, view)
+    return view.as_view()
+
 urlpatterns=[
     path('', views.HomePageView.as_view(), name='home'),
     path('owner/rooms/add/', views.RoomCreateView.as_view(), name='add_room'),
     path('rooms/edit/<uuid:pk>/', views.OwnerRoomUpdateView.as_view(), name='owner_room_edit'),
     path('rooms/delete/<uuid:pk>/', views.OwnerRoomDeleteView.as_view(), name='owner_room_delete'),
     path('rooms/search/', views.RoomSearchView.as_view(), name='room_search'),
-    path('rooms/results/', views.RoomResultsView.as_view(), name='room_results'),
-    path('favourites/toggle/', views.ToggleFavouriteView.as_view(), name='toggle_favourite'),
-    path('favourites/', views.FavouriteRoomsView.as_view(), name='user_favourites'),
-    path('room/<uuid:pk>/', views.RoomDetailView.as_view(), name='room_detail'),
+    path('rooms/results/', as_view(views.RoomResultsView), name='room_results'),
+    path('api/rooms/search/', views.RoomSearchAPIView.as_view(), name='room_search_api'),
+    path('api/rooms/suggest/', views.AutocompleteView.as_view(), name='room_suggest'),
+    path('favourites/toggle/', as_view(views.ToggleFavouriteView), name='toggle_favourite'),
+    path('favourites/', as_view(views.FavouriteRoomsView), name='user_favourites'),
+    path('room/<uuid:pk>/', as_view(views.RoomDetailView), name='room_detail'),
     path('room/<uuid:room_id>/review/submit/', views.ReviewSubmissionView.as_view(), name='submit_review'),
-    path('owner/rooms/', views.OwnerRoomListView.as_view(), name='owner_room_list')
+    path('owner/rooms/', views.OwnerRoomListView.as_view(), name='owner_room_list'),
+    path('owner/rooms/import/', views.OwnerRoomImportView.as_view(), name='owner_room_import'),
+    path('owner/rooms/export/', views.OwnerRoomExportView.as_view(), name='owner_room_export'),
+    path('owner/rooms/bulk-edit/', views.OwnerRoomBulkEditView.as_view(), name='owner_room_bulk_edit'),
+    path('owner/rate-changes/<int:pk>/cancel/', views.OwnerRateChangeCancelView.as_view(), name='owner_rate_change_cancel'),
+    path('cache/stats/', views.CacheStatsView.as_view(), name='cache_stats')
 ]
\ No newline at end of file
@@ -3,29 +3,71 @@ from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.http import require_POST
 from django.views.generic.edit import CreateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.generic import ListView, View, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin, AccessMixin
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin 
 from django.views.generic import TemplateView, UpdateView, DeleteView, ListView
-from django.http import Http404, HttpResponseForbidden, JsonResponse, HttpResponseBadRequest
+from django.http import Http404, HttpResponseForbidden, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.core.serializers.json import DjangoJSONEncoder
 from login_app.models import Hotel 
 from .models import Room, Favourite, Review
-from django.contrib import messages
-from .models import Room, Review
-from .forms import RoomForm, RoomSearchForm
+from django.contrib import admin, messages
+from .models import Room, Review, ScheduledRateChange
+from .forms import RoomBulkEditForm, RoomForm, RoomImportUploadForm, RoomSearchForm
+from .search import search_rooms
+from .context_processors import get_favourite_room_ids
+from . import autocomplete, bulk_rooms, caching, facets, fanout, favourites, profiling, rates, ratings
+from .images import schedule_room_photo
+from .pagination import CursorPaginationMixin, CursorPaginator, InvalidCursor
 from login_app.models import Hotel
-from django.db.models import Q
-from payment.models import Payment
+from django.db.models import F
 from django.db.models import Avg
-from decimal import Decimal, InvalidOperation
-import json, uuid, decimal
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+import inspect, json, uuid
 
 class HomePageView(View):
     
     def get(self, request, *args, **kwargs):
-        return render(request, 'ho_ho_hotel_app/home-page.html')
+        # The page body is a cached fragment keyed on the catalog version
+        return render(request, 'ho_ho_hotel_app/home-page.html', {
+            'catalog_version': caching.catalog_version(),
+        })
+
+class CacheStatsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Staff-only JSON view of the cache hit/miss counters. POST resets them."""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({'status': 'success', 'stats': caching.get_stats()})
+
+    def post(self, request, *args, **kwargs):
+        caching.reset_stats()
+        return JsonResponse({'status': 'success', 'stats': caching.get_stats()})
+
+class QueryProfilesView(View):
+    """Admin dashboard of sampled request profiles (see profiling.py). POST clears them."""
+
+    def get(self, request, *args, **kwargs):
+        profiles = profiling.recent_profiles()
+        return render(request, 'admin/query_profiles.html', {
+            **admin.site.each_context(request),
+            'title': 'Query profiles',
+            'profiles': profiles,
+            'offenders': profiling.worst_offenders(profiles),
+            'sample_rate': profiling.sample_rate(),
+            'repeat_threshold': profiling.repeat_threshold(),
+        })
+
+    def post(self, request, *args, **kwargs):
+        profiling.clear_profiles()
+        return redirect('query_profiles')
 
 class HotelOwnerRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
     
@@ -38,7 +80,20 @@ class HotelOwnerRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
     def test_func(self):
         return self.request.user.is_authenticated and self.request.user.is_hotel_owner
 
-class RoomCreateView(HotelOwnerRequiredMixin, CreateView):
+class RoomPhotoVariantsMixin:
+    """Kicks off thumbnail/WebP/AVIF generation when a room form uploads a new photo."""
+
+    def form_valid(self, form):
+        photo_changed = 'photo' in form.changed_data
+        if photo_changed:
+            # Old variants belong to the old photo, cards fall back to the original meanwhile
+            form.instance.photo_variants = {}
+        response = super().form_valid(form)
+        if photo_changed:
+            schedule_room_photo(self.object)
+        return response
+
+class RoomCreateView(HotelOwnerRequiredMixin, RoomPhotoVariantsMixin, CreateView):
     
     model = Room
     form_class = RoomForm
@@ -98,13 +153,135 @@ class OwnerRoomListView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
             context['hotel_registered'] = True
             rooms = Room.objects.filter(hotel=owner_hotel).order_by('room_number')
             context['rooms'] = rooms
+            context['bulk_form'] = RoomBulkEditForm(hotel=owner_hotel)
+            context['rate_changes'] = owner_hotel.rate_changes.filter(status='PENDING')
         except Hotel.DoesNotExist:
             context['hotel_registered'] = False
             context['message'] = 'You need to register your hotel details first before adding rooms.'
 
         return context
-    
-class OwnerRoomUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+
+class OwnerRoomImportView(HotelOwnerRequiredMixin, View):
+    """Adds many rooms from one CSV/JSON file and reports the rows it skipped (bulk_rooms.py)."""
+
+    template_name = 'ho_ho_hotel_app/room_import.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.user.is_authenticated and request.user.is_hotel_owner:
+            self.hotel = Hotel.objects.filter(owner=request.user).first()
+            if self.hotel is None:
+                messages.error(request, "Error: You do not have a registered hotel linked to your account.")
+                return redirect(reverse_lazy('home'))
+        return super().dispatch(request, *args, **kwargs)
+
+    def render_page(self, form, result=None):
+        return render(self.request, self.template_name, {
+            'form': form,
+            'result': result,
+            'hotel': self.hotel,
+            'fields': bulk_rooms.FIELDS,
+            'max_reported_errors': bulk_rooms.MAX_REPORTED_ERRORS,
+            'title': 'Import Rooms',
+        })
+
+    def get(self, request, *args, **kwargs):
+        return self.render_page(RoomImportUploadForm())
+
+    def post(self, request, *args, **kwargs):
+        form = RoomImportUploadForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return self.render_page(form)
+        upload = form.cleaned_data['rooms_file']
+        fmt = form.cleaned_data['format'] or bulk_rooms.format_for(upload.name)
+        try:
+            result = bulk_rooms.import_rooms(
+                self.hotel, bulk_rooms.read_rows(upload.file, fmt), dry_run=form.cleaned_data['dry_run'],
+            )
+        except bulk_rooms.ImportFileError as e:
+            form.add_error('rooms_file', str(e))
+            return self.render_page(form)
+        except IntegrityError:
+            # Another upload or form added one of these room numbers meanwhile
+            messages.error(request, "Your rooms changed while the file was imported. Nothing was added, please try again.")
+            return self.render_page(form)
+
+        if result.dry_run:
+            messages.info(request, f"{result.valid} of {result.rows} rows are ready to import.")
+        else:
+            messages.success(request, f"{result.created} of {result.rows} rooms imported.")
+        return self.render_page(RoomImportUploadForm(), result)
+
+class OwnerRoomExportView(HotelOwnerRequiredMixin, View):
+    """The owner's rooms as CSV (default) or JSON, ?format=json, in the columns the import reads."""
+
+    content_types = {
+        'csv': 'text/csv; charset=utf-8',
+        'json': 'application/json',
+    }
+
+    def get(self, request, *args, **kwargs):
+        hotel = Hotel.objects.filter(owner=request.user).first()
+        if hotel is None:
+            raise Http404("No hotel registered.")
+        fmt = request.GET.get('format', 'csv')
+        if fmt not in bulk_rooms.FORMATS:
+            return HttpResponseBadRequest("format must be csv or json")
+        rows = bulk_rooms.export_json(hotel) if fmt == 'json' else bulk_rooms.export_csv(hotel)
+        filename = f"{slugify(hotel.hotel_name) or 'hotel'}-rooms.{fmt}"
+        return StreamingHttpResponse(rows, content_type=self.content_types[fmt], headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+        })
+
+class OwnerRoomBulkEditView(HotelOwnerRequiredMixin, View):
+    """Applies one price/availability change to many rooms, or schedules it (rates.py)."""
+
+    def post(self, request, *args, **kwargs):
+        hotel = Hotel.objects.filter(owner=request.user).first()
+        if hotel is None:
+            messages.error(request, "Error: You do not have a registered hotel linked to your account.")
+            return redirect(reverse_lazy('home'))
+        form = RoomBulkEditForm(request.POST, hotel=hotel)
+        if not form.is_valid():
+            for field_errors in form.errors.values():
+                messages.error(request, ' '.join(field_errors))
+            return redirect('owner_room_list')
+
+        data = form.cleaned_data
+        if form.is_scheduled():
+            ScheduledRateChange.objects.create(
+                hotel=hotel, room_type=data['room_type'], mode=data['price_mode'],
+                amount=data['amount'], effective_on=data['effective_on'],
+            )
+            messages.success(request, f"Price change scheduled for {data['effective_on']:%d %b %Y}.")
+            return redirect('owner_room_list')
+        try:
+            updated = rates.update_rooms(
+                hotel.pk,
+                price_mode=data['price_mode'],
+                amount=data['amount'],
+                available=form.available(),
+                room_type=data['room_type'],
+                room_ids=[room.pk for room in data['rooms']] or None,
+            )
+        except rates.PriceChangeError as e:
+            messages.error(request, f"Nothing was changed: {e}")
+        else:
+            messages.success(request, f"{updated} rooms updated.")
+        return redirect('owner_room_list')
+
+class OwnerRateChangeCancelView(HotelOwnerRequiredMixin, View):
+
+    def post(self, request, *args, **kwargs):
+        deleted, _ = ScheduledRateChange.objects.filter(
+            pk=self.kwargs['pk'], hotel__owner=request.user, status='PENDING',
+        ).delete()
+        if deleted:
+            messages.success(request, "Scheduled price change cancelled.")
+        else:
+            messages.error(request, "That price change was already applied or cancelled.")
+        return redirect('owner_room_list')
+
+class OwnerRoomUpdateView(LoginRequiredMixin, UserPassesTestMixin, RoomPhotoVariantsMixin, UpdateView):
     
     model = Room
     form_class = RoomForm 
@@ -119,21 +296,26 @@ class OwnerRoomUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         try:
             room = self.get_object()
             owner_hotel = Hotel.objects.get(owner=self.request.user)
-            return room.hotel == owner_hotel
+            return room.hotel_id == owner_hotel.pk
         except Hotel.DoesNotExist:
             return False
         except Room.DoesNotExist:
             return False
 
+    def get_object(self, queryset=None):
+        # Asked for by test_func() and again by get()/post(): one query
+        if not hasattr(self, '_room'):
+            self._room = super().get_object(queryset)
+        return self._room
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         room = self.object
         all_reviews = room.reviews.all().select_related('user').order_by('-created_at')
-        avg_rating_data = all_reviews.aggregate(Avg('rating'))
-        avg_rating = avg_rating_data['rating__avg']
         context['reviews'] = all_reviews
-        context['avg_rating'] = round(avg_rating, 2) if avg_rating is not None else 0.0
-        context['review_count'] = all_reviews.count()
+        # Aggregates are stored on the room row (see ratings.py)
+        context['avg_rating'] = room.rating_avg
+        context['review_count'] = room.review_count
         return context
 
     def handle_no_permission(self):
@@ -177,59 +359,246 @@ class RoomSearchView(ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        if self.request.user.is_authenticated:
-            favorited_room_ids = Favourite.objects.filter(
-                user=self.request.user
-            ).values_list('room_id', flat=True)
-            context['favorited_room_ids'] = [str(uuid) for uuid in favorited_room_ids]
-        else:
-            context['favorited_room_ids'] = []
+        # Shares the request-wide favourites set used by the is_favorited tag
+        favorited_room_ids = get_favourite_room_ids(self.request)
+        context['favorited_room_ids'] = [str(uuid) for uuid in favorited_room_ids]
+        context['form'] = RoomSearchForm()
         return context
 
-class RoomResultsView(ListView):
-    
+class RoomSearchMixin:
+    """Builds the room search queryset from RoomSearchForm, for the results page and the JSON API."""
     model = Room
-    template_name = 'ho_ho_hotel_app/room_results_list.html'
-    context_object_name = 'rooms'
-    paginate_by = 10 
+
+    def get_form(self):
+        # Validated once, shared by get_queryset() and the template
+        if not hasattr(self, '_form'):
+            self._form = RoomSearchForm(self.request.GET)
+        return self._form
+
+    def get_nearby(self):
+        """{hotel_id: distance_km} around the searched point (None without one), looked up once."""
+        if not hasattr(self, '_nearby'):
+            data = self.get_form().cleaned_data
+            self._nearby = facets.nearby_hotels(data) if facets.has_location(data) else None
+        return self._nearby
 
     def get_queryset(self):
         
         queryset = self.model.objects.none()        
-        form = RoomSearchForm(self.request.GET)         
+        form = self.get_form()
         if form.is_valid():
             query = form.cleaned_data.get('query')                        
-            if query:
-                queryset = self.model.objects.filter(is_available=True)
-                q_objects = Q()
-                q_objects |= Q(hotel__hotel_name__icontains=query)
-                q_objects |= Q(hotel__place__icontains=query)
-                q_objects |= Q(room_type__icontains=query)
-                q_objects |= Q(room_number__iexact=query)                 
-                
-                try:
-                    search_price = Decimal(query.strip())
-                    q_objects |= Q(price_per_night__lte=search_price)
-                except (decimal.InvalidOperation, ValueError):
-                    pass
-                
-                queryset = queryset.filter(q_objects)
-        
-        
+            if facets.has_filters(form.cleaned_data):
+                # Cards show the hotel name, fetch it in the same query
+                queryset = self.model.objects.filter(is_available=True).select_related('hotel')
+                # Price range, guests, place, room type, rating and stay dates
+                queryset = facets.filter_rooms(queryset, form.cleaned_data, nearby=self.get_nearby())
+
+                if not query:
+                    queryset = queryset.order_by('price_per_night', 'room_number')
+                else:
+                    # Ranked lookup through the token index (see search.py)
+                    queryset = search_rooms(query, queryset)
+
+                if form.cleaned_data.get('sort') == 'rating':
+                    # Sorts on the stored aggregates, no join against reviews
+                    queryset = queryset.order_by('-rating_avg', '-review_count', 'price_per_night', 'room_number')
+                elif form.cleaned_data.get('sort') == 'distance':
+                    # Haversine on the hotel's coordinates, only for the rows already filtered
+                    queryset = facets.annotate_distance(queryset, form.cleaned_data)
+                    queryset = queryset.order_by('distance_km', 'price_per_night', 'room_number')
+                return queryset
+
         return queryset.order_by('price_per_night', 'room_number')
 
+
+class RoomResultsView(RoomSearchMixin, CursorPaginationMixin, ListView):
+    
+    template_name = 'ho_ho_hotel_app/room_results_list.html'
+    context_object_name = 'rooms'
+    paginate_by = 10 
+    # Read-only: served from a replica (see db_routing.py)
+    use_read_replica = True
+
+    def paginate_queryset(self, queryset, page_size):
+        if queryset.query.is_empty():
+            return super().paginate_queryset(queryset, page_size)
+        # Each page (search + cursor) is cached as a list of room ids (see caching.py)
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        paginate = super().paginate_queryset
+        page = caching.cached_search_page(self.request.GET, lambda: paginate(queryset, page_size)[1])
+        return paginator, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
-        context['form'] = RoomSearchForm(self.request.GET) 
+        form = self.get_form()
+        context['form'] = form
         context['title'] = 'Search Results' 
+        if form.is_valid() and facets.has_filters(form.cleaned_data):
+            context['facets'] = self.get_facets()
+            distances = self.get_nearby()
+            if distances is not None:
+                # Cached pages hold plain rooms, so the distance is set here
+                for room in context['rooms']:
+                    room.distance_km = distances.get(room.hotel_id)
 
         return context
+
+    def get_facets(self):
+        if not hasattr(self, '_facets'):
+            self._facets = facets.facet_counts(self.get_form().cleaned_data, self.get_nearby())
+        return self._facets
+
+
+def search_etag(request, *args, **kwargs):
+    # Changes with the query string and with any write to the catalog
+    return caching.search_etag(request.GET)
+
+
+@method_decorator(condition(etag_func=search_etag), name='get')
+class RoomSearchAPIView(RoomSearchMixin, View):
+    """
+    JSON version of RoomResultsView for the search page's scripts.
+
+    Same parameters as the results page, plus:
+        fields  comma separated names from `api_fields` (default: all but the
+                description and photo), only those columns are loaded
+        limit   rooms per response (max `max_limit`)
+        cursor  the `next` value of the previous response
+
+    Answers If-None-Match with 304 while the catalog is unchanged, and
+    streams the rooms as they are read from the database.
+    """
+    use_read_replica = True
+    # Name in the response -> field path loaded with .only() (None: computed)
+    api_fields = {
+        'id': 'id',
+        'room_number': 'room_number',
+        'room_type': 'room_type',
+        'price_per_night': 'price_per_night',
+        'max_occupancy': 'max_occupancy',
+        'rating_avg': 'rating_avg',
+        'review_count': 'review_count',
+        'hotel_name': 'hotel__hotel_name',
+        'place': 'hotel__place',
+        'url': None,
+        'distance_km': None,
+        'description': 'description',
+        'photo': 'photo',
+    }
+    default_fields = ('id', 'room_number', 'room_type', 'price_per_night', 'max_occupancy',
+                      'rating_avg', 'review_count', 'hotel_name', 'place', 'url')
+    default_limit = 20
+    max_limit = 100
+
+    def get_fields(self):
+        names = self.request.GET.get('fields')
+        if not names:
+            return list(self.default_fields)
+        fields = list(dict.fromkeys(name.strip() for name in names.split(',') if name.strip()))
+        unknown = [name for name in fields if name not in self.api_fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return fields
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', self.default_limit))
+        except ValueError:
+            raise ValueError("limit must be a number")
+        return max(1, min(limit, self.max_limit))
+
+    def project(self, queryset, fields, ordering):
+        """Defers every column that is neither returned nor needed for the cursor."""
+        model_fields = {field.name for field in Room._meta.get_fields()}
+        columns = {self.api_fields[name] for name in fields if self.api_fields[name]}
+        columns.update(field.lstrip('-') for field in ordering if field.lstrip('-') in model_fields)
+        if 'distance_km' in fields:
+            # Looked up by hotel_id in the nearby distances
+            columns.add('hotel')
+        if not any(column.startswith('hotel__') for column in columns):
+            queryset = queryset.select_related(None)
+        return queryset.only(*columns)
+
+    def serialize(self, room, fields):
+        data = {}
+        for name in fields:
+            path = self.api_fields[name]
+            if name == 'url':
+                data[name] = reverse('room_detail', kwargs={'pk': room.pk})
+            elif name == 'distance_km':
+                data[name] = self.distances.get(room.hotel_id) if self.distances else None
+            elif name == 'photo':
+                data[name] = room.photo.url if room.photo else None
+            else:
+                value = room
+                for attr in path.split('__'):
+                    value = getattr(value, attr)
+                data[name] = value
+        return json.dumps(data, cls=DjangoJSONEncoder)
+
+    def get(self, request, *args, **kwargs):
+        form = self.get_form()
+        if not form.is_valid():
+            return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
+        try:
+            fields = self.get_fields()
+            limit = self.get_limit()
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+        queryset = self.get_queryset()
+        # Distances for distance_km, when the search has a location
+        self.distances = self.get_nearby()
+        paginator = CursorPaginator(queryset, limit)
+        try:
+            window = paginator.window(request.GET.get('cursor'))
+        except InvalidCursor:
+            return JsonResponse({'status': 'error', 'message': 'Invalid cursor.'}, status=400)
+        window = self.project(window, fields, paginator.ordering)
+        # Pin the database now: the body is produced after the view (and the
+        # routing middleware) has returned
+        window = window.using(window.db)
+
+        def stream():
+            yield '{"results": ['
+            last = None
+            for index, room in enumerate(window.iterator(chunk_size=limit + 1)):
+                if index == limit:
+                    break
+                yield (',' if index else '') + self.serialize(room, fields)
+                last = room
+            else:
+                # Fewer than limit + 1 rows: this was the last page
+                last = None
+            next_cursor = paginator.cursor_for(last) if last is not None else None
+            yield '], "next": %s}' % json.dumps(next_cursor)
+
+        return StreamingHttpResponse(stream(), content_type='application/json')
+
+
+@method_decorator(cache_control(max_age=60), name='get')
+class AutocompleteView(View):
+    """
+    Search box suggestions: ?q=<what was typed so far>&limit=<up to max_limit>.
+    Served from the in-memory index in autocomplete.py, without a database query.
+    """
+    default_limit = 8
+    max_limit = 20
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.GET.get('limit', self.default_limit))
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'limit must be a number'}, status=400)
+        limit = max(1, min(limit, self.max_limit))
+        return JsonResponse({'suggestions': autocomplete.suggest(request.GET.get('q', ''), limit)})
     
 @method_decorator(require_POST, name='dispatch')
 class ToggleFavouriteView(LoginRequiredMixin, View):
     def handle_no_permission(self):
-        if self.request.is_ajax() or self.request.content_type == 'application/json':
+        if self.request.headers.get('x-requested-with') == 'XMLHttpRequest' or self.request.content_type == 'application/json':
             return JsonResponse({
                 'status': 'error',
                 'message': 'Authentication required. Please log in.'
@@ -237,61 +606,62 @@ class ToggleFavouriteView(LoginRequiredMixin, View):
         return super().handle_no_permission()
 
 
-    def post(self, request, *args, **kwargs):
-        
+    def parse_room_id(self, request):
+        """(room_id, None) from the JSON body, or (None, error response)."""
         if not request.content_type == 'application/json':
-            return HttpResponseBadRequest("Invalid content type.")
+            return None, HttpResponseBadRequest("Invalid content type.")
         
         try:
             data = json.loads(request.body)
             room_id_str = data.get('room_id')
             
             if not room_id_str:
-                return JsonResponse({'status': 'error', 'message': 'Missing room_id'}, status=400)
+                return None, JsonResponse({'status': 'error', 'message': 'Missing room_id'}, status=400)
             
-            room_id = uuid.UUID(room_id_str)
+            return uuid.UUID(room_id_str), None
             
         except (json.JSONDecodeError, ValueError):
-            return JsonResponse({'status': 'error', 'message': 'Invalid JSON or UUID format'}, status=400)
-
-        try:
-            room = Room.objects.get(pk=room_id)
-        except Room.DoesNotExist:
-            return JsonResponse({'status': 'error', 'message': 'Room not found.'}, status=404)
-
-        user = request.user
-
-        try:
-            favourite = Favourite.objects.get(user=user, room=room)
-            favourite.delete()
-            is_loved = False
-            message = "Room removed from favourites."
-
-        except Favourite.DoesNotExist:
-            Favourite.objects.create(user=user, room=room)
-            is_loved = True
-            message = "Room added to favourites."
+            return None, JsonResponse({'status': 'error', 'message': 'Invalid JSON or UUID format'}, status=400)
 
+    def toggled(self, is_loved):
         return JsonResponse({
             'status': 'success',
             'is_loved': is_loved,
-            'message': message
+            'message': "Room added to favourites." if is_loved else "Room removed from favourites."
         })
+
+    def post(self, request, *args, **kwargs):
+        
+        room_id, error = self.parse_room_id(request)
+        if error:
+            return error
+
+        # One conditional write, see favourites.py
+        try:
+            is_loved = favourites.toggle(request.user, room_id)
+        except Room.DoesNotExist:
+            return JsonResponse({'status': 'error', 'message': 'Room not found.'}, status=404)
+
+        return self.toggled(is_loved)
     
-class FavouriteRoomsView(LoginRequiredMixin, ListView):
+class FavouriteRoomsView(LoginRequiredMixin, CursorPaginationMixin, ListView):
 
     model = Room 
     template_name = 'ho_ho_hotel_app/favourite_rooms.html'
     context_object_name = 'favourite_rooms' 
     paginate_by = 10 
+    # Most recently favourited first
+    cursor_ordering = ('-favourited_on', '-pk')
+    use_read_replica = True
 
     def get_queryset(self):
 
-        user_favourites = Favourite.objects.filter(user=self.request.user)
-        
-        favourite_room_ids = user_favourites.values_list('room_id', flat=True)
-
-        queryset = Room.objects.filter(id__in=favourite_room_ids)
+        # One join against the user's favourites; added_on is kept for the ordering
+        queryset = Room.objects.filter(
+            favorited_by__user=self.request.user
+        ).annotate(
+            favourited_on=F('favorited_by__added_on')
+        ).select_related('hotel')
         
         return queryset
     
@@ -300,37 +670,47 @@ class RoomDetailView(DetailView):
     template_name = 'ho_ho_hotel_app/room_detail.html'
     context_object_name = 'room'
     pk_url_kwarg = 'pk' 
+    # The hotel and owner are shown on the page (when the fragment isn't cached)
+    queryset = Room.objects.select_related('hotel', 'hotel__owner')
+    use_read_replica = True
 
-    def get_context_data(self, **kwargs):
+    def get(self, request, *args, **kwargs):
+        self.object, review_status = self.fetch(request)
+        context = self.get_context_data(object=self.object, review_status=review_status)
+        return self.render_to_response(context)
+
+    def fetch(self, request):
+        # The room and the user's review status don't depend on each other: fetched at the same time
+        room_id = self.kwargs[self.pk_url_kwarg]
+        lookups = {'room': lambda: self.get_queryset().get(pk=room_id)}
+        if request.user.is_authenticated:
+            user = request.user
+            lookups['review_status'] = lambda: ratings.review_status(user, room_id)
+        try:
+            results = fanout.run(lookups)
+        except Room.DoesNotExist:
+            raise Http404("No room found matching the query")
+        return results['room'], results.get('review_status')
+
+    def get_context_data(self, review_status=None, room_cache_version=None, **kwargs):
         context = super().get_context_data(**kwargs)
         room = self.object
-
+        # Key for the cached room/review fragments, changes on any related write
+        context['room_cache_version'] = caching.room_version(room) if room_cache_version is None else room_cache_version
         
         all_reviews = room.reviews.all().select_related('user')
-        avg_rating = all_reviews.aggregate(Avg('rating'))['rating__avg']
 
         context['reviews'] = all_reviews
-        context['avg_rating'] = avg_rating if avg_rating is not None else 0
-        context['review_count'] = all_reviews.count()
+        # Read from the denormalized columns instead of aggregating every view
+        context['avg_rating'] = room.rating_avg
+        context['review_count'] = room.review_count
         
         context['can_review'] = False
         context['has_reviewed'] = False
         
-        if self.request.user.is_authenticated and not self.request.user.is_anonymous:
-            user = self.request.user
-            
-          
-            has_paid_booking = Payment.objects.filter(
-                user=user, 
-                room=room, 
-                status='PAID'
-            ).exists()
-            
-           
-            has_reviewed = Review.objects.filter(
-                user=user, 
-                room=room
-            ).exists()
+        if review_status is not None:
+            # (has_paid_booking, has_reviewed) from one query, see ratings.review_status()
+            has_paid_booking, has_reviewed = review_status
             
             context['has_reviewed'] = has_reviewed
             
@@ -352,16 +732,7 @@ class ReviewSubmissionView(LoginRequiredMixin, View):
         user = request.user
         
         
-        has_paid_booking = Payment.objects.filter(
-            user=user, 
-            room=room, 
-            status='PAID'
-        ).exists()
-        
-        has_reviewed = Review.objects.filter(
-            user=user, 
-            room=room
-        ).exists()
+        has_paid_booking, has_reviewed = ratings.review_status(user, room.id)
 
         if not has_paid_booking or has_reviewed:
             messages.error(request, "You are not authorized to leave a review for this room.")
@@ -376,13 +747,15 @@ class ReviewSubmissionView(LoginRequiredMixin, View):
                 raise ValueError("Rating must be between 1 and 5.")
 
             
-            Review.objects.create(
-                user=user,
-                room=room,
-                hotel=room.hotel,
-                rating=rating,
-                comment=comment
-            )
+            # The rating aggregates are updated by a signal, keep both in one transaction
+            with transaction.atomic():
+                Review.objects.create(
+                    user=user,
+                    room=room,
+                    hotel=room.hotel,
+                    rating=rating,
+                    comment=comment
+                )
             messages.success(request, "Thank you for your review! It has been posted.")
             
         except ValueError as e:
@@ -391,4 +764,122 @@ class ReviewSubmissionView(LoginRequiredMixin, View):
             messages.error(request, "An unexpected error occurred while submitting your review. Please try again.")
             print(f"REVIEW SUBMISSION ERROR: {e}")
 
-        return redirect('room_detail', pk=room.id)
\ No newline at end of file
+        return redirect('room_detail', pk=room.id)
+
+# --- Async variants ---
+# Served instead of the views above when the site runs under ASGI
+# (settings.ASYNC_VIEWS, see asgi.py). Their queries and cache lookups are
+# awaited through the async ORM and cache API, and what is left of the sync
+# code path only builds lazy querysets from values already read. The
+# TemplateResponse (lazy querysets and cached fragments included) is rendered
+# by Django in the request's sync thread.
+
+class AsyncUserMixin:
+    """
+    First base of the async views: loads request.user with auser(), so the
+    sync checks in dispatch() (LoginRequiredMixin, require_POST) and the
+    templates read a plain attribute instead of querying from the event loop.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        response = super().dispatch(request, *args, **kwargs)
+        # The handler's coroutine, or a response from the checks in front of it
+        if inspect.isawaitable(response):
+            response = await response
+        return response
+
+
+class AsyncCursorListMixin:
+    """async get() for the cursor-paginated ListViews."""
+
+    async def get(self, request, *args, **kwargs):
+        await self.aprepare()
+        self.object_list = self.get_queryset()
+        self.page_result = await self.apaginate_queryset(self.object_list, self.get_paginate_by(self.object_list))
+        context = await self.aget_context_data()
+        return self.render_to_response(context)
+
+    async def aprepare(self):
+        """Reads what get_queryset() needs from the database or cache, before it runs."""
+
+    async def aget_context_data(self, **kwargs):
+        return self.get_context_data(**kwargs)
+
+    def paginate_queryset(self, queryset, page_size):
+        # Already read by get(), ListView.get_context_data() asks for it again
+        return self.page_result
+
+
+class AsyncRoomResultsView(AsyncUserMixin, AsyncCursorListMixin, RoomResultsView):
+
+    async def aprepare(self):
+        # get_queryset() filters a location search by the nearby hotel ids
+        form = self.get_form()
+        if form.is_valid() and facets.has_location(form.cleaned_data):
+            self._nearby = await facets.anearby_hotels(form.cleaned_data)
+
+    async def apaginate_queryset(self, queryset, page_size):
+        if queryset.query.is_empty():
+            return await super().apaginate_queryset(queryset, page_size)
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        paginate = super().apaginate_queryset
+
+        async def producer():
+            return (await paginate(queryset, page_size))[1]
+
+        page = await caching.acached_search_page(self.request.GET, producer)
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def aget_context_data(self, **kwargs):
+        form = self.get_form()
+        if form.is_valid() and facets.has_filters(form.cleaned_data):
+            self._facets = await facets.afacet_counts(form.cleaned_data, self.get_nearby())
+        return self.get_context_data(**kwargs)
+
+
+class AsyncFavouriteRoomsView(AsyncUserMixin, AsyncCursorListMixin, FavouriteRoomsView):
+    pass
+
+
+class AsyncRoomDetailView(AsyncUserMixin, RoomDetailView):
+
+    async def get(self, request, *args, **kwargs):
+        room_id = self.kwargs[self.pk_url_kwarg]
+        try:
+            self.object = await self.get_queryset().aget(pk=room_id)
+        except Room.DoesNotExist:
+            raise Http404("No room found matching the query")
+        review_status = None
+        if request.user.is_authenticated:
+            review_status = await ratings.areview_status(request.user, room_id)
+        context = self.get_context_data(
+            object=self.object,
+            review_status=review_status,
+            room_cache_version=await caching.aroom_version(self.object),
+        )
+        return self.render_to_response(context)
+
+
+class AsyncToggleFavouriteView(AsyncUserMixin, ToggleFavouriteView):
+
+    async def post(self, request, *args, **kwargs):
+        room_id, error = self.parse_room_id(request)
+        if error:
+            return error
+
+        try:
+            is_loved = await favourites.atoggle(request.user, room_id)
+        except Room.DoesNotExist:
+            return JsonResponse({'status': 'error', 'message': 'Room not found.'}, status=404)
+
+        return self.toggled(is_loved)
+
+
+# What urls.py serves when ASYNC_VIEWS is on
+ASYNC_VARIANTS = {
+    RoomResultsView: AsyncRoomResultsView,
+    RoomDetailView: AsyncRoomDetailView,
+    ToggleFavouriteView: AsyncToggleFavouriteView,
+    FavouriteRoomsView: AsyncFavouriteRoomsView,
+}
@@ -3,6 +3,13 @@ ASGI config for ho_ho_hotel_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Under ASGI the search results, room detail and favourite views are served
+by their async variants (ASYNC_VIEWS, see ho_ho_hotel_app/urls.py), e.g.:
+
+    uvicorn ho_ho_hotel_project.asgi:application --workers 4
+
+Compare with the WSGI deployment using the benchmark_concurrency command.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +19,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ho_ho_hotel_project.settings')
+# Read by settings.py, before get_asgi_application() loads it
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
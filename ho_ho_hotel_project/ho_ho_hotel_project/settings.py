@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
-from decouple import config
+from decouple import Csv, config
 
 import os
 
@@ -53,6 +53,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so session/auth queries made by the other middleware are counted too
+    'ho_ho_hotel_app.profiling.QueryProfilingMiddleware',
+    # Before the session middleware, so session writes pin the client to the primary
+    'ho_ho_hotel_app.db_routing.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,7 +70,8 @@ ROOT_URLCONF = 'ho_ho_hotel_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also times renders for the query profiler
+        'BACKEND': 'ho_ho_hotel_app.profiling.ProfilingDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,6 +79,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'ho_ho_hotel_app.context_processors.favourites',
             ],
         },
     },
@@ -81,6 +87,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'ho_ho_hotel_project.wsgi.application'
 
+# Serve the async variants of the search/detail/favourite views (asgi.py turns it on)
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+# Threads per process running a page's independent queries at once (fanout.py);
+# each can hold a database connection of its own
+FANOUT_MAX_WORKERS = config('FANOUT_MAX_WORKERS', default=8, cast=int)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -90,15 +102,78 @@ WSGI_APPLICATION = 'ho_ho_hotel_project.wsgi.application'
     
 DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.mysql',
+            'ENGINE': config('DATABASE_ENGINE', default='django.db.backends.mysql'),
             'NAME': config('DATABASE_NAME'),
             'USER': config('DATABASE_USER'),
             'PASSWORD': config('DATABASE_PASSWORD'),
             'HOST': config('DATABASE_HOST'),
-            'PORT': '3306'
+            'PORT': '3306',
+            # Keep connections open between requests, and check them before reuse.
+            # Not under ASGI: each request queries from a new thread, its connection would be left behind
+            'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', default=0 if ASYNC_VIEWS else 60, cast=int),
+            'CONN_HEALTH_CHECKS': config('DATABASE_CONN_HEALTH_CHECKS', default=True, cast=bool),
         }
     }
 
+# Read replicas, comma separated hosts. Views with use_read_replica = True read
+# from one of them; see ho_ho_hotel_app/db_routing.py.
+# Replicas without a host (e.g. SQLite files, to try the routing locally) are
+# listed by DATABASE_REPLICA_NAMES instead; names given alongside hosts are the
+# database name on each host.
+replica_hosts = config('DATABASE_REPLICA_HOSTS', default='', cast=Csv())
+replica_names = config('DATABASE_REPLICA_NAMES', default='', cast=Csv())
+for index in range(max(len(replica_hosts), len(replica_names))):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'ENGINE': config('DATABASE_REPLICA_ENGINE', default=DATABASES['default']['ENGINE']),
+        'NAME': replica_names[index] if index < len(replica_names) else DATABASES['default']['NAME'],
+        'USER': config('DATABASE_REPLICA_USER', default=DATABASES['default']['USER']),
+        'PASSWORD': config('DATABASE_REPLICA_PASSWORD', default=DATABASES['default']['PASSWORD']),
+        'HOST': replica_hosts[index] if index < len(replica_hosts) else DATABASES['default']['HOST'],
+        # Tests run against the primary only
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['ho_ho_hotel_app.db_routing.PrimaryReplicaRouter']
+
+# Seconds a client keeps reading from the primary after a write
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+
+# Cache
+# Local default is in-process memory. Other options (set through the environment):
+#   django.core.cache.backends.filebased.FileBasedCache   LOCATION=/var/tmp/ho_ho_hotel_cache
+#   django.core.cache.backends.memcached.PyMemcacheCache  LOCATION=127.0.0.1:11211
+#   django.core.cache.backends.redis.RedisCache           LOCATION=redis://127.0.0.1:6379
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='ho-ho-hotel'),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+    }
+}
+
+# Query profiling (see ho_ho_hotel_app/profiling.py)
+# Share of requests profiled; cheap enough to leave a small sample on in production
+QUERY_PROFILING_SAMPLE_RATE = config('QUERY_PROFILING_SAMPLE_RATE', default=0.01, cast=float)
+QUERY_PROFILING_REPEAT_THRESHOLD = config('QUERY_PROFILING_REPEAT_THRESHOLD', default=3, cast=int)
+QUERY_PROFILING_HISTORY = 200
+
+# Buffer favourite toggles this many seconds and write them in bulk (see
+# ho_ho_hotel_app/favourites.py); needs a cache shared by all workers. 0 writes them straight away
+FAVOURITES_WRITE_BEHIND_SECONDS = config('FAVOURITES_WRITE_BEHIND_SECONDS', default=0, cast=float)
+
+# Search box suggestions (see ho_ho_hotel_app/autocomplete.py). Every worker
+# loads them from this file and its .log, so they must be on storage they all share
+AUTOCOMPLETE_SNAPSHOT_PATH = config('AUTOCOMPLETE_SNAPSHOT_PATH', default=os.path.join(BASE_DIR, 'autocomplete_snapshot.json'))
+# How often a worker checks the snapshot for changes made by the others
+AUTOCOMPLETE_RELOAD_SECONDS = config('AUTOCOMPLETE_RELOAD_SECONDS', default=1, cast=float)
+# Size at which the change log kept next to the snapshot is folded into a new snapshot
+AUTOCOMPLETE_LOG_COMPACT_BYTES = config('AUTOCOMPLETE_LOG_COMPACT_BYTES', default=256 * 1024, cast=int)
+
+# Keeps the test suite's suggestion files in a temporary directory
+TEST_RUNNER = 'ho_ho_hotel_project.test_runner.TestRunner'
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -155,11 +230,11 @@ AUTH_USER_MODEL = 'login_app.CustomUser'
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 
-EMAIL_HOST = 'smtp.gmail.com'
+EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
 
-EMAIL_PORT = 587
+EMAIL_PORT = config('EMAIL_PORT', default=587, cast=int)
 
-EMAIL_USE_TLS = True
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 
@@ -177,8 +252,20 @@ TWILIO_AUTH_TOKEN=config('TWILIO_AUTH_TOKEN')
 
 TWILIO_PHONE_NUMBER=config('TWILIO_PHONE_NUMBER')
 
+# SMS delivery backend: login_app.sms.TwilioBackend, ConsoleBackend or LocmemBackend
+
+SMS_BACKEND = config('SMS_BACKEND', default='login_app.sms.TwilioBackend')
+
 # Payment
 
 RZP_KEY_ID = config('RZP_KEY_ID')
 
-RZP_KEY_SECRET = config('RZP_KEY_SECRET')
\ No newline at end of file
+RZP_KEY_SECRET = config('RZP_KEY_SECRET')
+
+# Secret set on the webhook in the Razorpay dashboard (/webhooks/razorpay/)
+
+RZP_WEBHOOK_SECRET = config('RZP_WEBHOOK_SECRET', default='')
+
+# payment.gateway.RazorpayGateway, or payment.gateway.FakeGateway for tests and local runs
+
+PAYMENT_GATEWAY = config('PAYMENT_GATEWAY', default='payment.gateway.RazorpayGateway')
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+Test runner for `manage.py test` (settings.TEST_RUNNER).
+
+Saving a hotel or room updates the search box suggestions, which live in
+files next to AUTOCOMPLETE_SNAPSHOT_PATH (snapshot, .log and .lock, see
+ho_ho_hotel_app/autocomplete.py). The runner points that path at a
+temporary directory for the whole run, so no test writes to the project's
+real suggestion files.
+"""
+import os
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._autocomplete_dir = tempfile.TemporaryDirectory(prefix='autocomplete-')
+        self._autocomplete_settings = override_settings(
+            AUTOCOMPLETE_SNAPSHOT_PATH=os.path.join(self._autocomplete_dir.name, 'autocomplete_snapshot.json'),
+        )
+        self._autocomplete_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._autocomplete_settings.disable()
+        self._autocomplete_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -22,7 +22,11 @@ from django.conf.urls.static import static
 
 from django.conf import settings
 
+from ho_ho_hotel_app.views import QueryProfilesView
+
 urlpatterns = [
+    # Before admin.site.urls so the admin catch-all doesn't swallow it
+    path('admin/query-profiles/', admin.site.admin_view(QueryProfilesView.as_view()), name='query_profiles'),
     path('admin/', admin.site.urls),
     path('', include('ho_ho_hotel_app.urls')),
     path('', include('payment.urls')),
@@ -2,4 +2,6 @@ from django.contrib import admin
 from . import models
 
 # Register your models here.
-admin.site.register(models.CustomUser)
\ No newline at end of file
+admin.site.register(models.CustomUser)
+admin.site.register(models.NotificationJob)
+admin.site.register(models.DeadLetterNotification)
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+Process-wide clients for the services notifications are delivered through.
+
+Building a Twilio client or opening an SMTP connection per message pays a
+TCP + TLS handshake (and an SMTP login) every time. Instead each process
+keeps one of each, keyed by the settings it was built from, and reuses it:
+Twilio's HTTP session pools its keep-alive connections, and the SMTP
+connection stays open between messages and is reopened when the server
+has dropped it.
+"""
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.signals import setting_changed
+
+# An SMTP connection idle for longer than this is checked with NOOP before reuse
+SMTP_KEEPALIVE_SECONDS = getattr(settings, 'SMTP_KEEPALIVE_SECONDS', 30)
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(key, factory):
+    """The client registered under `key`, built with factory() on first use."""
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = factory()
+    return client
+
+
+def close_clients():
+    """Closes and forgets every client (process shutdown, settings changes in tests)."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        close = getattr(client, 'close', None)
+        if close is not None:
+            close()
+
+
+def _settings_changed(setting, **kwargs):
+    if setting.startswith(('EMAIL_', 'TWILIO_', 'SMS_')):
+        close_clients()
+
+
+setting_changed.connect(_settings_changed)
+
+
+class ReusableEmailConnection:
+    """
+    Wraps a Django email backend and keeps its connection open across sends.
+    A connection the server closed while idle is noticed (NOOP, or the
+    failed send itself) and reopened once before giving up.
+    """
+
+    def __init__(self):
+        self.backend = get_connection(fail_silently=False)
+        self.last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _alive(self):
+        smtp = getattr(self.backend, 'connection', None)
+        if smtp is None or time.monotonic() - self.last_used < SMTP_KEEPALIVE_SECONDS:
+            return True
+        try:
+            return smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _reopen(self):
+        try:
+            self.backend.close()
+        except (smtplib.SMTPException, OSError):
+            # The socket is already gone; just forget it
+            self.backend.connection = None
+        self.backend.open()
+
+    def _send(self, messages):
+        try:
+            return self.backend.send_messages(messages)
+        except smtplib.SMTPServerDisconnected:
+            self._reopen()
+            return self.backend.send_messages(messages)
+
+    def _ready(self):
+        if not self._alive():
+            self._reopen()
+        self.backend.open()
+
+    def send_messages(self, messages):
+        """Sends EmailMessages over the shared connection. Returns how many were sent."""
+        with self._lock:
+            self._ready()
+            sent = self._send(messages)
+            self.last_used = time.monotonic()
+        return sent
+
+    def send_each(self, messages):
+        """
+        Sends a group of EmailMessages over the shared connection, like
+        send_messages(), but reports on each one: returns a list with None
+        for every message sent and the exception for every one that wasn't.
+        A failed message doesn't stop the ones after it.
+        """
+        results = []
+        with self._lock:
+            self._ready()
+            for message in messages:
+                try:
+                    sent = self._send([message])
+                except Exception as e:
+                    results.append(e)
+                else:
+                    results.append(None if sent else RuntimeError(f"Email to {', '.join(message.to)} was not sent"))
+            self.last_used = time.monotonic()
+        return results
+
+    def close(self):
+        with self._lock:
+            self.backend.close()
+
+
+def get_email_connection():
+    """The process's shared outgoing email connection."""
+    key = ('email', settings.EMAIL_BACKEND, getattr(settings, 'EMAIL_HOST', ''),
+           getattr(settings, 'EMAIL_PORT', ''), getattr(settings, 'EMAIL_HOST_USER', ''))
+    return get_client(key, ReusableEmailConnection)
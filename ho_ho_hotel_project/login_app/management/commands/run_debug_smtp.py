@@ -0,0 +1,97 @@
+import os
+import socketserver
+import uuid
+
+from django.core.management.base import BaseCommand
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP for Django's smtp EmailBackend (no TLS, no auth).
+    Every message is accepted and written to the output directory as .eml.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 localhost debug SMTP sink")
+        mail_from, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+
+            if verb in ('HELO', 'EHLO'):
+                self.reply("250 localhost")
+            elif verb == 'MAIL':
+                mail_from, recipients = command[10:].strip(), []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                recipients.append(command[8:].strip())
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                self.server.save(mail_from, recipients, self.read_data())
+                self.reply("250 OK: queued")
+            elif verb == 'RSET':
+                mail_from, recipients = None, []
+                self.reply("250 OK")
+            elif verb == 'NOOP':
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b".\r\n", b".\n"):
+                break
+            # Undo dot-stuffing
+            lines.append(line[1:] if line.startswith(b"..") else line)
+        return b"".join(lines)
+
+
+class SMTPSinkServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, output_dir, stdout):
+        super().__init__(address, SMTPSinkHandler)
+        self.output_dir = output_dir
+        self.stdout = stdout
+
+    def save(self, mail_from, recipients, data):
+        path = os.path.join(self.output_dir, f"{uuid.uuid4()}.eml")
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.stdout.write(f"Mail from {mail_from} to {', '.join(recipients)} -> {path}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local SMTP server that stores every message it receives. "
+        "Point EMAIL_HOST/EMAIL_PORT at it (EMAIL_USE_TLS=False) to test OTP emails offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--output-dir', default='sent_emails')
+
+    def handle(self, *args, **options):
+        os.makedirs(options['output_dir'], exist_ok=True)
+        server = SMTPSinkServer((options['host'], options['port']), options['output_dir'], self.stdout)
+        self.stdout.write(f"Debug SMTP server listening on {options['host']}:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
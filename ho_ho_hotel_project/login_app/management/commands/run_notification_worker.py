@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from login_app import notifications
+
+
+class Command(BaseCommand):
+    help = (
+        "Delivers queued OTP emails and SMS messages, retrying failures with backoff. "
+        "Also deletes sent jobs older than NOTIFICATION_SENT_RETENTION_SECONDS (7 days by default)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Process a single batch and exit (cron / tests).")
+
+    def handle(self, *args, **options):
+        if not options['once']:
+            self.stdout.write("Notification worker started. Press Ctrl+C to stop.")
+        try:
+            notifications.run_worker(
+                batch_size=options['batch_size'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write("Notification worker stopped.")
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+from django.utils import timezone
 import uuid
 
 class CustomUser(AbstractUser):
@@ -77,7 +78,7 @@ class Hotel(models.Model):
     )
     
     hotel_name = models.CharField(max_length=255, unique=True)
-    place = models.CharField(max_length=100)
+    place = models.CharField(max_length=100, db_index=True)
     address = models.TextField()
 
     ownership_proof = models.FileField(
@@ -90,5 +91,83 @@ class Hotel(models.Model):
         help_text="Upload scanned copy of the owner's ID proof (e.g., Aadhar, Passport)."
     )
 
+    # Review aggregates rolled up over all rooms (see ho_ho_hotel_app/ratings.py)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+
+    # Location, filled in by hand or by the geocode_hotels command
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # Geohash of the location, kept in sync on save; the index behind
+    # "near me" searches (see ho_ho_hotel_app/geo.py)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
+
+    def __str__(self):
+        return self.hotel_name
+
+class NotificationJob(models.Model):
+    """An outgoing email/SMS waiting for the notification worker."""
+
+    CHANNEL_CHOICES = (
+        ('EMAIL', 'Email'),
+        ('SMS', 'SMS'),
+    )
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('SENT', 'Sent'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    channel = models.CharField(max_length=5, choices=CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField()
+
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    # Not picked up before this time (used for retry backoff)
+    run_after = models.DateTimeField(default=timezone.now)
+    # When a worker claimed the job, lets a crashed worker's jobs be reclaimed
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after']
+        verbose_name = "Notification Job"
+        indexes = [
+            # The worker's polling query
+            models.Index(fields=['status', 'run_after'], name='notification_poll_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.channel} to {self.recipient} ({self.status})"
+
+
+class DeadLetterNotification(models.Model):
+    """A notification that kept failing after every retry."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    channel = models.CharField(max_length=5, choices=NotificationJob.CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField()
+
+    attempts = models.PositiveSmallIntegerField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    failed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-failed_at']
+        verbose_name = "Dead Letter Notification"
+
     def __str__(self):
-        return self.hotel_name
\ No newline at end of file
+        return f"{self.channel} to {self.recipient} failed after {self.attempts} attempts"
@@ -0,0 +1,217 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .clients import close_clients, get_email_connection
+from .models import DeadLetterNotification, NotificationJob
+from .sms import get_sms_backend
+
+# Tunables, overridable from settings.py
+MAX_ATTEMPTS = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+RETRY_BASE_SECONDS = getattr(settings, 'NOTIFICATION_RETRY_BASE_SECONDS', 15)
+RETRY_MAX_SECONDS = getattr(settings, 'NOTIFICATION_RETRY_MAX_SECONDS', 30 * 60)
+# A RUNNING job older than this belongs to a dead worker and is picked up again
+LOCK_TIMEOUT_SECONDS = getattr(settings, 'NOTIFICATION_LOCK_TIMEOUT_SECONDS', 5 * 60)
+# SENT jobs are kept this long (for support questions), then deleted by the worker
+SENT_RETENTION_SECONDS = getattr(settings, 'NOTIFICATION_SENT_RETENTION_SECONDS', 7 * 24 * 60 * 60)
+# How often the worker deletes the SENT jobs past retention
+PURGE_INTERVAL_SECONDS = getattr(settings, 'NOTIFICATION_PURGE_INTERVAL_SECONDS', 60 * 60)
+
+
+# --- Producer side (called from views) ---
+
+def enqueue_email(recipient, subject, body):
+    return NotificationJob.objects.create(
+        channel='EMAIL',
+        recipient=recipient,
+        subject=subject,
+        body=body,
+    )
+
+
+def enqueue_sms(recipient, body):
+    return NotificationJob.objects.create(
+        channel='SMS',
+        recipient=recipient,
+        body=body,
+    )
+
+
+# --- Delivery ---
+
+def email_message(job):
+    email_from = settings.EMAIL_HOST_USER or 'noreply@yourdomain.com'
+    return EmailMessage(job.subject, job.body, email_from, [job.recipient])
+
+
+def deliver(job):
+    """Sends one job through the configured email/SMS backend. Raises on failure."""
+    if job.channel == 'EMAIL':
+        if not get_email_connection().send_messages([email_message(job)]):
+            raise RuntimeError(f"Email to {job.recipient} was not sent")
+    elif job.channel == 'SMS':
+        get_sms_backend().send(job.recipient, job.body)
+    else:
+        raise ValueError(f"Unknown notification channel: {job.channel}")
+
+
+def deliver_batch(jobs):
+    """
+    Sends a batch of jobs. Returns {job id: exception} for the ones that failed.
+
+    The emails are handed to the shared SMTP connection as one group, the way
+    send_mass_mail() does it (one connection, opened or checked once), and
+    each message's outcome is mapped back to its job. SMS go one by one over
+    the shared Twilio session.
+    """
+    errors = {}
+    emails = [job for job in jobs if job.channel == 'EMAIL']
+    if emails:
+        try:
+            results = get_email_connection().send_each([email_message(job) for job in emails])
+        except Exception as e:
+            # The connection couldn't be opened: none of them went out
+            results = [e] * len(emails)
+        errors.update((job.id, error) for job, error in zip(emails, results) if error is not None)
+    for job in jobs:
+        if job.channel == 'EMAIL':
+            continue
+        try:
+            deliver(job)
+        except Exception as e:
+            errors[job.id] = e
+    return errors
+
+
+def retry_delay(attempts):
+    """Exponential backoff: 15s, 30s, 60s ... capped at RETRY_MAX_SECONDS."""
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * (2 ** (attempts - 1)), RETRY_MAX_SECONDS))
+
+
+def claim_jobs(batch_size):
+    """
+    Marks up to batch_size due jobs as RUNNING and returns them.
+    Claiming counts as an attempt, so a job that keeps taking its worker down
+    (and is reclaimed once the lock times out) is dead-lettered after
+    MAX_ATTEMPTS like one that keeps failing.
+
+    The claim is a conditional UPDATE (still due, among the ids read) and
+    only the rows it changed, the ones now locked at this call's timestamp,
+    are returned. Where the database can't skip locked rows (SQLite), two
+    workers may read the same ids, and whichever updates second gets none
+    of them.
+    """
+    now = timezone.now()
+    due = Q(status='PENDING', run_after__lte=now) | Q(
+        status='RUNNING', locked_at__lt=now - timedelta(seconds=LOCK_TIMEOUT_SECONDS)
+    )
+    with transaction.atomic():
+        queryset = NotificationJob.objects.filter(due).order_by('run_after')
+        # Lets several workers poll the same table without handing out a job twice
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        NotificationJob.objects.filter(due, id__in=ids).update(
+            status='RUNNING',
+            attempts=F('attempts') + 1,
+            locked_at=now,
+        )
+        jobs = list(
+            NotificationJob.objects.filter(id__in=ids, status='RUNNING', locked_at=now).order_by('run_after')
+        )
+        # Every attempt so far ended with its worker gone
+        abandoned = [job for job in jobs if job.attempts > MAX_ATTEMPTS]
+        for job in abandoned:
+            # This claim is not an attempt, nothing will be sent
+            job.attempts -= 1
+            dead_letter(job, job.last_error or "The worker stopped while sending it")
+    return [job for job in jobs if job not in abandoned]
+
+
+def dead_letter(job, error):
+    """Parks a job that is out of retries in the dead-letter table, for a human to look at."""
+    with transaction.atomic():
+        DeadLetterNotification.objects.create(
+            channel=job.channel,
+            recipient=job.recipient,
+            subject=job.subject,
+            body=job.body,
+            attempts=job.attempts,
+            last_error=str(error),
+            created_at=job.created_at,
+        )
+        NotificationJob.objects.filter(id=job.id).delete()
+
+
+# job.attempts already counts the current attempt (see claim_jobs)
+
+def mark_sent(job):
+    NotificationJob.objects.filter(id=job.id).update(
+        status='SENT',
+        sent_at=timezone.now(),
+        locked_at=None,
+    )
+
+
+def mark_failed(job, error):
+    if job.attempts >= MAX_ATTEMPTS:
+        dead_letter(job, error)
+        return
+
+    NotificationJob.objects.filter(id=job.id).update(
+        status='PENDING',
+        last_error=str(error),
+        run_after=timezone.now() + retry_delay(job.attempts),
+        locked_at=None,
+    )
+
+
+def purge_sent(now=None):
+    """Deletes the SENT jobs older than SENT_RETENTION_SECONDS. Returns how many."""
+    cutoff = (now or timezone.now()) - timedelta(seconds=SENT_RETENTION_SECONDS)
+    deleted, _ = NotificationJob.objects.filter(status='SENT', sent_at__lt=cutoff).delete()
+    return deleted
+
+
+def process_batch(batch_size=50):
+    """Delivers one batch of due jobs. Returns (sent, failed)."""
+    sent = failed = 0
+    jobs = claim_jobs(batch_size)
+    errors = deliver_batch(jobs)
+    for job in jobs:
+        error = errors.get(job.id)
+        if error is not None:
+            print(f"--- NOTIFICATION FAILED --- {job.channel} to {job.recipient}: {error}")
+            mark_failed(job, error)
+            failed += 1
+        else:
+            mark_sent(job)
+            sent += 1
+    return sent, failed
+
+
+def run_worker(batch_size=50, poll_interval=1.0, once=False):
+    """
+    Worker loop used by the run_notification_worker command. Also deletes
+    the SENT jobs past retention, when it starts and every
+    PURGE_INTERVAL_SECONDS.
+    """
+    next_purge = 0.0
+    try:
+        while True:
+            if time.monotonic() >= next_purge:
+                purge_sent()
+                next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+            sent, failed = process_batch(batch_size)
+            if once:
+                return
+            # Keep draining while there is work, otherwise sleep until the next poll
+            if not sent and not failed:
+                time.sleep(poll_interval)
+    finally:
+        close_clients()
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .clients import get_client
+
+
+class BaseSMSBackend:
+    """Same idea as Django's email backends: one send() per message."""
+
+    def send(self, to, body):
+        raise NotImplementedError
+
+
+class TwilioBackend(BaseSMSBackend):
+    """
+    Holds one Twilio client for the life of the backend. Its HTTP session
+    keeps connections to the API alive, so only the first message pays for
+    the TLS handshake.
+    """
+
+    def __init__(self):
+        # Imported here so the fake backends work without twilio installed
+        from twilio.http.http_client import TwilioHttpClient
+        from twilio.rest import Client
+
+        http_client = TwilioHttpClient(
+            pool_connections=True,
+            timeout=getattr(settings, 'TWILIO_TIMEOUT_SECONDS', 10),
+            max_retries=getattr(settings, 'TWILIO_MAX_RETRIES', 2),
+        )
+        self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, http_client=http_client)
+
+    def send(self, to, body):
+        self.client.messages.create(
+            body=body,
+            from_=settings.TWILIO_PHONE_NUMBER,
+            to=to
+        )
+
+
+class ConsoleBackend(BaseSMSBackend):
+    """Prints messages instead of sending them (local development)."""
+
+    def send(self, to, body):
+        print(f"--- SMS to {to} ---\n{body}\n-------------------")
+
+
+class LocmemBackend(BaseSMSBackend):
+    """Keeps sent messages in `LocmemBackend.outbox` (tests)."""
+
+    outbox = []
+
+    def send(self, to, body):
+        LocmemBackend.outbox.append({'to': to, 'body': body})
+
+
+def get_sms_backend():
+    """The configured backend, shared by the whole process."""
+    backend = getattr(settings, 'SMS_BACKEND', 'login_app.sms.TwilioBackend')
+    return get_client(('sms', backend), import_string(backend))
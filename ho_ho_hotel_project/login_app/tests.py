@@ -1,3 +1,156 @@
-from django.test import TestCase
+import smtplib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import clients, notifications
+from .models import DeadLetterNotification, NotificationJob
+from .sms import LocmemBackend
+
+
+@override_settings(SMS_BACKEND='login_app.sms.LocmemBackend')
+class NotificationWorkerTests(TestCase):
+    """
+    The worker end to end, offline: email through Django's locmem backend
+    (what the test runner swaps in for SMTP), SMS through LocmemBackend.
+    """
+
+    def setUp(self):
+        LocmemBackend.outbox.clear()
+
+    def make_due(self):
+        """Skips the backoff wait of every pending job."""
+        NotificationJob.objects.filter(status='PENDING').update(run_after=timezone.now())
+
+    def expire_locks(self):
+        """What LOCK_TIMEOUT_SECONDS later looks like for jobs whose worker died."""
+        stale = timezone.now() - timedelta(seconds=notifications.LOCK_TIMEOUT_SECONDS + 1)
+        NotificationJob.objects.filter(status='RUNNING').update(locked_at=stale)
+
+    def test_delivers_email_and_sms(self):
+        notifications.enqueue_email('guest@example.com', 'Booking confirmed', 'See you soon.')
+        notifications.enqueue_sms('+919800000000', 'Your OTP is 123456')
+
+        self.assertEqual(notifications.process_batch(), (2, 0))
+        self.assertEqual([message.to for message in mail.outbox], [['guest@example.com']])
+        self.assertEqual(LocmemBackend.outbox, [{'to': '+919800000000', 'body': 'Your OTP is 123456'}])
+        self.assertEqual(list(NotificationJob.objects.values_list('status', 'attempts')), [('SENT', 1)] * 2)
+        self.assertEqual(notifications.process_batch(), (0, 0))
+
+    @mock.patch.object(LocmemBackend, 'send', side_effect=RuntimeError("Twilio is down"))
+    def test_failures_back_off(self, send):
+        job = notifications.enqueue_sms('+919800000000', 'Your OTP is 123456')
+
+        for attempts in (1, 2, 3):
+            before = timezone.now()
+            self.assertEqual(notifications.process_batch(), (0, 1))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, job.last_error), ('PENDING', attempts, "Twilio is down"))
+            self.assertGreaterEqual(job.run_after, before + notifications.retry_delay(attempts))
+            # Not due again until the delay is over
+            self.assertEqual(notifications.process_batch(), (0, 0))
+            self.make_due()
+
+        send.side_effect = None
+        self.assertEqual(notifications.process_batch(), (1, 0))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('SENT', 4))
+
+    def test_emails_go_out_as_one_group(self):
+        send_messages = locmem.EmailBackend.send_messages
+
+        def refuse_one(backend, messages):
+            if messages[0].to == ['bounce@example.com']:
+                raise smtplib.SMTPRecipientsRefused({'bounce@example.com': (550, b"No such user")})
+            return send_messages(backend, messages)
+
+        for recipient in ('a@example.com', 'bounce@example.com', 'b@example.com'):
+            notifications.enqueue_email(recipient, 'Booking confirmed', 'See you soon.')
+        send_each = mock.patch.object(
+            clients.ReusableEmailConnection, 'send_each', autospec=True,
+            side_effect=clients.ReusableEmailConnection.send_each,
+        )
+        with send_each as grouped, mock.patch.object(locmem.EmailBackend, 'send_messages', refuse_one):
+            self.assertEqual(notifications.process_batch(), (2, 1))
+
+        self.assertEqual(grouped.call_count, 1)
+        self.assertEqual(len(grouped.call_args.args[1]), 3)
+        self.assertEqual([message.to for message in mail.outbox], [['a@example.com'], ['b@example.com']])
+        self.assertEqual(
+            dict(NotificationJob.objects.values_list('recipient', 'status')),
+            {'a@example.com': 'SENT', 'bounce@example.com': 'PENDING', 'b@example.com': 'SENT'},
+        )
+        self.assertIn("No such user", NotificationJob.objects.get(recipient='bounce@example.com').last_error)
+
+    def test_retry_delay(self):
+        self.assertEqual(notifications.retry_delay(1), timedelta(seconds=notifications.RETRY_BASE_SECONDS))
+        self.assertEqual(notifications.retry_delay(2), timedelta(seconds=2 * notifications.RETRY_BASE_SECONDS))
+        self.assertEqual(notifications.retry_delay(50), timedelta(seconds=notifications.RETRY_MAX_SECONDS))
+
+    @mock.patch.object(LocmemBackend, 'send', side_effect=RuntimeError("Invalid number"))
+    def test_dead_letter_after_max_attempts(self, send):
+        job = notifications.enqueue_sms('+1', 'Your OTP is 123456')
+
+        for _ in range(notifications.MAX_ATTEMPTS):
+            self.assertEqual(notifications.process_batch(), (0, 1))
+            self.make_due()
+
+        self.assertFalse(NotificationJob.objects.exists())
+        dead = DeadLetterNotification.objects.get()
+        self.assertEqual((dead.recipient, dead.attempts, dead.last_error), ('+1', notifications.MAX_ATTEMPTS, "Invalid number"))
+        self.assertEqual(dead.created_at, job.created_at)
+        self.assertEqual(send.call_count, notifications.MAX_ATTEMPTS)
+
+    def test_reclaimed_jobs_use_up_attempts(self):
+        # A message that kills its worker every time: claimed, never marked
+        job = notifications.enqueue_email('guest@example.com', 'Booking confirmed', 'See you soon.')
+
+        for attempts in range(1, notifications.MAX_ATTEMPTS + 1):
+            self.assertEqual(notifications.claim_jobs(10), [job])
+            # Still locked by the (dead) worker
+            self.assertEqual(notifications.claim_jobs(10), [])
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('RUNNING', attempts))
+            self.expire_locks()
+
+        self.assertEqual(notifications.claim_jobs(10), [])
+        self.assertFalse(NotificationJob.objects.exists())
+        self.assertEqual(DeadLetterNotification.objects.get().attempts, notifications.MAX_ATTEMPTS)
+        self.assertEqual(mail.outbox, [])
+
+    def test_claim_keeps_only_the_rows_it_changed(self):
+        job = notifications.enqueue_email('guest@example.com', 'Booking confirmed', 'See you soon.')
+        update = QuerySet.update
+        other_worker = []
+
+        def race(queryset, **kwargs):
+            # Another worker claims the same ids between our read and our update
+            with mock.patch.object(QuerySet, 'update', update):
+                other_worker.extend(notifications.claim_jobs(10))
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', race):
+            self.assertEqual(notifications.claim_jobs(10), [])
+        self.assertEqual(other_worker, [job])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('RUNNING', 1))
+
+    def test_purge_sent(self):
+        for recipient in ('old@example.com', 'new@example.com', 'pending@example.com'):
+            notifications.enqueue_email(recipient, 'Booking confirmed', 'See you soon.')
+        now = timezone.now()
+        old = now - timedelta(seconds=notifications.SENT_RETENTION_SECONDS + 1)
+        NotificationJob.objects.filter(recipient='old@example.com').update(status='SENT', sent_at=old)
+        NotificationJob.objects.filter(recipient='new@example.com').update(status='SENT', sent_at=now)
+        NotificationJob.objects.filter(recipient='pending@example.com').update(created_at=old)
+
+        self.assertEqual(notifications.purge_sent(now), 1)
+        self.assertEqual(
+            set(NotificationJob.objects.values_list('recipient', flat=True)),
+            {'new@example.com', 'pending@example.com'},
+        )
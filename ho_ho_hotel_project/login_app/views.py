@@ -14,14 +14,13 @@ from .models import CustomUser, Hotel
 from .forms import CustomUserCreationForm, VerificationForm
 from django.db import IntegrityError
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from twilio.rest import Client
+from . import notifications
 from django.views.generic import DetailView
 from django.conf import settings
 from django.contrib.auth.views import PasswordChangeView
 import random
 from django.contrib.auth.forms import PasswordChangeForm
 from django.http import HttpResponse
-from django.core.mail import send_mail
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode
 from django.template.loader import render_to_string
@@ -592,44 +591,23 @@ def generate_otp():
 
 # !!! REVISED FUNCTION: Accepts the user's email as the recipient
 def send_otp_to_email(user_email, otp):
-    """Sends OTP via Django's send_mail function."""
+    """Queues the OTP email, the notification worker delivers it (see notifications.py)."""
     recipient = user_email 
     subject = 'OTP for Registration Verification'
     message = f'Your verification code for registration is: {otp}.'
-    email_from = settings.EMAIL_HOST_USER or 'noreply@yourdomain.com'
     
-    try:
-        send_mail(
-            subject, 
-            message, 
-            email_from, 
-            [recipient], 
-            fail_silently=False 
-        )
-        print(f"--- EMAIL SENT SUCCESS --- OTP: {otp} to recipient: {recipient}")
-        return True
-    except Exception as e:
-        print(f"--- EMAIL SENDING FAILED --- Error: {e}")
-        raise e 
+    notifications.enqueue_email(recipient, subject, message)
+    print(f"--- EMAIL QUEUED --- to recipient: {recipient}")
+    return True
 
 # !!! REVISED FUNCTION: Accepts the user's phone number as the recipient
 def send_otp_to_phone(user_phone_number, otp):
-    """Sends OTP via Twilio SMS."""
+    """Queues the OTP SMS, delivered by the notification worker through SMS_BACKEND."""
     recipient = user_phone_number 
-    print(f"--- SMS ATTEMPTED --- OTP: {otp} to recipient: {recipient}")
     
-    try:
-        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-        client.messages.create(
-            body=f'Your verification code for registration is: {otp}',
-            from_=settings.TWILIO_PHONE_NUMBER,
-            to=recipient 
-        )
-        print(f"--- SMS SENT SUCCESS ---")
-        return True
-    except Exception as e:
-        print(f"Twilio SMS Error: {e}")
-        raise e 
+    notifications.enqueue_sms(recipient, f'Your verification code for registration is: {otp}')
+    print(f"--- SMS QUEUED --- to recipient: {recipient}")
+    return True
 
 class UserUpdateView(LoginRequiredMixin, UpdateView):
     model = CustomUser
@@ -1,4 +1,7 @@
 from django.contrib import admin
 from . import models
 # Register your models here.
-admin.site.register(models.Payment)
\ No newline at end of file
+# list_select_related: the change lists print __str__, which follows room
+admin.site.register(models.Payment, list_select_related=('room',))
+admin.site.register(models.Booking, list_select_related=('room',))
+admin.site.register(models.RoomNight)
\ No newline at end of file
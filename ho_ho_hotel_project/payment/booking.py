@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Booking, RoomNight
+
+# Longest stay a single booking may cover
+MAX_STAY_NIGHTS = 30
+
+
+class RoomUnavailableError(Exception):
+    """Raised when some night of the requested stay is already booked."""
+
+
+def nights_between(check_in, check_out):
+    """Every night of a stay: check_in up to (not including) check_out."""
+    return [check_in + timedelta(days=offset) for offset in range((check_out - check_in).days)]
+
+
+def validate_stay(check_in, check_out):
+    """Raises ValueError if the stay is not a usable date range."""
+    if check_out <= check_in:
+        raise ValueError("Check-out must be after check-in.")
+    if check_in < timezone.localdate():
+        raise ValueError("Check-in cannot be in the past.")
+    if (check_out - check_in).days > MAX_STAY_NIGHTS:
+        raise ValueError(f"Stays are limited to {MAX_STAY_NIGHTS} nights.")
+
+
+def parse_stay(data):
+    """
+    Reads check_in/check_out (YYYY-MM-DD) from a QueryDict.
+    Without dates the stay defaults to a single night starting today,
+    which is what the 'Book This Room' button has always meant.
+    """
+    check_in_raw = data.get('check_in')
+    check_out_raw = data.get('check_out')
+
+    if not check_in_raw and not check_out_raw:
+        check_in = timezone.localdate()
+        return check_in, check_in + timedelta(days=1)
+
+    try:
+        check_in = date.fromisoformat(check_in_raw or '')
+        check_out = date.fromisoformat(check_out_raw or '')
+    except ValueError:
+        raise ValueError("Dates must be in YYYY-MM-DD format.")
+
+    validate_stay(check_in, check_out)
+    return check_in, check_out
+
+
+def booked_room_ids(check_in, check_out):
+    """Subquery of rooms with at least one booked night inside the stay."""
+    return RoomNight.objects.filter(
+        date__gte=check_in,
+        date__lt=check_out,
+    ).values('room_id')
+
+
+def filter_available(queryset, check_in, check_out):
+    """Narrows a Room queryset to rooms free for every night of the stay (one query)."""
+    return queryset.exclude(id__in=booked_room_ids(check_in, check_out))
+
+
+def is_room_available(room, check_in, check_out):
+    return not RoomNight.objects.filter(
+        room=room,
+        date__gte=check_in,
+        date__lt=check_out,
+    ).exists()
+
+
+def create_booking(user, room, check_in, check_out, payment=None):
+    """
+    Books every night of the stay or nothing.
+    The unique (room, date) constraint on RoomNight decides races between
+    concurrent bookings: the loser gets RoomUnavailableError.
+    """
+    try:
+        with transaction.atomic():
+            booking = Booking.objects.create(
+                user=user,
+                room=room,
+                payment=payment,
+                check_in=check_in,
+                check_out=check_out,
+            )
+            RoomNight.objects.bulk_create([
+                RoomNight(room=room, date=night, booking=booking)
+                for night in nights_between(check_in, check_out)
+            ])
+    except IntegrityError:
+        raise RoomUnavailableError(
+            f"Room {room.room_number} is already booked for part of {check_in} to {check_out}."
+        )
+    return booking
+
+
+def cancel_booking(booking):
+    """Cancels a booking and releases its nights back into inventory."""
+    with transaction.atomic():
+        booking.nights.all().delete()
+        booking.status = 'CANCELLED'
+        booking.save(update_fields=['status'])
@@ -0,0 +1,119 @@
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Payment
+
+# How long a PENDING order is reused for reloads of the same checkout
+ORDER_TTL_SECONDS = getattr(settings, 'CHECKOUT_ORDER_TTL_SECONDS', 15 * 60)
+# How long a concurrent request for the same checkout waits for its gateway order
+ORDER_WAIT_SECONDS = getattr(settings, 'CHECKOUT_ORDER_WAIT_SECONDS', 10)
+
+
+def checkout_key(user, room, check_in, check_out):
+    """Identifies 'this user paying for this room for this stay'."""
+    raw = f"{user.pk}:{room.pk}:{check_in.isoformat()}:{check_out.isoformat()}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def release(queryset):
+    """Expires the PENDING orders in `queryset` and frees their checkout keys."""
+    return queryset.filter(status='PENDING').update(status='EXPIRED', checkout_key=None, updated_at=timezone.now())
+
+
+class OrderNotReadyError(Exception):
+    """A concurrent request claimed this checkout but didn't get its gateway order in time."""
+
+
+def _wait_for_order(payment):
+    """The claim another request is creating the gateway order for, once it has one."""
+    deadline = time.monotonic() + ORDER_WAIT_SECONDS
+    while True:
+        payment.refresh_from_db(fields=['status', 'razorpay_order_id'])
+        if payment.razorpay_order_id and payment.status == 'PENDING':
+            return payment
+        if payment.status != 'PENDING' or time.monotonic() >= deadline:
+            raise OrderNotReadyError(f"No gateway order for payment {payment.pk}")
+        time.sleep(0.1)
+
+
+def get_or_create_order(user, room, check_in, check_out, amount, create_gateway_order):
+    """
+    Returns (payment, created).
+
+    Reloads, back-button visits and double-clicks of the same checkout get the
+    live PENDING payment (and its Razorpay order) back with one local lookup.
+    Otherwise a PENDING payment without an order is inserted first, claiming
+    the unique checkout_key, and only the request that got the claim calls
+    `create_gateway_order(amount)` and fills in the order id. Concurrent
+    requests that lost wait for it, so a checkout never makes two orders.
+    """
+    key = checkout_key(user, room, check_in, check_out)
+    now = timezone.now()
+
+    live = Payment.objects.filter(checkout_key=key, status='PENDING', expires_at__gt=now).first()
+    if live is not None and live.amount == amount:
+        if live.razorpay_order_id:
+            return live, False
+        if live.updated_at > now - timedelta(seconds=ORDER_WAIT_SECONDS):
+            return _wait_for_order(live), False
+        # else: its request died before getting the order, take the checkout over
+
+    # Expired, or the price changed since: the old order can't be reused
+    release(Payment.objects.filter(checkout_key=key))
+
+    try:
+        with transaction.atomic():
+            payment = Payment.objects.create(
+                user=user,
+                room=room,
+                amount=amount,
+                check_in=check_in,
+                check_out=check_out,
+                status='PENDING',
+                checkout_key=key,
+                expires_at=now + timedelta(seconds=ORDER_TTL_SECONDS),
+            )
+    except IntegrityError:
+        # A concurrent request for the same checkout claimed it first
+        payment = Payment.objects.filter(checkout_key=key, status='PENDING').first()
+        if payment is None:
+            raise
+        return _wait_for_order(payment), False
+
+    try:
+        gateway_order = create_gateway_order(amount)
+    except Exception:
+        # Frees the checkout for the next attempt
+        release(Payment.objects.filter(pk=payment.pk))
+        raise
+    payment.razorpay_order_id = gateway_order['id']
+    payment.updated_at = timezone.now()
+    Payment.objects.filter(pk=payment.pk).update(
+        razorpay_order_id=payment.razorpay_order_id, updated_at=payment.updated_at,
+    )
+    return payment, True
+
+
+def expire_stale_orders(batch_size=1000):
+    """
+    Marks PENDING payments past their TTL as EXPIRED, batch_size rows per
+    UPDATE so locks stay short. Payments from before expires_at existed are
+    aged by created_at. Returns the number of rows expired.
+    """
+    now = timezone.now()
+    stale = Payment.objects.filter(status='PENDING').filter(
+        Q(expires_at__lte=now)
+        | Q(expires_at__isnull=True, created_at__lte=now - timedelta(seconds=ORDER_TTL_SECONDS))
+    )
+    total = 0
+    while True:
+        ids = list(stale.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += release(Payment.objects.filter(id__in=ids))
@@ -0,0 +1,157 @@
+import hashlib
+import hmac
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class GatewayError(Exception):
+    """The payment gateway is misconfigured or could not be reached."""
+
+
+class BaseGateway:
+    """
+    What the payment views and the reconciliation worker need from a payment
+    gateway. Amounts are in rupees (Decimal); implementations convert.
+    """
+
+    def create_order(self, amount, currency='INR'):
+        """Returns the gateway's order as a dict with at least 'id'."""
+        raise NotImplementedError
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        raise NotImplementedError
+
+    def verify_webhook_signature(self, body, signature):
+        raise NotImplementedError
+
+    def fetch_order_payments(self, order_id):
+        """Payment attempts on an order: dicts with 'id' and 'status' ('captured', 'failed', 'refunded', ...)."""
+        raise NotImplementedError
+
+    def refund_payment(self, payment_id, amount):
+        """Refunds `amount` of a captured payment. Raises GatewayError on failure."""
+        raise NotImplementedError
+
+
+class RazorpayGateway(BaseGateway):
+
+    def __init__(self):
+        try:
+            import razorpay
+            self.client = razorpay.Client(auth=(settings.RZP_KEY_ID, settings.RZP_KEY_SECRET))
+        except (AttributeError, ImportError) as e:
+            raise GatewayError(f"Razorpay client failed to initialize: {e}")
+        self._errors = (razorpay.errors.SignatureVerificationError,)
+
+    def create_order(self, amount, currency='INR'):
+        return self.client.order.create({
+            'amount': int(Decimal(amount) * 100),
+            'currency': currency,
+            'payment_capture': '1'
+        })
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        try:
+            self.client.utility.verify_payment_signature({
+                'razorpay_order_id': order_id,
+                'razorpay_payment_id': payment_id,
+                'razorpay_signature': signature
+            })
+        except self._errors:
+            return False
+        return True
+
+    def verify_webhook_signature(self, body, signature):
+        secret = getattr(settings, 'RZP_WEBHOOK_SECRET', '')
+        if not secret or not signature:
+            return False
+        try:
+            self.client.utility.verify_webhook_signature(body.decode(), signature, secret)
+        except self._errors:
+            return False
+        return True
+
+    def fetch_order_payments(self, order_id):
+        try:
+            response = self.client.order.payments(order_id)
+        except Exception as e:
+            raise GatewayError(f"Could not fetch payments for {order_id}: {e}")
+        return [{'id': item['id'], 'status': item['status']} for item in response.get('items', [])]
+
+    def refund_payment(self, payment_id, amount):
+        try:
+            return self.client.payment.refund(payment_id, {'amount': int(Decimal(amount) * 100)})
+        except Exception as e:
+            raise GatewayError(f"Refund of {payment_id} failed: {e}")
+
+
+class FakeGateway(BaseGateway):
+    """
+    In-memory gateway for tests, benchmarks and local development.
+    Signatures are HMAC-SHA256 with FAKE_SECRET, like Razorpay's.
+    """
+
+    FAKE_SECRET = 'fake-gateway-secret'
+    # order_id -> list of payment dicts, shared by every instance
+    orders = {}
+    # payment_id -> refunded amount (paise)
+    refunds = {}
+
+    @classmethod
+    def sign(cls, message):
+        if isinstance(message, str):
+            message = message.encode()
+        return hmac.new(cls.FAKE_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+    @classmethod
+    def sign_payment(cls, order_id, payment_id):
+        return cls.sign(f"{order_id}|{payment_id}")
+
+    @classmethod
+    def add_payment(cls, order_id, status='captured'):
+        """Simulates the customer paying (or failing to pay). Returns the payment id."""
+        payment_id = f"pay_{uuid.uuid4().hex[:14]}"
+        cls.orders.setdefault(order_id, []).append({'id': payment_id, 'status': status})
+        return payment_id
+
+    def create_order(self, amount, currency='INR'):
+        order_id = f"order_{uuid.uuid4().hex[:14]}"
+        FakeGateway.orders[order_id] = []
+        return {'id': order_id, 'amount': int(Decimal(amount) * 100), 'currency': currency, 'status': 'created'}
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        return hmac.compare_digest(self.sign_payment(order_id, payment_id), signature or '')
+
+    def verify_webhook_signature(self, body, signature):
+        return hmac.compare_digest(self.sign(body), signature or '')
+
+    def fetch_order_payments(self, order_id):
+        return [dict(payment) for payment in FakeGateway.orders.get(order_id, [])]
+
+    def refund_payment(self, payment_id, amount):
+        # Like Razorpay, a payment can't be refunded twice
+        if payment_id in FakeGateway.refunds:
+            raise GatewayError(f"Payment {payment_id} has already been refunded")
+        FakeGateway.refunds[payment_id] = int(Decimal(amount) * 100)
+        for payments in FakeGateway.orders.values():
+            for payment in payments:
+                if payment['id'] == payment_id:
+                    payment['status'] = 'refunded'
+        return {'id': f"rfnd_{uuid.uuid4().hex[:14]}", 'payment_id': payment_id}
+
+
+_gateways = {}
+
+
+def get_gateway():
+    """
+    The gateway named by settings.PAYMENT_GATEWAY. Instances are kept for the
+    life of the process so their HTTP sessions are reused.
+    """
+    path = getattr(settings, 'PAYMENT_GATEWAY', 'payment.gateway.RazorpayGateway')
+    if path not in _gateways:
+        _gateways[path] = import_string(path)()
+    return _gateways[path]
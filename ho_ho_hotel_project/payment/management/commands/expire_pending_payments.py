@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from payment import checkout
+
+
+class Command(BaseCommand):
+    help = "Marks PENDING payments whose checkout order has outlived its TTL as EXPIRED (run from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = checkout.expire_stale_orders(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Expired {count} pending payments."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from payment import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Asks the payment gateway about every PENDING/EXPIRED payment whose browser "
+        "callback never arrived and settles them (run from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        stats = reconcile.reconcile_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {stats['checked']} payments: {stats['paid']} paid, "
+            f"{stats['failed']} failed, {stats['refunded']} refunded, {stats['errors']} lookup errors."
+        ))
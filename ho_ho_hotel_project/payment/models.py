@@ -10,6 +10,9 @@ class Payment(models.Model):
         ('PENDING', 'Pending Payment'),
         ('PAID', 'Payment Successful'),
         ('FAILED', 'Payment Failed'),
+        ('EXPIRED', 'Order Expired'),
+        ('REFUNDING', 'Refund Pending'),
+        ('REFUNDED', 'Refunded'),
     )
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -28,13 +31,87 @@ class Payment(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, default='INR')
     
+    # Stay being paid for (check_out is the morning the guest leaves)
+    check_in = models.DateField(null=True, blank=True)
+    check_out = models.DateField(null=True, blank=True)
+
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Set only while PENDING: hash of (user, room, stay). Being unique, it lets
+    # a single live order exist per checkout (see checkout.py); NULLs don't clash.
+    checkout_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    # When a PENDING order stops being reused and becomes reapable
+    expires_at = models.DateTimeField(null=True, blank=True)
+    # Last time the reconciliation sweep asked the gateway about this order
+    reconciled_at = models.DateTimeField(null=True, blank=True, editable=False)
+
     class Meta:
         ordering = ('-created_at',)
         verbose_name = "Room Payment"
+        indexes = [
+            # expire_pending_payments sweeps
+            models.Index(fields=['status', 'expires_at'], name='payment_status_expiry_idx'),
+            # "Has this user paid for this room?" on the room page and review form
+            models.Index(fields=['user', 'room', 'status'], name='payment_user_room_status_idx'),
+            # A user's orders, newest first
+            models.Index(fields=['user', 'status', '-created_at'], name='payment_user_orders_idx'),
+        ]
 
     def __str__(self):
         return f"Payment for Room {self.room.room_number} - Status: {self.status}"
+
+
+class Booking(models.Model):
+    STATUS_CHOICES = (
+        ('CONFIRMED', 'Confirmed'),
+        ('CANCELLED', 'Cancelled'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bookings')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='bookings')
+
+    # The payment that paid for this stay (null for bookings made by hand in the admin)
+    payment = models.OneToOneField(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='booking')
+
+    check_in = models.DateField()
+    check_out = models.DateField()
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='CONFIRMED')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('-check_in',)
+        verbose_name = "Room Booking"
+        indexes = [
+            # Per-room calendar lookups ("what is booked in this room around X")
+            models.Index(fields=['room', 'check_in', 'check_out'], name='booking_room_dates_idx'),
+        ]
+
+    def __str__(self):
+        return f"Booking for Room {self.room.room_number}: {self.check_in} to {self.check_out} ({self.status})"
+
+
+class RoomNight(models.Model):
+    """
+    Night inventory: one row per room per booked night.
+    The unique (room, date) pair makes double-booking impossible at the
+    database level, and the (date, room) index lets availability over a date
+    range be answered for every room with one index range scan.
+    """
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='booked_nights')
+    date = models.DateField()
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='nights')
+
+    class Meta:
+        unique_together = ('room', 'date')
+        indexes = [
+            models.Index(fields=['date', 'room'], name='roomnight_date_room_idx'),
+        ]
+        verbose_name = "Booked Room Night"
+
+    def __str__(self):
+        return f"Room {self.room_id} booked on {self.date}"
@@ -0,0 +1,182 @@
+"""
+Settles payments whose browser callback never arrived (tab closed, network
+drop): from Razorpay webhooks as they come in, and by a periodic sweep that
+asks the gateway about every payment still open. The sweep also retries
+refunds whose gateway call failed (payments left REFUNDING).
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .booking import RoomUnavailableError
+from .gateway import GatewayError, get_gateway
+from .models import Payment
+from .transitions import complete_refund, confirm_payment, fail_payment, send_refund
+
+logger = logging.getLogger(__name__)
+
+# Leave fresh orders to the browser callback for this long
+GRACE_SECONDS = getattr(settings, 'RECONCILE_GRACE_SECONDS', 2 * 60)
+# Don't ask about the same payment more often than this
+RECHECK_SECONDS = getattr(settings, 'RECONCILE_RECHECK_SECONDS', 10 * 60)
+# Orders older than this are not looked up any more
+WINDOW_SECONDS = getattr(settings, 'RECONCILE_WINDOW_SECONDS', 3 * 24 * 60 * 60)
+# Parallel gateway lookups per sweep (they are network bound)
+LOOKUP_WORKERS = getattr(settings, 'RECONCILE_LOOKUP_WORKERS', 8)
+
+
+def apply_gateway_payment(payment, gateway_payment):
+    """
+    Applies one payment attempt reported by the gateway ({'id', 'status'}).
+    Returns the new status if this changed the payment, else None.
+    """
+    status = gateway_payment['status']
+    if status == 'captured':
+        try:
+            changed = confirm_payment(payment, gateway_payment['id'])
+        except RoomUnavailableError:
+            # confirm_payment has refunded it, or another caller is doing so
+            logger.warning("Payment %s captured but room %s is no longer free; refunded.",
+                           payment.pk, payment.room_id)
+            payment.refresh_from_db(fields=['status'])
+            return 'REFUNDED' if payment.status == 'REFUNDED' else None
+        except GatewayError as e:
+            logger.error("Payment %s captured but room %s is no longer free, and the refund failed: %s",
+                         payment.pk, payment.room_id, e)
+            return None
+        return 'PAID' if changed else None
+    if status == 'failed':
+        return 'FAILED' if fail_payment(payment) else None
+    # created / authorized: nothing final yet
+    return None
+
+
+def retry_refund(payment, gateway_payments, gateway=None):
+    """
+    Finishes a refund left REFUNDING: its gateway call failed, or the process
+    died around it. If the gateway already lists the payment as refunded it
+    is only marked so, otherwise the refund is sent again.
+    Returns 'REFUNDED' if this completed it, else None.
+    """
+    refunded = any(
+        item['id'] == payment.razorpay_payment_id and item['status'] == 'refunded'
+        for item in gateway_payments
+    )
+    try:
+        changed = complete_refund(payment) if refunded else send_refund(payment, gateway)
+    except GatewayError as e:
+        logger.error("Retrying the refund of payment %s failed: %s", payment.pk, e)
+        return None
+    return 'REFUNDED' if changed else None
+
+
+# --- Webhook ---
+
+# Events that carry a payment entity we can act on
+HANDLED_EVENTS = ('payment.captured', 'payment.failed', 'order.paid')
+
+
+def handle_webhook_event(event):
+    """
+    Applies a (signature-checked) Razorpay webhook event.
+    Returns the new payment status, or None if nothing changed.
+    """
+    if event.get('event') not in HANDLED_EVENTS:
+        return None
+    entity = event.get('payload', {}).get('payment', {}).get('entity', {})
+    order_id = entity.get('order_id')
+    if not order_id or not entity.get('id'):
+        return None
+
+    payment = Payment.objects.filter(razorpay_order_id=order_id).first()
+    if payment is None:
+        logger.warning("Webhook %s for unknown order %s", event['event'], order_id)
+        return None
+
+    status = 'captured' if event['event'] == 'order.paid' else entity.get('status')
+    return apply_gateway_payment(payment, {'id': entity['id'], 'status': status})
+
+
+# --- Sweep ---
+
+def open_payments(now=None):
+    """
+    Payments that may still settle, or whose refund is still to be sent, and
+    are due for a gateway lookup. Pending refunds are retried however old.
+    """
+    now = now or timezone.now()
+    return Payment.objects.filter(
+        Q(status__in=('PENDING', 'EXPIRED'),
+          created_at__lte=now - timedelta(seconds=GRACE_SECONDS),
+          created_at__gte=now - timedelta(seconds=WINDOW_SECONDS))
+        | Q(status='REFUNDING'),
+        razorpay_order_id__isnull=False,
+    ).filter(
+        Q(reconciled_at__isnull=True) | Q(reconciled_at__lte=now - timedelta(seconds=RECHECK_SECONDS))
+    ).order_by('created_at')
+
+
+def _lookup(gateway, payment):
+    try:
+        return payment, gateway.fetch_order_payments(payment.razorpay_order_id), None
+    except GatewayError as e:
+        return payment, None, e
+
+
+def reconcile_batch(batch_size=200, gateway=None):
+    """
+    Looks up one batch of open payments at the gateway (in parallel) and
+    applies what it reports. Returns {'checked', 'paid', 'failed', 'refunded', 'errors'}.
+    """
+    gateway = gateway or get_gateway()
+    now = timezone.now()
+    payments = list(open_payments(now).select_related('user', 'room')[:batch_size])
+    stats = {'checked': 0, 'paid': 0, 'failed': 0, 'refunded': 0, 'errors': 0}
+    if not payments:
+        return stats
+
+    # Stamp first so a crashed sweep doesn't retry the same rows straight away
+    Payment.objects.filter(id__in=[payment.id for payment in payments]).update(reconciled_at=now)
+
+    with ThreadPoolExecutor(max_workers=LOOKUP_WORKERS) as pool:
+        results = list(pool.map(lambda payment: _lookup(gateway, payment), payments))
+
+    for payment, gateway_payments, error in results:
+        stats['checked'] += 1
+        if error is not None:
+            logger.warning("Reconciliation lookup failed for %s: %s", payment.pk, error)
+            stats['errors'] += 1
+            continue
+        if payment.status == 'REFUNDING':
+            if retry_refund(payment, gateway_payments, gateway):
+                stats['refunded'] += 1
+            continue
+        # A captured attempt wins over earlier failed ones on the same order
+        gateway_payments.sort(key=lambda item: item['status'] != 'captured')
+        for gateway_payment in gateway_payments:
+            new_status = apply_gateway_payment(payment, gateway_payment)
+            if new_status == 'PAID':
+                stats['paid'] += 1
+                break
+            if new_status == 'FAILED':
+                stats['failed'] += 1
+                break
+            if new_status == 'REFUNDED':
+                stats['refunded'] += 1
+                break
+    return stats
+
+
+def reconcile_all(batch_size=200, gateway=None):
+    """Sweeps until no open payment is due. Returns the summed stats."""
+    totals = {'checked': 0, 'paid': 0, 'failed': 0, 'refunded': 0, 'errors': 0}
+    while True:
+        stats = reconcile_batch(batch_size, gateway)
+        for key in totals:
+            totals[key] += stats[key]
+        if stats['checked'] < batch_size:
+            return totals
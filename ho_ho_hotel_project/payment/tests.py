@@ -1,3 +1,485 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ho_ho_hotel_app.models import Room
+from login_app.models import CustomUser, Hotel
+
+from . import checkout, reconcile
+from .booking import RoomUnavailableError, create_booking, filter_available, is_room_available
+from .gateway import FakeGateway, GatewayError
+from .models import Booking, Payment, RoomNight
+from .reconcile import open_payments, reconcile_batch
+from .transitions import can_transition, complete_refund, confirm_payment, fail_payment, refund_payment
+
+THREADS = 8
+
+
+def make_room():
+    owner = CustomUser.objects.create_user(username='owner', password='pw', is_hotel_owner=True)
+    hotel = Hotel.objects.create(
+        owner=owner, hotel_name='Sea View', place='Goa', address='1 Beach Road',
+        license_number='LIC000001', ownership_proof='x.pdf', owner_id_proof='y.pdf',
+    )
+    return Room.objects.create(
+        hotel=hotel, room_number='101', room_type='Deluxe Suite', price_per_night=Decimal('2500.00'),
+    )
+
+
+def writers_wait_for_each_other():
+    """
+    MySQL/PostgreSQL block on the row lock. SQLite has no row locks and only
+    queues concurrent writers with OPTIONS={'transaction_mode': 'IMMEDIATE'};
+    otherwise they fail straight away with 'database is locked'.
+    """
+    if connection.features.has_select_for_update:
+        return True
+    return connection.settings_dict.get('OPTIONS', {}).get('transaction_mode') == 'IMMEDIATE'
+
+
+@skipUnless(writers_wait_for_each_other(), "the database doesn't queue concurrent writers")
+@override_settings(PAYMENT_GATEWAY='payment.gateway.FakeGateway')
+class ConcurrentVerificationTests(TransactionTestCase):
+    """
+    Fires payment verifications at the same time, the way the browser callback,
+    the webhook and the reconciliation sweep can, and checks that the stay is
+    booked exactly once.
+    """
+
+    def setUp(self):
+        FakeGateway.orders.clear()
+        FakeGateway.refunds.clear()
+        self.room = make_room()
+        self.check_in = timezone.localdate() + timedelta(days=7)
+        self.check_out = self.check_in + timedelta(days=3)
+
+    def make_payment(self, username):
+        user = CustomUser.objects.create_user(username=username, password='pw')
+        order = FakeGateway().create_order(Decimal('7500.00'))
+        payment = Payment.objects.create(
+            user=user, room=self.room, amount=Decimal('7500.00'),
+            check_in=self.check_in, check_out=self.check_out,
+            razorpay_order_id=order['id'], status='PENDING',
+        )
+        return payment, FakeGateway.add_payment(order['id'])
+
+    def run_concurrently(self, calls):
+        """Runs every (payment_pk, gateway_payment_id) through confirm_payment at once."""
+        barrier = threading.Barrier(len(calls))
+        results = []
+        lock = threading.Lock()
+
+        def verify(payment_pk, gateway_payment_id):
+            try:
+                payment = Payment.objects.get(pk=payment_pk)
+                barrier.wait()
+                try:
+                    outcome = confirm_payment(payment, gateway_payment_id)
+                except RoomUnavailableError:
+                    outcome = 'unavailable'
+                except Exception as e:
+                    outcome = e
+                with lock:
+                    results.append(outcome)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=verify, args=call) for call in calls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        self.assertEqual(errors, [])
+        return results
+
+    def assert_booked_once(self):
+        nights = (self.check_out - self.check_in).days
+        self.assertEqual(Booking.objects.filter(status='CONFIRMED').count(), 1)
+        self.assertEqual(RoomNight.objects.filter(room=self.room).count(), nights)
+        self.assertEqual(Payment.objects.filter(status='PAID').count(), 1)
+
+    def test_same_payment_verified_in_parallel(self):
+        payment, gateway_payment_id = self.make_payment('guest')
+
+        results = self.run_concurrently([(payment.pk, gateway_payment_id)] * THREADS)
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(results.count(False), THREADS - 1)
+        self.assert_booked_once()
+        self.assertEqual(FakeGateway.refunds, {})
+
+    def test_competing_payments_for_the_same_stay(self):
+        calls = []
+        for i in range(THREADS):
+            payment, gateway_payment_id = self.make_payment(f"guest{i}")
+            calls.append((payment.pk, gateway_payment_id))
+
+        results = self.run_concurrently(calls)
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(results.count('unavailable'), THREADS - 1)
+        self.assert_booked_once()
+        # Everyone who lost the room got their money back
+        self.assertEqual(Payment.objects.filter(status='REFUNDED').count(), THREADS - 1)
+        self.assertEqual(len(FakeGateway.refunds), THREADS - 1)
+
+
+class BookingTests(TestCase):
+    """Night-by-night inventory: one RoomNight per booked night, unique per room."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.room = make_room()
+        cls.other_room = Room.objects.create(
+            hotel=cls.room.hotel, room_number='102', room_type='Deluxe Suite', price_per_night=Decimal('2500.00'),
+        )
+        cls.user = CustomUser.objects.create_user(username='guest', password='pw')
+        cls.day = timezone.localdate() + timedelta(days=7)
+
+    def setUp(self):
+        # Cached result pages (bookings only invalidate them on commit)
+        cache.clear()
+
+    def stay(self, first, nights):
+        return self.day + timedelta(days=first), self.day + timedelta(days=first + nights)
+
+    def test_overlapping_stay_is_rejected(self):
+        create_booking(self.user, self.room, *self.stay(0, 3))
+        with self.assertRaises(RoomUnavailableError):
+            create_booking(self.user, self.room, *self.stay(2, 2))
+        # Nothing of the rejected stay is left behind
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(RoomNight.objects.count(), 3)
+        # Another room is free
+        create_booking(self.user, self.other_room, *self.stay(2, 2))
+
+    def test_check_out_day_is_not_booked(self):
+        booking = create_booking(self.user, self.room, *self.stay(0, 2))
+        self.assertEqual(list(booking.nights.values_list('date', flat=True)), [self.day, self.day + timedelta(days=1)])
+        # The next guest can check in the day this one leaves
+        create_booking(self.user, self.room, *self.stay(2, 1))
+        self.assertFalse(is_room_available(self.room, *self.stay(1, 2)))
+        self.assertTrue(is_room_available(self.room, *self.stay(3, 2)))
+
+    def test_race_is_decided_by_the_unique_night(self):
+        # Both callers checked availability before either booked
+        self.assertTrue(is_room_available(self.room, *self.stay(0, 2)))
+        create_booking(self.user, self.room, *self.stay(1, 1))
+        with self.assertRaises(RoomUnavailableError):
+            create_booking(self.user, self.room, *self.stay(0, 2))
+        self.assertEqual(RoomNight.objects.count(), 1)
+
+    def test_date_search_skips_booked_rooms(self):
+        create_booking(self.user, self.room, *self.stay(1, 1))
+        self.assertEqual(list(filter_available(Room.objects.all(), *self.stay(0, 3))), [self.other_room])
+        self.assertEqual(set(filter_available(Room.objects.all(), *self.stay(2, 3))), {self.room, self.other_room})
+
+        check_in, check_out = self.stay(0, 3)
+        response = self.client.get(reverse('room_results'), {'check_in': check_in, 'check_out': check_out})
+        self.assertEqual(list(response.context['rooms']), [self.other_room])
+
+
+@override_settings(PAYMENT_GATEWAY='payment.gateway.FakeGateway')
+class TransitionTests(TestCase):
+    """The state machine one caller at a time, on any database."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.room = make_room()
+        cls.user = CustomUser.objects.create_user(username='guest', password='pw')
+        cls.check_in = timezone.localdate() + timedelta(days=7)
+
+    def setUp(self):
+        FakeGateway.orders.clear()
+        FakeGateway.refunds.clear()
+        self.payment = self.make_payment()
+        self.gateway_payment_id = FakeGateway.add_payment(self.payment.razorpay_order_id)
+
+    def make_payment(self, status='PENDING'):
+        return Payment.objects.create(
+            user=self.user, room=self.room, amount=Decimal('5000.00'), status=status,
+            razorpay_order_id=FakeGateway().create_order(Decimal('5000.00'))['id'],
+            check_in=self.check_in, check_out=self.check_in + timedelta(days=2),
+        )
+
+    def test_confirm_books_the_stay(self):
+        self.assertTrue(confirm_payment(self.payment, self.gateway_payment_id))
+        self.assertEqual(self.payment.status, 'PAID')
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.razorpay_payment_id), ('PAID', self.gateway_payment_id))
+        booking = Booking.objects.get(payment=self.payment)
+        self.assertEqual(booking.nights.count(), 2)
+
+        self.assertFalse(confirm_payment(self.payment, self.gateway_payment_id))
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_refund_of_a_paid_payment(self):
+        confirm_payment(self.payment, self.gateway_payment_id)
+        self.assertTrue(refund_payment(self.payment))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'REFUNDED')
+        self.assertEqual(FakeGateway.refunds, {self.gateway_payment_id: 500000})
+        self.assertEqual(Booking.objects.get().status, 'CANCELLED')
+        self.assertFalse(RoomNight.objects.exists())
+
+        # REFUNDED is final
+        self.assertFalse(refund_payment(self.payment))
+        self.assertFalse(confirm_payment(self.payment, self.gateway_payment_id))
+        self.assertEqual(len(FakeGateway.refunds), 1)
+
+    def test_illegal_transitions_are_rejected(self):
+        self.assertFalse(can_transition('PAID', 'FAILED'))
+        self.assertFalse(can_transition('REFUNDING', 'PAID'))
+        self.assertFalse(can_transition('REFUNDED', 'REFUNDING'))
+
+        # Nothing captured: nothing to refund, and no refund to complete
+        self.assertFalse(refund_payment(self.payment))
+        self.assertFalse(complete_refund(self.payment))
+        confirm_payment(self.payment, self.gateway_payment_id)
+        self.assertFalse(fail_payment(self.payment))
+        self.assertFalse(complete_refund(self.payment))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'PAID')
+
+    def test_taken_room_is_refunded(self):
+        other = self.make_payment()
+        confirm_payment(other, FakeGateway.add_payment(other.razorpay_order_id))
+
+        with self.assertRaises(RoomUnavailableError):
+            confirm_payment(self.payment, self.gateway_payment_id)
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.razorpay_payment_id), ('REFUNDED', self.gateway_payment_id))
+        self.assertEqual(FakeGateway.refunds, {self.gateway_payment_id: 500000})
+        self.assertEqual(list(Booking.objects.values_list('payment', flat=True)), [other.pk])
+
+
+@override_settings(PAYMENT_GATEWAY='payment.gateway.FakeGateway')
+class RefundTests(TestCase):
+    """A refund whose gateway call fails is left REFUNDING and finished by the sweep."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.room = make_room()
+        cls.user = CustomUser.objects.create_user(username='guest', password='pw')
+
+    def setUp(self):
+        FakeGateway.orders.clear()
+        FakeGateway.refunds.clear()
+        order = FakeGateway().create_order(Decimal('2500.00'))
+        self.gateway_payment_id = FakeGateway.add_payment(order['id'])
+        self.payment = Payment.objects.create(
+            user=self.user, room=self.room, amount=Decimal('2500.00'),
+            razorpay_order_id=order['id'], status='PENDING',
+        )
+
+    def test_failed_refund_is_retried_by_the_sweep(self):
+        with mock.patch.object(FakeGateway, 'refund_payment', side_effect=GatewayError("timed out")) as refund:
+            with self.assertRaises(GatewayError):
+                refund_payment(self.payment, self.gateway_payment_id)
+            self.payment.refresh_from_db()
+            self.assertEqual(self.payment.status, 'REFUNDING')
+            self.assertEqual(self.payment.razorpay_payment_id, self.gateway_payment_id)
+
+            # Whoever comes second (webhook, browser callback) leaves it alone
+            self.assertFalse(refund_payment(self.payment, self.gateway_payment_id))
+            self.assertEqual(refund.call_count, 1)
+
+            # The sweep keeps coming back while the gateway is down
+            self.assertIn(self.payment, open_payments())
+            self.assertEqual(reconcile_batch()['refunded'], 0)
+            self.payment.refresh_from_db()
+            self.assertEqual(self.payment.status, 'REFUNDING')
+
+        Payment.objects.update(reconciled_at=None)
+        self.assertEqual(reconcile_batch()['refunded'], 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'REFUNDED')
+        self.assertEqual(FakeGateway.refunds, {self.gateway_payment_id: 250000})
+        self.assertNotIn(self.payment, open_payments())
+
+    def test_refund_sent_but_not_recorded(self):
+        # The gateway took the refund, then the process died before marking it
+        Payment.objects.filter(pk=self.payment.pk).update(
+            status='REFUNDING', razorpay_payment_id=self.gateway_payment_id,
+        )
+        FakeGateway().refund_payment(self.gateway_payment_id, self.payment.amount)
+
+        self.assertEqual(reconcile_batch(), {'checked': 1, 'paid': 0, 'failed': 0, 'refunded': 1, 'errors': 0})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'REFUNDED')
+
+
+@override_settings(PAYMENT_GATEWAY='payment.gateway.FakeGateway')
+class SettlementTests(TestCase):
+    """Payments whose browser callback never came, settled by the webhook or the sweep."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.room = make_room()
+        cls.user = CustomUser.objects.create_user(username='guest', password='pw')
+
+    def setUp(self):
+        FakeGateway.orders.clear()
+        FakeGateway.refunds.clear()
+        self.order_id = FakeGateway().create_order(Decimal('5000.00'))['id']
+        check_in = timezone.localdate() + timedelta(days=7)
+        self.payment = Payment.objects.create(
+            user=self.user, room=self.room, amount=Decimal('5000.00'), razorpay_order_id=self.order_id,
+            status='PENDING', check_in=check_in, check_out=check_in + timedelta(days=2),
+        )
+
+    def event(self, event, gateway_payment_id, status='captured'):
+        return json.dumps({'event': event, 'payload': {'payment': {'entity': {
+            'id': gateway_payment_id, 'order_id': self.order_id, 'status': status,
+        }}}})
+
+    def deliver(self, body, signature=None):
+        return self.client.post(
+            reverse('razorpay_webhook'), body, content_type='application/json',
+            HTTP_X_RAZORPAY_SIGNATURE=FakeGateway.sign(body) if signature is None else signature,
+        )
+
+    def test_webhook_signature_is_checked(self):
+        body = self.event('payment.captured', FakeGateway.add_payment(self.order_id))
+        self.assertEqual(self.deliver(body, signature='forged').status_code, 400)
+        self.assertEqual(self.deliver(body, signature='').status_code, 400)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'PENDING')
+        self.assertFalse(Booking.objects.exists())
+
+    def test_redelivered_webhook_changes_nothing(self):
+        gateway_payment_id = FakeGateway.add_payment(self.order_id)
+        body = self.event('payment.captured', gateway_payment_id)
+        self.assertEqual(self.deliver(body).json(), {'status': 'success', 'payment_status': 'PAID'})
+
+        # Razorpay retries, and order.paid follows payment.captured
+        for body in (body, self.event('order.paid', gateway_payment_id)):
+            self.assertEqual(self.deliver(body).json(), {'status': 'success', 'payment_status': None})
+
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.razorpay_payment_id), ('PAID', gateway_payment_id))
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(RoomNight.objects.count(), 2)
+
+    def test_sweep_settles_a_captured_order(self):
+        FakeGateway.add_payment(self.order_id, 'failed')
+        gateway_payment_id = FakeGateway.add_payment(self.order_id, 'captured')
+        # Too fresh: left to the browser callback
+        self.assertEqual(reconcile_batch()['checked'], 0)
+
+        Payment.objects.filter(pk=self.payment.pk).update(
+            created_at=timezone.now() - timedelta(seconds=reconcile.GRACE_SECONDS + 1),
+        )
+        self.assertEqual(reconcile_batch(), {'checked': 1, 'paid': 1, 'failed': 0, 'refunded': 0, 'errors': 0})
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.razorpay_payment_id), ('PAID', gateway_payment_id))
+        self.assertEqual(Booking.objects.get().payment, self.payment)
+        self.assertNotIn(self.payment, open_payments())
+
+
+class CheckoutOrderTests(TestCase):
+    """get_or_create_order(): one gateway order per checkout, however often it is loaded."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.room = make_room()
+        cls.user = CustomUser.objects.create_user(username='guest', password='pw')
+        cls.check_in = timezone.localdate() + timedelta(days=7)
+        cls.check_out = cls.check_in + timedelta(days=2)
+
+    def setUp(self):
+        FakeGateway.orders.clear()
+        self.create_order = mock.Mock(side_effect=FakeGateway().create_order)
+
+    def checkout(self, amount=Decimal('5000.00')):
+        return checkout.get_or_create_order(
+            self.user, self.room, self.check_in, self.check_out, amount, self.create_order,
+        )
+
+    def test_reload_reuses_the_order(self):
+        payment, created = self.checkout()
+        self.assertTrue(created)
+        self.assertTrue(payment.razorpay_order_id)
+        self.assertEqual(self.checkout(), (payment, False))
+        self.assertEqual(self.create_order.call_count, 1)
+        self.assertEqual(Payment.objects.get().razorpay_order_id, payment.razorpay_order_id)
+
+    def test_price_change_or_expiry_makes_a_new_order(self):
+        first, _ = self.checkout()
+        second, created = self.checkout(Decimal('6000.00'))
+        self.assertTrue(created)
+        self.assertNotEqual(second.razorpay_order_id, first.razorpay_order_id)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.checkout_key), ('EXPIRED', None))
+
+        Payment.objects.filter(pk=second.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        before = timezone.now()
+        self.assertEqual(checkout.expire_stale_orders(), 1)
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'EXPIRED')
+        self.assertGreaterEqual(second.updated_at, before)
+        self.assertTrue(self.checkout(Decimal('6000.00'))[1])
+        self.assertEqual(self.create_order.call_count, 3)
+
+    def claim(self, **fields):
+        """A claim inserted by a concurrent request that hasn't got its gateway order yet."""
+        return Payment.objects.create(
+            user=self.user, room=self.room, amount=Decimal('5000.00'), status='PENDING',
+            check_in=self.check_in, check_out=self.check_out,
+            checkout_key=checkout.checkout_key(self.user, self.room, self.check_in, self.check_out),
+            expires_at=timezone.now() + timedelta(minutes=15), **fields,
+        )
+
+    def test_double_click_waits_for_the_first_order(self):
+        winner = self.claim()
+
+        def winner_finishes(seconds):
+            Payment.objects.filter(pk=winner.pk).update(razorpay_order_id='order_winner')
+
+        with mock.patch.object(checkout.time, 'sleep', side_effect=winner_finishes):
+            payment, created = self.checkout()
+        self.assertEqual((payment.pk, payment.razorpay_order_id, created), (winner.pk, 'order_winner', False))
+        self.create_order.assert_not_called()
+
+    def test_lost_claim_race_waits_too(self):
+        winners = []
+
+        def concurrent_claim(queryset):
+            # The other request inserts between our lookup and our insert
+            winners.append(self.claim(razorpay_order_id='order_winner'))
+            return 0
+
+        with mock.patch.object(checkout, 'release', side_effect=concurrent_claim):
+            payment, created = self.checkout()
+        self.assertEqual((payment.pk, created), (winners[0].pk, False))
+        self.create_order.assert_not_called()
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_failed_gateway_call_frees_the_checkout(self):
+        self.create_order.side_effect = GatewayError("timed out")
+        with self.assertRaises(GatewayError):
+            self.checkout()
+        self.assertEqual(Payment.objects.get().status, 'EXPIRED')
+
+        self.create_order.side_effect = FakeGateway().create_order
+        self.assertTrue(self.checkout()[1])
+
+    def test_abandoned_claim_is_taken_over(self):
+        stale = self.claim()
+        Payment.objects.filter(pk=stale.pk).update(
+            updated_at=timezone.now() - timedelta(seconds=checkout.ORDER_WAIT_SECONDS + 1),
+        )
+        payment, created = self.checkout()
+        self.assertTrue(created)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'EXPIRED')
@@ -0,0 +1,162 @@
+"""
+The payment state machine.
+
+    PENDING   -> PAID | FAILED | EXPIRED | REFUNDING
+    EXPIRED   -> PAID | REFUNDING     (paid after we stopped reusing the order)
+    FAILED    -> PAID | REFUNDING     (a retry in the Razorpay modal succeeded)
+    PAID      -> REFUNDING
+    REFUNDING -> REFUNDED             (the gateway accepted the refund)
+    REFUNDED is final.
+
+The browser callback, the Razorpay webhook and the reconciliation sweep may
+all report the same payment, concurrently and more than once. Each transition
+therefore locks the payment row (select_for_update) and writes with a
+conditional UPDATE ... WHERE status=<the status it read>, and confirming a
+payment books its nights in the same transaction: either both happen or
+neither does, and only one caller ever gets to do them.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .booking import RoomUnavailableError, cancel_booking, create_booking
+from .gateway import get_gateway
+from .models import Payment
+
+TRANSITIONS = {
+    'PENDING': ('PAID', 'FAILED', 'EXPIRED', 'REFUNDING'),
+    'EXPIRED': ('PAID', 'REFUNDING'),
+    'FAILED': ('PAID', 'REFUNDING'),
+    'PAID': ('REFUNDING',),
+    'REFUNDING': ('REFUNDED',),
+    'REFUNDED': (),
+}
+
+
+def can_transition(old_status, new_status):
+    return new_status in TRANSITIONS.get(old_status, ())
+
+
+def _lock(payment):
+    """Re-reads the payment under a row lock. Must run inside transaction.atomic()."""
+    return Payment.objects.select_for_update().select_related('room', 'user').get(pk=payment.pk)
+
+
+def _move(locked, new_status, **fields):
+    """
+    Conditional UPDATE from the status `locked` was read with. Returns False if
+    the move isn't allowed or someone else moved the payment first (possible on
+    databases without row locks, e.g. SQLite).
+    """
+    if not can_transition(locked.status, new_status):
+        return False
+    fields.update(status=new_status, checkout_key=None, updated_at=timezone.now())
+    updated = Payment.objects.filter(pk=locked.pk, status=locked.status).update(**fields)
+    if updated:
+        for name, value in fields.items():
+            setattr(locked, name, value)
+    return bool(updated)
+
+
+def _sync(payment, locked):
+    # Callers keep using the instance they passed in
+    for name in ('status', 'razorpay_payment_id', 'razorpay_signature', 'checkout_key', 'updated_at'):
+        setattr(payment, name, getattr(locked, name))
+
+
+def confirm_payment(payment, razorpay_payment_id, razorpay_signature=None):
+    """
+    Marks the payment PAID and books its nights, atomically.
+    Returns False if it was already settled (nothing is done).
+
+    If the nights were taken by another booking in the meantime, the captured
+    amount is refunded (see refund_payment) and RoomUnavailableError is raised.
+    """
+    with transaction.atomic():
+        locked = _lock(payment)
+        if not can_transition(locked.status, 'PAID'):
+            return False
+
+        # Older payments have no dates stored, treat them as one night from the payment date
+        check_in = locked.check_in or timezone.localdate(locked.created_at)
+        check_out = locked.check_out or check_in + timedelta(days=1)
+        try:
+            create_booking(locked.user, locked.room, check_in, check_out, payment=locked)
+        except RoomUnavailableError:
+            booked = False
+        else:
+            booked = True
+            if not _move(locked, 'PAID', razorpay_payment_id=razorpay_payment_id,
+                         razorpay_signature=razorpay_signature):
+                # Lost a race we couldn't lock against: undo our booking too
+                transaction.set_rollback(True)
+                return False
+
+    if booked:
+        _sync(payment, locked)
+        return True
+
+    # Outside the transaction: no row lock is held during the gateway call
+    refund_payment(payment, razorpay_payment_id)
+    raise RoomUnavailableError(
+        f"Room {locked.room.room_number} was booked by someone else; payment {payment.pk} was refunded."
+    )
+
+
+def fail_payment(payment):
+    """Marks a PENDING payment FAILED. Returns False if it wasn't PENDING any more."""
+    with transaction.atomic():
+        locked = _lock(payment)
+        if locked.status != 'PENDING' or not _move(locked, 'FAILED'):
+            return False
+    _sync(payment, locked)
+    return True
+
+
+def refund_payment(payment, razorpay_payment_id=None, gateway=None):
+    """
+    Refunds the captured amount at the gateway, then marks the payment
+    REFUNDED and releases its booking's nights. Returns False if the payment
+    can't be refunded (already refunded or being refunded, or nothing was
+    captured).
+
+    The payment is moved to REFUNDING under the row lock before the gateway
+    is called, so when the webhook and the browser callback both get here only
+    one of them sends the refund. Raises GatewayError if the refund call
+    fails; the payment stays REFUNDING and the reconciliation sweep retries it.
+    """
+    razorpay_payment_id = razorpay_payment_id or payment.razorpay_payment_id
+    if not razorpay_payment_id:
+        return False
+    with transaction.atomic():
+        locked = _lock(payment)
+        if not _move(locked, 'REFUNDING', razorpay_payment_id=razorpay_payment_id):
+            return False
+    _sync(payment, locked)
+    return send_refund(payment, gateway)
+
+
+def send_refund(payment, gateway=None):
+    """
+    Sends the refund of a REFUNDING payment to the gateway and completes it.
+    Raises GatewayError if the refund call fails (nothing is changed).
+    """
+    (gateway or get_gateway()).refund_payment(payment.razorpay_payment_id, payment.amount)
+    return complete_refund(payment)
+
+
+def complete_refund(payment):
+    """
+    Marks a REFUNDING payment REFUNDED, once the gateway has taken the refund,
+    and releases its booking's nights. Returns False if it wasn't REFUNDING.
+    """
+    with transaction.atomic():
+        locked = _lock(payment)
+        if not _move(locked, 'REFUNDED'):
+            return False
+        booking = getattr(locked, 'booking', None)
+        if booking is not None and booking.status == 'CONFIRMED':
+            cancel_booking(booking)
+    _sync(payment, locked)
+    return True
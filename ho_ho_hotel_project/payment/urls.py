@@ -8,4 +8,6 @@ urlpatterns = [
     path('checkout/<uuid:room_id>/', views.CreateOrderView.as_view(), name='checkout_room'),
     path('orders/', views.UserOrderView.as_view(), name='user_orders'),
     path('verify/', views.PaymentVerifyView.as_view(), name='payment_verify'),
+    # Configure this URL (and RZP_WEBHOOK_SECRET) in the Razorpay dashboard
+    path('webhooks/razorpay/', views.RazorpayWebhookView.as_view(), name='razorpay_webhook'),
 ]
\ No newline at end of file
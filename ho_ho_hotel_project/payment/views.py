@@ -8,60 +8,75 @@ from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView
-import razorpay
 import uuid
 import json
 from ho_ho_hotel_app.models import Room 
+from ho_ho_hotel_app.pagination import CursorPaginationMixin
 from .models import Payment
+from .booking import RoomUnavailableError, is_room_available, parse_stay
+from .checkout import get_or_create_order
+from .gateway import GatewayError, get_gateway
+from .reconcile import handle_webhook_event
+from .transitions import confirm_payment, fail_payment
+from django.utils import timezone
+from datetime import timedelta
 
-# Initialize Razorpay Client
-# Assuming settings.RZP_KEY_ID and settings.RZP_KEY_SECRET are set
-try:
-    client = razorpay.Client(auth=(settings.RZP_KEY_ID, settings.RZP_KEY_SECRET))
-except AttributeError:
-    client = None
-    print("WARNING: Razorpay client failed to initialize. Check RZP_KEY_ID/SECRET in settings.")
+
+def payment_gateway():
+    # Razorpay by default, see settings.PAYMENT_GATEWAY
+    try:
+        return get_gateway()
+    except GatewayError as e:
+        print(f"WARNING: {e}. Check RZP_KEY_ID/SECRET in settings.")
+        return None
 
 
 class CreateOrderView(LoginRequiredMixin, View):
     """
     1. Fetches room details.
-    2. Creates a Razorpay Order ID.
-    3. Creates a local Payment object with PENDING status.
+    2. Creates a Razorpay Order ID, unless this checkout already has a live one.
+    3. Creates a local Payment object with PENDING status (or reuses it).
     4. Renders the checkout page with necessary Razorpay keys and order details.
     """
     def get(self, request, room_id):
-        if not client:
+        gateway = payment_gateway()
+        if not gateway:
             messages.error(request, "Payment service is currently unavailable.")
             return redirect('home')
 
         # Use an outer try-except block to catch all errors during order creation
         try:
-            # 1. Fetch Room and Calculate Amount
-            room = get_object_or_404(Room, id=room_id)
-            amount_in_cents = int(room.price_per_night * 100) 
+            # 1. Fetch Room, check the stay is free and Calculate Amount
+            room = get_object_or_404(Room.objects.select_related('hotel'), id=room_id)
 
-            # 2. Create Order in Razorpay
-            razorpay_order = client.order.create({
-                'amount': amount_in_cents, 
-                'currency': 'INR',
-                'payment_capture': '1' 
-            })
-            
-            # 3. Create local PENDING Payment record
-            payment = Payment.objects.create(
-                user=request.user,
-                room=room,
-                amount=room.price_per_night,
-                razorpay_order_id=razorpay_order['id'],
-                status='PENDING'
+            try:
+                check_in, check_out = parse_stay(request.GET)
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect(reverse('room_detail', kwargs={'pk': room_id}))
+
+            if not room.is_available or not is_room_available(room, check_in, check_out):
+                messages.error(request, "This room is not available for the selected dates.")
+                return redirect(reverse('room_detail', kwargs={'pk': room_id}))
+
+            nights = (check_out - check_in).days
+            total_amount = room.price_per_night * nights
+            amount_in_cents = int(total_amount * 100) 
+
+            # 2./3. Reuse the live PENDING order for this exact checkout (a reload),
+            # or create the Razorpay order and the local PENDING Payment record
+            payment, created = get_or_create_order(
+                request.user, room, check_in, check_out, total_amount, gateway.create_order,
             )
 
             context = {
                 'room': room,
                 'razorpay_key': settings.RZP_KEY_ID,
-                'order_id': razorpay_order['id'],
-                'amount': room.price_per_night,
+                'order_id': payment.razorpay_order_id,
+                'amount': total_amount,
+                'check_in': check_in,
+                'check_out': check_out,
+                'nights': nights,
                 'amount_in_cents': amount_in_cents,
                 'currency': 'INR',
                 'payment_object_id': payment.id # Pass local ID for verification lookup
@@ -93,9 +108,12 @@ class PaymentVerifyView(View):
     """
     Handles the callback from the Razorpay checkout modal.
     Verifies the signature and updates the payment status.
+    If this callback never arrives, the webhook or the reconciliation
+    sweep settles the payment instead (see reconcile.py).
     """
     def post(self, request):
-        if not client:
+        gateway = payment_gateway()
+        if not gateway:
             messages.error(request, "Payment service is currently unavailable.")
             return redirect('home')
             
@@ -143,50 +161,73 @@ class PaymentVerifyView(View):
 
             # --- CANCELLATION/FAILURE CHECK ---
             if not razorpay_payment_id or not razorpay_signature:
-                payment.status = 'FAILED'
-                payment.save()
+                fail_payment(payment)
                 messages.warning(request, "Payment was cancelled or interrupted by the user.")
                 return redirect(redirect_url)
 
             
-            # 3. Verify the payment signature
-            params_dict = {
-                'razorpay_order_id': razorpay_order_id,
-                'razorpay_payment_id': razorpay_payment_id,
-                'razorpay_signature': razorpay_signature
-            }
-            
+            # 3. Verify the payment signature (a local HMAC check, no gateway round trip)
+            if not gateway.verify_payment_signature(razorpay_order_id, razorpay_payment_id, razorpay_signature):
+                # 5. Signature is invalid or verification failed
+                fail_payment(payment)
+                messages.error(request, f"Payment verification failed due to signature mismatch.")
+                return redirect(redirect_url)
+
+            # 4. Signature is valid -> Mark payment as PAID and reserve the nights.
+            # A no-op if the webhook already did it.
             try:
-                client.utility.verify_payment_signature(params_dict)
-                
-                # 4. Signature is valid -> Mark payment as PAID
-                payment.razorpay_payment_id = razorpay_payment_id
-                payment.razorpay_signature = razorpay_signature
-                payment.status = 'PAID'
-                payment.save()
-                room = payment.room
-                room.is_available = False
-                room.save()
-                
-                # 🌟 IMPORTANT: Integrate your booking/reservation logic here later 🌟
-                
-                messages.success(request, f"Payment for Room {payment.room.room_number} successful! Your booking is confirmed.")
+                if not confirm_payment(payment, razorpay_payment_id, razorpay_signature):
+                    payment.refresh_from_db(fields=['status'])
+            except RoomUnavailableError:
+                # Refunded, by us or by the webhook (which may still be at it)
+                payment.refresh_from_db(fields=['status'])
+            except GatewayError:
+                # The refund call failed; the reconciliation sweep retries it
+                payment.status = 'REFUNDING'
+
+            if payment.status == 'REFUNDING':
+                messages.error(request, "Your payment was received, but the room was booked for these dates in the meantime. Your refund will be processed shortly.")
                 return redirect(redirect_url)
 
-            except Exception as e:
-                # 5. Signature is invalid or verification failed
-                payment.status = 'FAILED'
-                payment.save()
-                messages.error(request, f"Payment verification failed due to signature mismatch.")
+            if payment.status == 'REFUNDED':
+                messages.error(request, "Your payment was received, but the room was booked for these dates in the meantime. The payment has been refunded.")
                 return redirect(redirect_url)
 
+            messages.success(request, f"Payment for Room {payment.room.room_number} successful! Your booking is confirmed.")
+            return redirect(redirect_url)
+
         except Exception as e:
             # General unexpected error
             print(f"CRITICAL ERROR IN PAYMENT VERIFICATION: {e}")
             messages.error(request, "An internal error occurred during payment processing.")
             return HttpResponseBadRequest("Verification Error")
         
-class UserOrderView(LoginRequiredMixin, ListView):
+@method_decorator(csrf_exempt, name='dispatch')
+class RazorpayWebhookView(View):
+    """
+    Receives Razorpay webhooks (payment.captured, payment.failed, order.paid).
+    The body must be signed with RZP_WEBHOOK_SECRET. Razorpay retries
+    anything but a 2xx, and may deliver an event more than once; applying
+    the same event twice changes nothing.
+    """
+    def post(self, request):
+        gateway = payment_gateway()
+        if not gateway:
+            return JsonResponse({'status': 'error', 'message': 'Payment service unavailable.'}, status=503)
+
+        signature = request.headers.get('X-Razorpay-Signature', '')
+        if not gateway.verify_webhook_signature(request.body, signature):
+            return JsonResponse({'status': 'error', 'message': 'Invalid signature.'}, status=400)
+
+        try:
+            event = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({'status': 'error', 'message': 'Invalid JSON.'}, status=400)
+
+        new_status = handle_webhook_event(event)
+        return JsonResponse({'status': 'success', 'payment_status': new_status})
+
+class UserOrderView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     """
     Displays a list of all successful room bookings (PAID payments) 
     made by the currently logged-in user.
@@ -195,6 +236,10 @@ class UserOrderView(LoginRequiredMixin, ListView):
     template_name = 'payment/user_orders.html' # We will create this template
     context_object_name = 'orders'
     paginate_by = 10 # Optional: for handling many orders
+    # Newest first; keyset pagination keeps deep pages as cheap as the first
+    cursor_ordering = ('-created_at', '-pk')
+    # Read-only: served from a replica (see ho_ho_hotel_app/db_routing.py)
+    use_read_replica = True
 
     def get_queryset(self):
         # Filter the Payment objects: